@@ -0,0 +1,231 @@
+"""Background alert evaluation for scored pipeline data
+
+Scored series are handed to an ``AlertEngine`` through a queue and evaluated
+on a worker thread, so page rendering never waits on alerting. Episodes are
+found with hysteresis (a level is entered above its threshold and only left
+once the score falls ``clear_margin`` below it) and a minimum duration, then
+deduplicated against the last ``MAX_RAISED_PER_WELL`` episodes raised for the
+well before being sent to the configured sinks.
+
+The engine is shared by every session, and two users may well name their
+datasets the same, so episodes and recent alerts are kept per owner (the
+verified email, or the session for anonymous visitors) and dataset name.
+
+Sinks are configured with environment variables:
+
+    HYDRATE_ALERT_FILE     append alerts as JSON lines to this file
+    HYDRATE_ALERT_WEBHOOK  POST alerts as JSON to this URL
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+WARNING_THRESHOLD = 5.0
+CRITICAL_THRESHOLD = 7.0
+LEVELS = ("WARNING", "CRITICAL")
+
+# Episodes remembered per well for deduplication; the oldest are forgotten first
+MAX_RAISED_PER_WELL = 500
+
+logger = logging.getLogger(__name__)
+
+
+def hysteresis_state(scores, enter, leave):
+    """Vectorized on/off state: on above `enter`, off again only below `leave`"""
+    positions = np.arange(len(scores))
+    last_enter = np.maximum.accumulate(np.where(scores > enter, positions, -1))
+    last_leave = np.maximum.accumulate(np.where(scores < leave, positions, -1))
+    return last_enter > last_leave
+
+
+def _runs(state):
+    """Start (inclusive) and end (exclusive) indices of True runs"""
+    edges = np.diff(state.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _long_runs(state, min_points):
+    starts, ends = _runs(state)
+    keep = (ends - starts) >= min_points
+    mask = np.zeros(len(state), dtype=bool)
+    for start, end in zip(starts[keep], ends[keep]):
+        mask[start:end] = True
+    return mask
+
+
+def find_risk_episodes(scores, times=None, warning=WARNING_THRESHOLD, critical=CRITICAL_THRESHOLD,
+                       clear_margin=0.5, min_points=3, min_duration=None):
+    """Find sustained high-risk episodes in a scored series"""
+    columns = ['start', 'end', 'start_index', 'end_index', 'level', 'peak', 'points']
+    scores = np.nan_to_num(np.asarray(scores, dtype=float), nan=0.0)
+    if not len(scores):
+        return pd.DataFrame(columns=columns)
+
+    in_warning = _long_runs(hysteresis_state(scores, warning, warning - clear_margin), min_points)
+    in_critical = _long_runs(hysteresis_state(scores, critical, critical - clear_margin), min_points)
+
+    starts, ends = _runs(in_warning)
+    if not len(starts):
+        return pd.DataFrame(columns=columns)
+
+    peaks = np.maximum.reduceat(np.where(in_warning, scores, -np.inf), starts)
+    critical_counts = np.concatenate([[0], np.cumsum(in_critical)])
+    has_critical = (critical_counts[ends] - critical_counts[starts]) > 0
+
+    if times is not None:
+        times = pd.to_datetime(pd.Series(times), format='mixed').to_numpy()
+        start_times, end_times = times[starts], times[ends - 1]
+    else:
+        start_times, end_times = starts, ends - 1
+
+    episodes = pd.DataFrame({
+        'start': start_times,
+        'end': end_times,
+        'start_index': starts,
+        'end_index': ends - 1,
+        'level': np.where(has_critical, "CRITICAL", "WARNING"),
+        'peak': peaks,
+        'points': ends - starts,
+    })
+    if min_duration is not None and times is not None:
+        episodes = episodes[(episodes['end'] - episodes['start']) >= pd.Timedelta(min_duration)]
+    return episodes.reset_index(drop=True)
+
+
+class LogSink:
+    """Write alerts to the application log"""
+
+    def send(self, alert):
+        logger.warning("[%s] %s: peak risk %.2f from %s to %s", alert['level'], alert['well'],
+                       alert['peak'], alert['start'], alert['end'])
+
+
+class FileSink:
+    """Append alerts to a JSON-lines file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, alert):
+        with open(self.path, 'a') as fh:
+            fh.write(json.dumps(alert) + "\n")
+
+
+class WebhookSink:
+    """POST each alert as JSON to a webhook URL"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        import requests
+        requests.post(self.url, json=alert, timeout=self.timeout).raise_for_status()
+
+
+class AlertEngine:
+    """Evaluate scored series off the page thread and dispatch new alerts"""
+
+    def __init__(self, sinks=None, max_queue=256, **rules):
+        self.sinks = list(sinks or [])
+        self.rules = rules
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._emitted = {}
+        self._recent = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.sink_errors = 0
+        self._worker = threading.Thread(target=self._run, name="alert-engine", daemon=True)
+        self._worker.start()
+
+    def submit(self, well, times, scores, owner=None):
+        """Queue a scored series for evaluation; never blocks the caller"""
+        try:
+            self._queue.put_nowait((owner, well, times, np.asarray(scores)))
+        except queue.Full:
+            self.dropped += 1
+
+    def recent(self, well=None, limit=20, owner=None):
+        """Most recent alerts of owner, newest first"""
+        with self._lock:
+            alerts = [a for a in reversed(self._recent)
+                      if a['owner'] == owner and (well is None or a['well'] == well)]
+        return alerts[:limit]
+
+    def _run(self):
+        while True:
+            owner, well, times, scores = self._queue.get()
+            try:
+                for alert in self.evaluate(well, times, scores, owner):
+                    self._dispatch(alert)
+            except Exception:
+                logger.exception("Alert evaluation failed for %s", well)
+
+    def evaluate(self, well, times, scores, owner=None):
+        """Return alerts for episodes not already raised for this owner's well"""
+        if times is not None:
+            # An episode without a time can't be matched against those already
+            # raised and would be raised again on every batch, so such rows are left out
+            times = pd.to_datetime(pd.Series(times), format='mixed', errors='coerce')
+            known = times.notna().to_numpy()
+            if not known.all():
+                times, scores = times[known], np.asarray(scores)[known]
+        episodes = find_risk_episodes(scores, times, **self.rules)
+        new_alerts = []
+        with self._lock:
+            raised = self._emitted.get((owner, well))
+            if raised is None:
+                raised = self._emitted[(owner, well)] = deque(maxlen=MAX_RAISED_PER_WELL)
+            for episode in episodes.itertuples(index=False):
+                # Reruns and streaming re-evaluate the same episode; only raise it
+                # again if it overlaps nothing already raised or has escalated
+                rank = LEVELS.index(episode.level)
+                duplicate = False
+                for previous in raised:
+                    if episode.start <= previous['end'] and episode.end >= previous['start']:
+                        previous['end'] = max(previous['end'], episode.end)
+                        if rank <= previous['rank']:
+                            duplicate = True
+                if duplicate:
+                    continue
+                raised.append({'start': episode.start, 'end': episode.end, 'rank': rank})
+                new_alerts.append({
+                    'owner': owner,
+                    'well': well,
+                    'level': episode.level,
+                    'start': str(episode.start),
+                    'end': str(episode.end),
+                    'peak': round(float(episode.peak), 3),
+                    'points': int(episode.points),
+                    'raised_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                })
+        return new_alerts
+
+    def _dispatch(self, alert):
+        with self._lock:
+            self._recent.append(alert)
+        for sink in self.sinks:
+            try:
+                sink.send(alert)
+            except Exception:
+                self.sink_errors += 1
+                logger.exception("Alert sink %s failed", type(sink).__name__)
+
+
+@st.cache_resource
+def get_alert_engine():
+    """Process-wide alert engine shared by every session"""
+    sinks = [LogSink()]
+    if os.environ.get("HYDRATE_ALERT_FILE"):
+        sinks.append(FileSink(os.environ["HYDRATE_ALERT_FILE"]))
+    if os.environ.get("HYDRATE_ALERT_WEBHOOK"):
+        sinks.append(WebhookSink(os.environ["HYDRATE_ALERT_WEBHOOK"]))
+    return AlertEngine(sinks)
@@ -5,16 +5,18 @@ import hashlib
 import time
 import json
 
+import pages.admin as admin
 import pages.data_upload as data_upload
 import pages.data_analysis as data_analysis
 import pages.help as help
 import pages.home as home
 import pages.landing as landing_page
+from memory_accounting import track_session
 from pages.style import google_button_style
 
 # Import Google Auth (with fallback if not available)
 try:
-    from google_auth import GoogleAuth, is_google_auth_configured
+    from google_auth import get_google_auth, is_google_auth_configured
     GOOGLE_AUTH_AVAILABLE = True
 except ImportError:
     GOOGLE_AUTH_AVAILABLE = False
@@ -100,6 +102,7 @@ def clear_auth_state():
     st.session_state.username = ""
     st.session_state.user_email = ""
     st.session_state.user_picture = ""
+    st.session_state.pop('verified_email', None)
     if 'auth_token' in st.session_state:
         del st.session_state.auth_token
     
@@ -208,13 +211,15 @@ if GOOGLE_AUTH_AVAILABLE:
         if 'oauth_processed' not in st.session_state:
             st.session_state.oauth_processed = True
             
-            google_auth = GoogleAuth()
+            google_auth = get_google_auth()
             auth_code = query_params['code']
-            user_info = google_auth.authenticate_user(auth_code)
+            user_info = google_auth.authenticate_user(auth_code, query_params.get('state'))
             
             if user_info:
                 # Use persistent authentication
                 save_auth_state(user_info['name'], user_info['email'], user_info.get('picture', ''))
+                # Only a completed Google sign-in proves the email; saved datasets are keyed on it
+                st.session_state.verified_email = user_info['email']
                 st.success(f"Welcome, {user_info['name']}!")
                 
                 # Clear query params and oauth_processed flag
@@ -270,7 +275,7 @@ with st.sidebar:
         
         # Google OAuth login button (moved below login/register)
         if GOOGLE_AUTH_AVAILABLE and is_google_auth_configured():
-            google_auth = GoogleAuth()
+            google_auth = get_google_auth()
             auth_url = google_auth.get_authorization_url()
             
             # Google Login Button with Streamlit button styling
@@ -322,12 +327,23 @@ with st.sidebar:
 
 # Only show main content if user is logged in
 if st.session_state.logged_in:
+    evicted = track_session(st.session_state.username)
+    restored = data_upload.restore_datasets(reload=evicted)
+    if evicted:
+        st.info("Your datasets were cleared to free memory after this session was idle. "
+                + (f"{restored} saved dataset(s) were reloaded." if restored else "Please upload them again."))
+
     # 4. Top navbar in main area
 
+    options = ["Home", "Upload Data", "Data Analysis", "Help"]
+    if admin.is_admin(st.session_state.get('verified_email')):
+        options.append("Admin")
+
     selected = option_menu(
         menu_title=None,
-        options=["Home", "Upload Data", "Data Analysis", "Help"],
-        icons=["‎", "‎ ", "‎ ", "‎ "],
+        options=options,
+        key="main_menu",
+        icons=["‎"] + ["‎ "] * (len(options) - 1),
         orientation="horizontal",
         styles={
             "container": {"padding": "0 !important", "background-color": "#f0f0f0", "border-radius": "10px"},
@@ -349,5 +365,8 @@ if st.session_state.logged_in:
     elif selected == "Help":
         help.help_page()
 
+    elif selected == "Admin":
+        admin.admin_page()
+
 else:
     landing_page.landing_page()
@@ -0,0 +1,302 @@
+"""SQLite persistence for uploaded wells, their predictions and risk episodes
+
+Uploads, predictions and episodes are written to a local SQLite database, so
+a new session (or the server after a restart) picks up where the user left
+off instead of asking for the same files again and rescoring them.
+
+    wells        one row per saved dataset and owner
+    readings     the dataset's rows, keyed by (well, time, seq)
+    predictions  risk per reading from the model recorded on the well
+    episodes     sustained high-risk episodes, keyed by (well, start)
+
+``seq`` is the row's position in the upload, so duplicate timestamps and the
+original row order survive a round trip. Readings, predictions and episodes
+are clustered on their keys (``WITHOUT ROWID``), so reading a well, or a time
+range of it, is an index range scan rather than a table scan.
+
+Only the columns the app works with are kept: time, the three measurements
+and, for labeled data, the hydrate likelihood label. The database defaults to
+``.hydrate.db`` at the repository root and can be moved with the
+``HYDRATE_DB`` environment variable.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from training_set import LABEL_COLUMN, well_id
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.hydrate.db')
+
+TIME_COLUMN = 'Time'
+# Database column -> dataset column
+READING_COLUMNS = {
+    'volume': 'Inj Gas Meter Volume Instantaneous',
+    'setpoint': 'Inj Gas Meter Volume Setpoint',
+    'valve': 'Inj Gas Valve Percent Open',
+    'label': LABEL_COLUMN,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wells (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL,
+    well TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    first_time INTEGER,
+    last_time INTEGER,
+    saved_at TEXT NOT NULL,
+    scored_with TEXT,
+    UNIQUE (owner, name)
+);
+CREATE TABLE IF NOT EXISTS readings (
+    well_id INTEGER NOT NULL REFERENCES wells(id) ON DELETE CASCADE,
+    time INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    volume REAL,
+    setpoint REAL,
+    valve REAL,
+    label REAL,
+    PRIMARY KEY (well_id, time, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS predictions (
+    well_id INTEGER NOT NULL REFERENCES wells(id) ON DELETE CASCADE,
+    time INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    risk REAL,
+    PRIMARY KEY (well_id, time, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS episodes (
+    well_id INTEGER NOT NULL REFERENCES wells(id) ON DELETE CASCADE,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    level TEXT NOT NULL,
+    peak REAL NOT NULL,
+    points INTEGER NOT NULL,
+    PRIMARY KEY (well_id, start)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS episodes_by_time ON episodes (start, end);
+CREATE INDEX IF NOT EXISTS wells_by_well ON wells (well);
+"""
+
+
+def _nanoseconds(times):
+    # NaT is stored as its integer value and comes back as NaT
+    return pd.to_datetime(pd.Series(times), format='mixed', errors='coerce').to_numpy('datetime64[ns]').view('i8')
+
+
+def _bound(value):
+    return None if value is None else pd.Timestamp(value).value
+
+
+def stored_columns(df):
+    """Dataset columns the store keeps, in database order"""
+    return [TIME_COLUMN] + [column for column in READING_COLUMNS.values() if column in df.columns]
+
+
+def fingerprint(df):
+    """Content hash of the stored columns"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(len(df)).encode())
+    for column in stored_columns(df):
+        digest.update(column.encode())
+        values = df[column]
+        if column == TIME_COLUMN:
+            values = pd.Series(_nanoseconds(values))
+        else:
+            values = values.astype(np.float64)
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def model_key(version):
+    """Identifies the model behind stored predictions across restarts"""
+    return f"{version.source}:{version.version}:{version.metrics.get('r2', 0):.8f}"
+
+
+class DatasetStore:
+    """Thread-safe SQLite store; each thread gets its own connection"""
+
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_PATH
+        self._local = threading.local()
+        # SQLite allows one writer at a time; queue writers here rather than on its busy timeout
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def _well(self, owner, name):
+        return self._connection().execute(
+            "SELECT id, fingerprint, columns, scored_with FROM wells WHERE owner = ? AND name = ?", (owner, name)
+        ).fetchone()
+
+    # Datasets
+
+    def save_dataset(self, owner, name, df):
+        """Store a dataset, replacing an earlier one of the same name; False if it was already stored"""
+        if TIME_COLUMN not in df.columns:
+            return False
+        digest = fingerprint(df)
+        existing = self._well(owner, name)
+        if existing is not None and existing[1] == digest:
+            return False
+
+        times = _nanoseconds(df[TIME_COLUMN])
+        present = [db for db, column in READING_COLUMNS.items() if column in df.columns]
+        values = [df[READING_COLUMNS[db]].astype(np.float64).tolist() if db in present else [None] * len(df)
+                  for db in READING_COLUMNS]
+        valid = times[times != pd.NaT.value]
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                connection.execute("DELETE FROM wells WHERE owner = ? AND name = ?", (owner, name))
+                well = connection.execute(
+                    "INSERT INTO wells (owner, name, well, fingerprint, columns, rows, first_time, last_time, saved_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (owner, name, well_id(name), digest, ",".join(present), len(df),
+                     int(valid.min()) if len(valid) else None, int(valid.max()) if len(valid) else None,
+                     time.strftime('%Y-%m-%d %H:%M:%S'))
+                ).lastrowid
+                connection.executemany(
+                    "INSERT INTO readings (well_id, time, seq, volume, setpoint, valve, label) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip([well] * len(df), times.tolist(), range(len(df)), *values)
+                )
+        return True
+
+    def datasets(self, owner):
+        """Saved datasets of an owner, oldest first"""
+        return pd.read_sql_query(
+            "SELECT name, well, rows, first_time, last_time, saved_at, scored_with FROM wells WHERE owner = ? ORDER BY id",
+            self._connection(), params=(owner,)
+        ).assign(first_time=lambda f: pd.to_datetime(f['first_time']), last_time=lambda f: pd.to_datetime(f['last_time']))
+
+    def _frame(self, rows, columns, upload_order=True):
+        """Dataset frame from (time, seq, volume, setpoint, valve, label) rows read in key order"""
+        records = pd.DataFrame.from_records(rows, columns=['time', 'seq', *READING_COLUMNS])
+        if upload_order and not records['seq'].is_monotonic_increasing:
+            records = records.sort_values('seq', kind='stable')
+        frame = {TIME_COLUMN: pd.to_datetime(records['time'].to_numpy(dtype=np.int64))}
+        for db, column in READING_COLUMNS.items():
+            if db in columns:
+                # NULLs come back as None
+                frame[column] = records[db].to_numpy(dtype=np.float64, na_value=np.nan)
+        return pd.DataFrame(frame)
+
+    def load_dataset(self, owner, name):
+        well = self._well(owner, name)
+        if well is None:
+            return None
+        rows = self._connection().execute(
+            "SELECT time, seq, volume, setpoint, valve, label FROM readings WHERE well_id = ? ORDER BY time, seq",
+            (well[0],)
+        ).fetchall()
+        return self._frame(rows, well[2].split(','))
+
+    def load_all(self, owner, skip=()):
+        """Every saved dataset of an owner as {name: frame}"""
+        names = [name for name in self.datasets(owner)['name'] if name not in skip]
+        return {name: self.load_dataset(owner, name) for name in names}
+
+    def readings(self, owner, name, start=None, end=None):
+        """Readings of one dataset inside [start, end], in time order"""
+        well = self._well(owner, name)
+        if well is None:
+            return None
+        rows = self._connection().execute(
+            "SELECT time, seq, volume, setpoint, valve, label FROM readings "
+            "WHERE well_id = ? AND time >= coalesce(?, -9223372036854775807) AND time <= coalesce(?, 9223372036854775807) "
+            "ORDER BY time, seq",
+            (well[0], _bound(start), _bound(end))
+        ).fetchall()
+        return self._frame(rows, well[2].split(','), upload_order=False)
+
+    def delete_dataset(self, owner, name):
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                connection.execute("DELETE FROM wells WHERE owner = ? AND name = ?", (owner, name))
+
+    # Predictions and episodes
+
+    def save_predictions(self, owner, name, df, key, predictions, episodes=None):
+        """Store predictions for a saved dataset, replacing older ones; False if df is not the saved dataset"""
+        well = self._well(owner, name)
+        if well is None or well[1] != fingerprint(df):
+            return False
+        times = _nanoseconds(df[TIME_COLUMN])
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                connection.execute("DELETE FROM predictions WHERE well_id = ?", (well[0],))
+                connection.execute("DELETE FROM episodes WHERE well_id = ?", (well[0],))
+                connection.executemany(
+                    "INSERT INTO predictions (well_id, time, seq, risk) VALUES (?, ?, ?, ?)",
+                    zip([well[0]] * len(df), times.tolist(), range(len(df)), np.asarray(predictions, dtype=np.float64).tolist())
+                )
+                if episodes is not None and len(episodes):
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO episodes (well_id, start, end, level, peak, points) VALUES (?, ?, ?, ?, ?, ?)",
+                        zip([well[0]] * len(episodes), _nanoseconds(episodes['start']).tolist(),
+                            _nanoseconds(episodes['end']).tolist(), episodes['level'].tolist(),
+                            episodes['peak'].astype(float).tolist(), episodes['points'].astype(int).tolist())
+                    )
+                connection.execute("UPDATE wells SET scored_with = ? WHERE id = ?", (key, well[0]))
+        return True
+
+    def load_predictions(self, owner, name, df, key):
+        """Stored predictions for df in row order, or None if df was not saved or was scored by another model"""
+        well = self._well(owner, name)
+        if well is None or well[3] != key or well[1] != fingerprint(df):
+            return None
+        rows = self._connection().execute(
+            "SELECT seq, risk FROM predictions WHERE well_id = ?", (well[0],)
+        ).fetchall()
+        if len(rows) != len(df):
+            return None
+        risk = np.empty(len(rows))
+        seq, values = zip(*rows) if rows else ((), ())
+        risk[np.asarray(seq, dtype=np.int64)] = np.array(values, dtype=np.float64)
+        return risk
+
+    def episodes(self, owner, name=None, start=None, end=None, level=None):
+        """Stored episodes overlapping [start, end], for one dataset or all of an owner's"""
+        query = (
+            "SELECT wells.name AS dataset, episodes.start, episodes.end, episodes.level, episodes.peak, episodes.points "
+            "FROM episodes JOIN wells ON wells.id = episodes.well_id "
+            "WHERE wells.owner = ? AND (? IS NULL OR wells.name = ?) "
+            "AND episodes.start <= coalesce(?, 9223372036854775807) AND episodes.end >= coalesce(?, -9223372036854775807) "
+            "AND (? IS NULL OR episodes.level = ?) ORDER BY episodes.start"
+        )
+        episodes = pd.read_sql_query(query, self._connection(),
+                                     params=(owner, name, name, _bound(end), _bound(start), level, level))
+        return episodes.assign(start=pd.to_datetime(episodes['start']), end=pd.to_datetime(episodes['end']))
+
+    def explain(self, sql, params=()):
+        """SQLite's query plan for a statement, to check it uses an index"""
+        return [row[-1] for row in self._connection().execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+@st.cache_resource
+def get_dataset_store():
+    """Process-wide dataset store shared by every session"""
+    return DatasetStore(os.environ.get("HYDRATE_DB"))
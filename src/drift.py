@@ -0,0 +1,255 @@
+"""Input drift between uploaded wells and the data the model was trained on
+
+Every model carries a ``DriftProfile`` of its training inputs, and every
+dataset gets one when it is uploaded. Both are sketched from the same
+prepared readings the features are built from, with setpoint and valve
+carried forward between changes, so a dataset compared with a model trained
+on it shows no drift. A profile holds a small quantile
+sketch per measured input: values are counted in logarithmic buckets, each
+1% wide relative to its value, so a sketch is a few hundred counters however
+many rows went into it. Any two sketches use the same buckets, which means
+they merge (followed files and incremental model updates just add counts)
+and compare with each other without going back to the data.
+
+``drift_report`` compares a dataset's profile with the model's:
+
+    Unsupported  share of readings outside the training range, or in parts
+                 of it the training data barely covers
+    PSI          population stability index over the training deciles
+    KS           largest gap between the two cumulative distributions
+
+The training set pools every well, and a single well only covers part of
+it, so PSI and KS are large for most wells on their own; they are most
+useful compared between wells and uploads. The drift level is taken from
+the unsupported share, which is what the model cannot be trusted on.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from features import WINDOW_INPUTS, prepared_inputs
+
+# Inputs profiled: the readings every feature is built from
+DRIFT_COLUMNS = list(WINDOW_INPUTS)
+
+RELATIVE_ACCURACY = 0.01
+# Magnitudes below this count as zero
+MIN_MAGNITUDE = 1e-9
+
+PSI_BINS = 10
+# Keeps empty bins from making PSI infinite
+PSI_FLOOR = 1e-4
+
+# The training range is split into this many equal bins; a bin holding less
+# than MIN_SUPPORT of the training readings does not support predictions
+SUPPORT_BINS = 50
+MIN_SUPPORT = 0.001
+
+# Unsupported shares above these are moderate and significant drift
+UNSUPPORTED_MODERATE = 0.01
+UNSUPPORTED_SIGNIFICANT = 0.05
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with values bucketed on a log scale"""
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+        self.missing = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add(self, store, magnitudes):
+        keys, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        present = values[~np.isnan(values)]
+        self.missing += len(values) - len(present)
+        if not len(present):
+            return
+        self.count += len(present)
+        self.min = min(self.min, float(present.min()))
+        self.max = max(self.max, float(present.max()))
+        positive = present[present > MIN_MAGNITUDE]
+        negative = -present[present < -MIN_MAGNITUDE]
+        self.zeros += len(present) - len(positive) - len(negative)
+        if len(positive):
+            self._add(self.positive, positive)
+        if len(negative):
+            self._add(self.negative, negative)
+
+    def merge(self, other):
+        """Add another sketch's counts to this one"""
+        for store, others in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in others.items():
+                store[key] = store.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.missing += other.missing
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _value(self, keys):
+        # The point each bucket's values are within RELATIVE_ACCURACY of
+        return 2 * self.gamma ** np.asarray(keys, dtype=np.float64) / (self.gamma + 1)
+
+    def support(self):
+        """Bucket values in ascending order and their counts"""
+        negative = sorted(self.negative, reverse=True)
+        positive = sorted(self.positive)
+        values = np.concatenate([-self._value(negative), [0.0] if self.zeros else [], self._value(positive)])
+        counts = np.array([self.negative[k] for k in negative] + ([self.zeros] if self.zeros else [])
+                          + [self.positive[k] for k in positive], dtype=np.int64)
+        return values, counts
+
+    def cdf(self, points, side='right'):
+        """Share of values at or below each point ('left': strictly below)"""
+        values, counts = self.support()
+        points = np.asarray(points, dtype=np.float64)
+        if not self.count:
+            return np.zeros(points.shape)
+        cumulative = np.concatenate([[0], np.cumsum(counts)])
+        return cumulative[np.searchsorted(values, points, side=side)] / self.count
+
+    def quantile(self, q):
+        values, counts = self.support()
+        if not self.count:
+            return np.full(np.shape(q), np.nan)
+        ranks = np.asarray(q, dtype=np.float64) * (self.count - 1)
+        return values[np.searchsorted(np.cumsum(counts), ranks, side='right').clip(max=len(values) - 1)]
+
+    @property
+    def nbuckets(self):
+        return len(self.positive) + len(self.negative) + 1
+
+
+class DriftProfile:
+    """A quantile sketch per profiled input"""
+
+    def __init__(self, columns=DRIFT_COLUMNS):
+        self.sketches = {column: QuantileSketch() for column in columns}
+
+    @classmethod
+    def from_frame(cls, df, columns=DRIFT_COLUMNS):
+        profile = cls([column for column in columns if column in df.columns])
+        profile.update(df)
+        return profile
+
+    @classmethod
+    def from_inputs(cls, inputs, columns=DRIFT_COLUMNS):
+        """Profile of an (n_rows, len(columns)) array of prepared readings, e.g. a training set's"""
+        profile = cls(list(columns))
+        for position, sketch in enumerate(profile.sketches.values()):
+            sketch.update(inputs[:, position])
+        return profile
+
+    def update(self, df, context_rows=0):
+        """Count new rows, e.g. a batch appended to a followed file
+
+        The first context_rows rows of df were counted before and only carry
+        their readings forward into the new ones.
+        """
+        columns = [column for column in self.sketches if column in df.columns]
+        inputs = prepared_inputs(df, columns).iloc[context_rows:]
+        for column in columns:
+            self.sketches[column].update(inputs[column].to_numpy(dtype=np.float64, na_value=np.nan))
+
+    def copy(self):
+        """New profile with the same counts"""
+        return self.merged(DriftProfile([]))
+
+    def merged(self, other):
+        """New profile counting the rows of both"""
+        profile = DriftProfile(list(self.sketches))
+        for column, sketch in profile.sketches.items():
+            sketch.merge(self.sketches[column])
+            if column in other.sketches:
+                sketch.merge(other.sketches[column])
+        return profile
+
+    @property
+    def rows(self):
+        return max((sketch.count + sketch.missing for sketch in self.sketches.values()), default=0)
+
+
+def psi(reference, sketch, bins=PSI_BINS):
+    """Population stability index of sketch against reference, over the reference's quantile bins"""
+    if not reference.count or not sketch.count:
+        return np.nan
+    edges = np.unique(reference.quantile(np.linspace(0, 1, bins + 1)[1:-1]))
+    expected = np.diff(np.concatenate([[0.0], reference.cdf(edges), [1.0]]))
+    actual = np.diff(np.concatenate([[0.0], sketch.cdf(edges), [1.0]]))
+    expected, actual = np.maximum(expected, PSI_FLOOR), np.maximum(actual, PSI_FLOOR)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks_statistic(reference, sketch):
+    """Largest gap between the two cumulative distributions"""
+    if not reference.count or not sketch.count:
+        return np.nan
+    points = np.union1d(reference.support()[0], sketch.support()[0])
+    return float(np.max(np.abs(reference.cdf(points) - sketch.cdf(points))))
+
+
+def outside_share(reference, sketch):
+    """Share of sketch values below or above every value in reference"""
+    if not reference.count or not sketch.count:
+        return np.nan
+    values = reference.support()[0]
+    below = sketch.cdf([values[0]], side='left')[0]
+    above = 1 - sketch.cdf([values[-1]], side='right')[0]
+    return float(below + above)
+
+
+def unsupported_share(reference, sketch, bins=SUPPORT_BINS, min_support=MIN_SUPPORT):
+    """Share of sketch values outside reference's range or in bins reference barely covers"""
+    if not reference.count or not sketch.count:
+        return np.nan
+    outside = outside_share(reference, sketch)
+    values = reference.support()[0]
+    if values[0] == values[-1]:
+        return outside
+    edges = np.linspace(values[0], values[-1], bins + 1)[1:-1]
+    expected = np.diff(np.concatenate([[0.0], reference.cdf(edges), [1.0]]))
+    actual = np.diff(np.concatenate([[sketch.cdf([values[0]], side='left')[0]], sketch.cdf(edges),
+                                     [sketch.cdf([values[-1]])[0]]]))
+    return float(outside + actual[expected < min_support].sum())
+
+
+def drift_level(unsupported):
+    if unsupported > UNSUPPORTED_SIGNIFICANT:
+        return "Significant"
+    if unsupported > UNSUPPORTED_MODERATE:
+        return "Moderate"
+    return "Stable"
+
+
+def drift_report(reference, profile):
+    """One row per input shared by the two profiles, worst drift first"""
+    rows = []
+    for column, sketch in profile.sketches.items():
+        base = reference.sketches.get(column)
+        if base is None or not base.count or not sketch.count:
+            continue
+        unsupported = unsupported_share(base, sketch)
+        rows.append({
+            'input': column,
+            'training_range': f"{base.min:,.1f} to {base.max:,.1f}",
+            'dataset_range': f"{sketch.min:,.1f} to {sketch.max:,.1f}",
+            'unsupported': unsupported,
+            'psi': psi(base, sketch),
+            'ks': ks_statistic(base, sketch),
+            'drift': drift_level(unsupported),
+        })
+    columns = ['input', 'training_range', 'dataset_range', 'unsupported', 'psi', 'ks', 'drift']
+    return pd.DataFrame(rows, columns=columns).sort_values('unsupported', ascending=False, ignore_index=True)
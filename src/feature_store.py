@@ -0,0 +1,165 @@
+"""Versioned store of computed feature matrices
+
+Feature matrices are keyed by (dataset fingerprint, feature-set version), so
+each dataset's features are computed once and then shared by training,
+prediction and the charts. Matrices are kept in memory for the most recently
+used datasets and persisted as float32 ``.npy`` files, which later sessions
+and restarts memory-map instead of recomputing.
+
+The store directory defaults to ``.feature_store`` at the repository root and
+can be moved with the ``HYDRATE_FEATURE_STORE`` environment variable. The
+files on disk are capped at ``HYDRATE_FEATURE_STORE_MB`` (default 1024): once
+a save goes over it, the least recently used matrices are deleted. Matrices
+of older feature-set versions can never be read again and are deleted when
+the store opens.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from features import FEATURE_SET_VERSION, WINDOW_INPUTS, build_feature_matrix
+from memory_accounting import register_shared
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.feature_store')
+
+DEFAULT_DISK_MB = 1024
+VERSION_DIRECTORY = re.compile(r'v\d+')
+
+# Only the columns features are built from, so adding predictions to a frame
+# does not change its fingerprint
+FINGERPRINT_COLUMNS = ['Time'] + list(WINDOW_INPUTS)
+
+
+def dataset_fingerprint(df):
+    """Content hash of the columns the features are computed from"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(len(df)).encode())
+    for col in FINGERPRINT_COLUMNS:
+        if col in df.columns:
+            digest.update(col.encode())
+            digest.update(pd.util.hash_pandas_object(df[col], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class FeatureStore:
+    """Compute each dataset's feature matrix once and serve it from memory or disk"""
+
+    def __init__(self, directory=None, max_entries=16, max_disk_bytes=None):
+        if max_disk_bytes is None:
+            max_disk_bytes = int(float(os.environ.get("HYDRATE_FEATURE_STORE_MB", DEFAULT_DISK_MB)) * 1024 * 1024)
+        self.root = directory or DEFAULT_DIRECTORY
+        self.directory = os.path.join(self.root, f"v{FEATURE_SET_VERSION}")
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._remove_stale_versions()
+
+    def _path(self, fingerprint):
+        return os.path.join(self.directory, f"{fingerprint}.npy")
+
+    def features(self, df, persist=True):
+        """(n_rows, n_features) float32 feature matrix for a dataset"""
+        fingerprint = dataset_fingerprint(df)
+        with self._lock:
+            if fingerprint in self._memory:
+                self._memory.move_to_end(fingerprint)
+                self.hits += 1
+                return self._memory[fingerprint]
+
+        path = self._path(fingerprint)
+        try:
+            matrix = np.load(path, mmap_mode='r')
+            # The modification time orders files for eviction
+            os.utime(path)
+            hit = True
+        except OSError:
+            matrix = build_feature_matrix(df)
+            hit = False
+            if persist:
+                self._save(path, matrix)
+                self._evict_files(keep=path)
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._memory[fingerprint] = matrix
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+        return matrix
+
+    def _save(self, path, matrix):
+        # Write to a temporary file first so readers never see a partial matrix
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                np.save(fh, matrix)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict_files(self, keep=None):
+        """Delete the least recently used matrices until the files fit in max_disk_bytes
+
+        Sessions that memory-mapped a deleted file keep reading it; later
+        ones compute the matrix again.
+        """
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.npy'):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evicted += 1
+
+    def _remove_stale_versions(self):
+        if not os.path.isdir(self.root):
+            return
+        for name in os.listdir(self.root):
+            if VERSION_DIRECTORY.fullmatch(name) and name != f"v{FEATURE_SET_VERSION}":
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def clear(self):
+        """Drop every stored matrix for the current feature-set version"""
+        with self._lock:
+            self._memory.clear()
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.npy'):
+                    os.remove(os.path.join(self.directory, name))
+
+
+@st.cache_resource
+def get_feature_store():
+    """Process-wide feature store shared by every session"""
+    return register_shared("feature store", FeatureStore(os.environ.get("HYDRATE_FEATURE_STORE")))
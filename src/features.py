@@ -0,0 +1,175 @@
+"""Feature engineering shared by training, prediction and charts
+
+``build_feature_matrix`` turns one well's readings into the model's float32
+feature matrix: the base features plus the sliding-window bank. Bump
+``FEATURE_SET_VERSION`` whenever the output of either changes, so matrices
+persisted by the feature store are rebuilt.
+
+Lag and trend features are computed for every window and every input column
+in one vectorized pass over NumPy sliding-window views of the readings. The
+inputs are padded once at the front so every row has a full window; after
+that no per-window or per-column copies are made, and every statistic is
+reduced straight into its slice of one preallocated float32 matrix.
+"""
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Source column -> short name used in the feature names
+WINDOW_INPUTS = {
+    'Inj Gas Meter Volume Instantaneous': 'Volume',
+    'Inj Gas Meter Volume Setpoint': 'Setpoint',
+    'Inj Gas Valve Percent Open': 'Valve',
+}
+
+# Window lengths and lags are in rows, i.e. readings, not minutes
+WINDOWS = (5, 15)
+LAGS = (1, 3)
+
+# Matches the precomputed Rolling Std column in data/final.csv
+ROLLING_STD_WINDOW = 20
+
+# Rows of earlier history a row's features depend on
+HISTORY_ROWS = max(max(WINDOWS) - 1, max(LAGS), ROLLING_STD_WINDOW - 1)
+
+FEATURE_SET_VERSION = 1
+
+BASE_FEATURE_COLUMNS = [
+    'Inj Gas Meter Volume Instantaneous',
+    'Inj Gas Meter Volume Setpoint',
+    'Inj Gas Valve Percent Open',
+    'Rolling Std',
+    'Volume_Diff',
+    'Volume_Ratio',
+    'Hour',
+    'Day',
+]
+
+
+def _bank_layout():
+    names = []
+    for short in WINDOW_INPUTS.values():
+        for lag in LAGS:
+            names.append(f"{short}_Lag_{lag}")
+    for window in WINDOWS:
+        for stat in ("Min", "Max", "Slope"):
+            for short in WINDOW_INPUTS.values():
+                names.append(f"{short}_{stat}_{window}")
+        names.append(f"Volume_Drop_{window}")
+        names.append(f"Valve_Change_Rate_{window}")
+    names.append("Volume_Shortfall")
+    return names
+
+
+WINDOW_FEATURE_COLUMNS = _bank_layout()
+FEATURE_COLUMNS = BASE_FEATURE_COLUMNS + WINDOW_FEATURE_COLUMNS
+
+
+def window_feature_bank(values, out=None):
+    """Compute every window feature for an (n_rows, n_inputs) array of readings
+
+    Returns an (n_rows, n_features) float32 array. It is the transpose of a
+    feature-major buffer, so each feature is written contiguously and pandas
+    can wrap it without copying. Pass `out` (n_features, n_rows) to fill part
+    of a larger feature-major buffer instead.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_rows, n_inputs = values.shape
+    if out is None:
+        out = np.empty((len(WINDOW_FEATURE_COLUMNS), n_rows), dtype=np.float32)
+    if n_rows == 0:
+        return out.T
+
+    # One column-major copy with the first reading repeated in front, so the
+    # earliest rows still see full windows and each window is contiguous
+    pad = HISTORY_ROWS
+    padded = np.empty((n_inputs, pad + n_rows), dtype=np.float64)
+    padded[:, :pad] = values[:1].T
+    padded[:, pad:] = values.T
+    current = padded[:, pad:]
+    volume, setpoint, valve = 0, 1, 2
+
+    row = 0
+    for j in range(n_inputs):
+        for lag in LAGS:
+            out[row] = padded[j, pad - lag:pad - lag + n_rows]
+            row += 1
+
+    for window in WINDOWS:
+        # (n_inputs, n_rows, window) view onto `padded`, no data copied
+        view = sliding_window_view(padded[:, pad - window + 1:], window, axis=1)
+        # Reducing over the outer axis keeps the inner loops long and contiguous
+        by_offset = view.transpose(2, 0, 1)
+
+        mins = out[row:row + n_inputs]
+        np.min(by_offset, axis=0, out=mins)
+        row += n_inputs
+
+        maxes = out[row:row + n_inputs]
+        np.max(by_offset, axis=0, out=maxes)
+        row += n_inputs
+
+        # Least-squares slope per window is a dot product with centred positions
+        steps = np.arange(window, dtype=np.float64)
+        steps -= steps.mean()
+        steps /= np.dot(steps, steps)
+        slopes = out[row:row + n_inputs]
+        np.matmul(view, steps, out=slopes)
+        row += n_inputs
+
+        # How far volume has fallen from its recent peak, and how fast the valve moves
+        np.subtract(maxes[volume], current[volume], out=out[row])
+        out[row + 1] = slopes[valve]
+        row += 2
+
+    # Fraction of the setpoint the instantaneous volume is falling short by
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shortfall = (current[setpoint] - current[volume]) / current[setpoint]
+    np.clip(shortfall, 0, None, out=shortfall)
+    out[row] = np.nan_to_num(shortfall, nan=0.0, posinf=0.0, neginf=0.0)
+    return out.T
+
+
+def _readings(df):
+    return df[list(WINDOW_INPUTS)].apply(pd.to_numeric, errors='coerce')
+
+
+def prepared_inputs(df, columns=WINDOW_INPUTS):
+    """The readings the window features are built from, with gaps filled
+
+    Historian exports only record setpoint and valve when they change, so
+    each reading is carried forward until the next one.
+    """
+    return df[list(columns)].apply(pd.to_numeric, errors='coerce').ffill().bfill()
+
+
+def build_feature_matrix(df):
+    """Full (n_rows, len(FEATURE_COLUMNS)) float32 feature matrix for one well"""
+    n_rows = len(df)
+    out = np.empty((len(FEATURE_COLUMNS), n_rows), dtype=np.float32)
+    raw = _readings(df)
+    volume = raw['Inj Gas Meter Volume Instantaneous'].to_numpy(dtype=np.float64, na_value=np.nan)
+    setpoint = raw['Inj Gas Meter Volume Setpoint'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # Base features, as the model has always seen them
+    out[0] = volume
+    out[1] = setpoint
+    out[2] = raw['Inj Gas Valve Percent Open'].to_numpy(dtype=np.float64, na_value=np.nan)
+    out[3] = raw['Inj Gas Meter Volume Instantaneous'].rolling(window=ROLLING_STD_WINDOW).std().fillna(0).to_numpy()
+    out[4] = volume - setpoint
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[5] = volume / setpoint
+    if 'Time' in df.columns:
+        # Historian exports use 12-hour timestamps, so don't let the first row pin the format
+        times = pd.to_datetime(df['Time'], format='mixed')
+        out[6] = times.dt.hour.to_numpy()
+        out[7] = times.dt.day.to_numpy()
+    else:
+        out[6] = 0
+        out[7] = 1
+
+    readings = prepared_inputs(df).to_numpy(dtype=np.float64, na_value=np.nan)
+    window_feature_bank(readings, out=out[len(BASE_FEATURE_COLUMNS):])
+
+    np.nan_to_num(out, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    return out.T
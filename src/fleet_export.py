@@ -0,0 +1,146 @@
+"""One zip with every scored dataset, a fleet summary and the risk episodes
+
+    wells/<dataset>.csv   each dataset with its predictions (or .parquet)
+    fleet_summary.csv     one row per dataset: span, peak and mean risk,
+                          share of readings above each alert level, episodes
+    risk_episodes.csv     every sustained high-risk episode of every dataset
+
+Datasets are serialized on a small thread pool and written into the archive
+in order as each one finishes. Only as many serialized files as there are
+workers are in memory at any time, and the archive is built in a temporary
+file on disk that is handed to the download as it is, never read into a buffer
+here.
+"""
+import io
+import os
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from alerts import CRITICAL_THRESHOLD, WARNING_THRESHOLD, find_risk_episodes
+from ingest import dataset_name
+
+RISK_COLUMN = 'Predicted_Hydrate_Likelihood'
+TIME_COLUMN = 'Time'
+
+EXPORT_FORMATS = ('CSV', 'Parquet')
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def _extension(fmt):
+    return 'parquet' if fmt == 'Parquet' else 'csv'
+
+
+def serialize(df, fmt='CSV'):
+    """A frame as CSV or Parquet bytes"""
+    if fmt == 'Parquet':
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    return df.to_csv(index=False).encode()
+
+
+def member_name(name, taken):
+    """Archive-safe file name for a dataset, unique among those taken
+
+    The name carries no extension, even if the dataset was named after its
+    file, so the caller adds the export format's.
+    """
+    base = "".join(c if c.isalnum() or c in " ._-" else "_" for c in name).strip()
+    base = dataset_name(base).strip() or "dataset"
+    candidate, n = base, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{base} ({n})"
+    taken.add(candidate)
+    return candidate
+
+
+def fleet_episodes(frames, **rules):
+    """Risk episodes of every scored dataset"""
+    columns = ['dataset', 'start', 'end', 'level', 'peak', 'points']
+    episodes = []
+    for name, df in frames.items():
+        if RISK_COLUMN not in df.columns:
+            continue
+        times = df[TIME_COLUMN] if TIME_COLUMN in df.columns else None
+        found = find_risk_episodes(df[RISK_COLUMN].to_numpy(), times, **rules)
+        if len(found):
+            episodes.append(found.assign(dataset=name)[columns])
+    if not episodes:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(episodes, ignore_index=True)
+
+
+def fleet_summary(frames, episodes, warning=WARNING_THRESHOLD, critical=CRITICAL_THRESHOLD):
+    """One row per dataset with its span and risk figures"""
+    counts = episodes.groupby(['dataset', 'level']).size().unstack(fill_value=0) if len(episodes) else pd.DataFrame()
+    rows = []
+    for name, df in frames.items():
+        times = pd.to_datetime(df[TIME_COLUMN], format='mixed', errors='coerce') if TIME_COLUMN in df.columns else pd.Series(dtype='datetime64[ns]')
+        risk = df[RISK_COLUMN].to_numpy(dtype=np.float64) if RISK_COLUMN in df.columns else np.array([])
+        scored = len(risk) > 0 and not np.isnan(risk).all()
+        rows.append({
+            'dataset': name,
+            'rows': len(df),
+            'first_reading': times.min(),
+            'last_reading': times.max(),
+            'peak_risk': np.nanmax(risk) if scored else np.nan,
+            'mean_risk': np.nanmean(risk) if scored else np.nan,
+            'share_above_warning': np.mean(risk >= warning) if scored else np.nan,
+            'share_above_critical': np.mean(risk >= critical) if scored else np.nan,
+            'warning_episodes': int(counts.at[name, 'WARNING']) if 'WARNING' in counts and name in counts.index else 0,
+            'critical_episodes': int(counts.at[name, 'CRITICAL']) if 'CRITICAL' in counts and name in counts.index else 0,
+        })
+    return pd.DataFrame(rows)
+
+
+def write_fleet_zip(fileobj, frames, tables, fmt='CSV', max_workers=MAX_WORKERS):
+    """Write every frame under wells/ and every table at the top of a zip on fileobj
+
+    At most max_workers serializations are queued ahead of the archive
+    writer, so memory holds a few serialized files rather than all of them.
+    """
+    extension = _extension(fmt)
+    # Parquet is already compressed
+    compression = zipfile.ZIP_STORED if fmt == 'Parquet' else zipfile.ZIP_DEFLATED
+    taken = set()
+    members = [(f"wells/{member_name(name, taken)}.{extension}", df) for name, df in frames.items()]
+    members += [(f"{name}.{extension}", table) for name, table in tables.items()]
+
+    with zipfile.ZipFile(fileobj, 'w', compression) as archive, \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fleet-export') as pool:
+        pending = deque()
+        for path, df in members:
+            pending.append((path, pool.submit(serialize, df, fmt)))
+            if len(pending) >= max_workers:
+                path, future = pending.popleft()
+                archive.writestr(path, future.result())
+        while pending:
+            path, future = pending.popleft()
+            archive.writestr(path, future.result())
+
+
+def fleet_zip(frames, fmt='CSV', rules=None, max_workers=MAX_WORKERS):
+    """The whole-fleet export as an open temporary zip file, rewound to the start
+
+    The file is unbuffered so Streamlit's download button accepts it as raw
+    IO. It is deleted when closed or garbage collected.
+    """
+    rules = rules or {}
+    episodes = fleet_episodes(frames, **rules)
+    summary = fleet_summary(frames, episodes, rules.get('warning', WARNING_THRESHOLD),
+                            rules.get('critical', CRITICAL_THRESHOLD))
+    tables = {'fleet_summary': summary, 'risk_episodes': episodes}
+    spool = tempfile.TemporaryFile(buffering=0)
+    try:
+        write_fleet_zip(spool, frames, tables, fmt, max_workers)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
@@ -2,58 +2,136 @@ import streamlit as st
 from google.oauth2 import id_token
 from google_auth_oauthlib.flow import Flow
 import google.auth.transport.requests
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def _setting(name, default):
+    """Read a setting from the environment, then Streamlit secrets"""
+    if name in os.environ:
+        return os.environ[name]
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:
+        # No secrets.toml at all
+        return default
+
 
 # Google OAuth Configuration
 # You'll need to set these up in Google Cloud Console
-GOOGLE_CLIENT_ID = st.secrets.get("GOOGLE_CLIENT_ID", "your-client-id.apps.googleusercontent.com")
-GOOGLE_CLIENT_SECRET = st.secrets.get("GOOGLE_CLIENT_SECRET", "your-client-secret")
-REDIRECT_URI = "http://localhost:8501"
+GOOGLE_CLIENT_ID = _setting("GOOGLE_CLIENT_ID", "your-client-id.apps.googleusercontent.com")
+GOOGLE_CLIENT_SECRET = _setting("GOOGLE_CLIENT_SECRET", "your-client-secret")
+REDIRECT_URI = _setting("GOOGLE_REDIRECT_URI", "http://localhost:8501")
+
+# Endpoints can be pointed at a local stub server for testing
+AUTH_URI = _setting("GOOGLE_AUTH_URI", "https://accounts.google.com/o/oauth2/auth")
+TOKEN_URI = _setting("GOOGLE_TOKEN_URI", "https://oauth2.googleapis.com/token")
+USERINFO_URI = _setting("GOOGLE_USERINFO_URI", "https://www.googleapis.com/oauth2/v2/userinfo")
+
+SCOPES = [
+    'openid',
+    'https://www.googleapis.com/auth/userinfo.profile',
+    'https://www.googleapis.com/auth/userinfo.email'
+]
+
+# (connect, read) seconds; a slow identity provider fails the login instead of stalling it
+HTTP_TIMEOUT = (3.05, float(_setting("GOOGLE_HTTP_TIMEOUT", 10)))
+HTTP_RETRIES = 2
+HTTP_POOL_SIZE = 16
+
+# A sign-in must come back from Google within this many seconds of starting
+OAUTH_STATE_TTL = 600
+MAX_PENDING_LOGINS = 10_000
+
+
+def create_http_session(retries=HTTP_RETRIES, pool_size=HTTP_POOL_SIZE):
+    """Pooled HTTP session that retries connection failures and transient errors"""
+    # A slow provider is not retried, so a read timeout costs one timeout, not several.
+    # Only GETs are retried on error statuses; the token POST only if it never connected
+    retry = Retry(
+        total=retries,
+        read=0,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
 
 class GoogleAuth:
-    def __init__(self):
+    def __init__(self, session=None, timeout=HTTP_TIMEOUT):
         self.client_config = {
             "web": {
                 "client_id": GOOGLE_CLIENT_ID,
                 "client_secret": GOOGLE_CLIENT_SECRET,
-                "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                "token_uri": "https://oauth2.googleapis.com/token",
+                "auth_uri": AUTH_URI,
+                "token_uri": TOKEN_URI,
                 "redirect_uris": [REDIRECT_URI],
                 "issuer": "https://accounts.google.com",
                 "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs"
             }
         }
-        
-    def get_authorization_url(self):
-        """Generate Google OAuth authorization URL"""
-        flow = Flow.from_client_config(
-            self.client_config,
-            scopes=[
-                'openid',
-                'https://www.googleapis.com/auth/userinfo.profile',
-                'https://www.googleapis.com/auth/userinfo.email'
-            ],
-            redirect_uri=REDIRECT_URI
-        )
-        
-        auth_url, _ = flow.authorization_url(
+        self.session = session or create_http_session()
+        self.timeout = timeout
+        # state -> (PKCE code verifier, expiry) of sign-ins waiting for Google's redirect.
+        # The redirect reloads the page into a new session, so they are kept here, not in session state
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        # Every entry lives OAUTH_STATE_TTL, so the oldest expire first
+        now = time.monotonic()
+        while self._pending and (next(iter(self._pending.values()))[1] < now
+                                 or len(self._pending) > MAX_PENDING_LOGINS):
+            self._pending.popitem(last=False)
+
+    def start_login(self):
+        """A new sign-in with its own state and PKCE verifier: (auth_url, state, expiry)"""
+        flow = Flow.from_client_config(self.client_config, scopes=SCOPES, redirect_uri=REDIRECT_URI)
+        auth_url, state = flow.authorization_url(
             access_type='offline',
             include_granted_scopes='true'
         )
-        
-        return auth_url
-    
+        expiry = time.monotonic() + OAUTH_STATE_TTL
+        with self._lock:
+            self._pending[state] = (flow.code_verifier, expiry)
+            self._prune()
+        return auth_url, state, expiry
+
+    def claim_login(self, state):
+        """The pending sign-in a redirect's state belongs to, used at most once"""
+        with self._lock:
+            self._prune()
+            return self._pending.pop(state, None) if state else None
+
+    def get_authorization_url(self):
+        """This session's Google OAuth authorization URL, started on first use"""
+        login = st.session_state.get('oauth_login')
+        if login is None or login[2] < time.monotonic():
+            login = st.session_state.oauth_login = self.start_login()
+        return login[0]
+
     def verify_token(self, token):
         """Verify Google OAuth token and return user info"""
         try:
             # Verify the token
             idinfo = id_token.verify_oauth2_token(
-                token, 
-                google.auth.transport.requests.Request(), 
+                token,
+                google.auth.transport.requests.Request(session=self.session),
                 GOOGLE_CLIENT_ID
             )
-            
+
             # Extract user information
             user_info = {
                 'email': idinfo.get('email'),
@@ -61,62 +139,80 @@ class GoogleAuth:
                 'picture': idinfo.get('picture'),
                 'verified_email': idinfo.get('email_verified', False)
             }
-            
+
             return user_info
-            
+
         except ValueError as e:
             st.error(f"Token verification failed: {e}")
             return None
-    
-    def authenticate_user(self, authorization_code):
+
+    def exchange_code(self, authorization_code, code_verifier=None):
+        """Exchange an authorization code for an access token"""
+        data = {
+            'code': authorization_code,
+            'client_id': GOOGLE_CLIENT_ID,
+            'client_secret': GOOGLE_CLIENT_SECRET,
+            'redirect_uri': REDIRECT_URI,
+            'grant_type': 'authorization_code',
+        }
+        if code_verifier:
+            data['code_verifier'] = code_verifier
+        response = self.session.post(TOKEN_URI, data=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['access_token']
+
+    def authenticate_user(self, authorization_code, state=None):
         """Exchange authorization code for user information"""
+        # A redirect whose state this server did not issue, or already used, is forged or replayed
+        login = self.claim_login(state)
+        if login is None:
+            st.error("This sign-in link has expired or was not started here. Please sign in again.")
+            st.query_params.clear()
+            return None
+
         try:
-            flow = Flow.from_client_config(
-                self.client_config,
-                scopes=[
-                    'openid',
-                    'https://www.googleapis.com/auth/userinfo.profile',
-                    'https://www.googleapis.com/auth/userinfo.email'
-                ],
-                redirect_uri=REDIRECT_URI
-            )
-            
             # Exchange authorization code for access token
-            flow.fetch_token(code=authorization_code)
-            
-            # Get user info using the access token instead of ID token
-            credentials = flow.credentials
-            
-            # Use the access token to get user info from Google's API
-            import requests
-            
+            access_token = self.exchange_code(authorization_code, login[0])
+
             # Get user info from Google's userinfo endpoint
-            user_info_response = requests.get(
-                'https://www.googleapis.com/oauth2/v2/userinfo',
-                headers={'Authorization': f'Bearer {credentials.token}'}
+            user_info_response = self.session.get(
+                USERINFO_URI,
+                headers={'Authorization': f'Bearer {access_token}'},
+                timeout=self.timeout
             )
-            
+
             if user_info_response.status_code == 200:
                 user_data = user_info_response.json()
-                
+
                 user_info = {
                     'email': user_data.get('email'),
                     'name': user_data.get('name'),
                     'picture': user_data.get('picture'),
                     'verified_email': user_data.get('verified_email', False)
                 }
-                
+
                 return user_info
             else:
                 st.error(f"Failed to get user info: {user_info_response.status_code}")
                 return None
-            
+
+        except requests.Timeout:
+            st.error("Google sign-in timed out. Please try again.")
+            st.query_params.clear()
+            return None
         except Exception as e:
             st.error(f"Authentication failed: {e}")
             # Clear query params to prevent repeated errors
             st.query_params.clear()
             return None
 
+
+@st.cache_resource
+def get_google_auth():
+    """Process-wide Google OAuth client with a shared connection pool"""
+    return GoogleAuth()
+
+
 def is_google_auth_configured():
     """Check if Google OAuth is properly configured"""
     return (
@@ -0,0 +1,157 @@
+"""Training core for the hydrate model
+
+Nothing in here touches the UI, so the same code trains the initial model on
+the page and retrains it in a worker process.
+"""
+import copy
+import os
+import threading
+import time
+
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import KFold, cross_val_score, train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from features import FEATURE_COLUMNS
+from feature_store import FeatureStore
+from training_set import LABEL_COLUMN, build_training_set
+
+# A retrained model is only published if it clears these
+MIN_R2 = 0.5
+MAX_R2_DROP = 0.02
+
+# Incremental updates retire the oldest trees beyond this many
+MAX_TREES = 150
+
+# Cap on training rows; unset, every labeled row is used
+TRAINING_MAX_ROWS_ENV = "HYDRATE_TRAINING_MAX_ROWS"
+
+
+def training_max_rows():
+    """Configured cap on training rows, or None"""
+    value = os.environ.get(TRAINING_MAX_ROWS_ENV)
+    return int(value) if value else None
+
+
+def load_training_set(max_rows=None, store=None):
+    """Labeled training set from every well, sampled by well and risk band
+
+    max_rows defaults to the configured cap; below the number of labeled rows
+    it is spread evenly over well and risk band strata.
+    """
+    store = store or FeatureStore(os.environ.get("HYDRATE_FEATURE_STORE"))
+    if max_rows is None:
+        max_rows = training_max_rows()
+    return build_training_set(max_rows=max_rows, store=store)
+
+
+def training_matrix(df, store=None):
+    """Feature matrix and labels for a labeled frame"""
+    store = store or FeatureStore(os.environ.get("HYDRATE_FEATURE_STORE"))
+    return store.features(df), df[LABEL_COLUMN].to_numpy()
+
+
+def fit_hydrate_model(X, y, n_estimators=100, random_state=42, n_jobs=None):
+    """Fit scaler and forest on a train split and score them on the held-out rows"""
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=random_state)
+
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state, n_jobs=n_jobs)
+    model.fit(X_train_scaled, y_train)
+
+    y_pred = model.predict(X_test_scaled)
+    metrics = {
+        'mse': float(mean_squared_error(y_test, y_pred)),
+        'r2': float(r2_score(y_test, y_pred)),
+        'rows': int(len(y)),
+    }
+    return model, scaler, metrics
+
+
+def evaluate_model(model, scaler, X, y):
+    """Hold-out metrics for a fitted scaler and forest"""
+    y_pred = model.predict(scaler.transform(X))
+    return {'mse': float(mean_squared_error(y, y_pred)), 'r2': float(r2_score(y, y_pred))}
+
+
+def update_hydrate_model(model, scaler, X_new, y_new, new_trees=20, max_trees=MAX_TREES, random_state=None):
+    """Grow the forest with trees fitted only on new rows and retire the oldest ones
+
+    The scaler is kept as is, because the existing trees split on features
+    scaled by it. The published model is left untouched: the update works on
+    a shallow copy that shares the surviving trees.
+    """
+    fresh = RandomForestRegressor(n_estimators=new_trees, random_state=random_state)
+    fresh.set_params(**{name: value for name, value in model.get_params().items()
+                        if name not in ('n_estimators', 'random_state', 'warm_start')})
+    fresh.fit(scaler.transform(X_new), y_new)
+
+    updated = copy.copy(model)
+    updated.estimators_ = (list(model.estimators_) + list(fresh.estimators_))[-max_trees:]
+    updated.n_estimators = len(updated.estimators_)
+    return updated
+
+
+def cross_validate(X, y, folds=5, n_estimators=100, random_state=42, n_jobs=None):
+    """R² of each cross-validation fold; folds run in parallel with n_jobs"""
+    pipeline = make_pipeline(StandardScaler(), RandomForestRegressor(n_estimators=n_estimators, random_state=random_state))
+    splitter = KFold(n_splits=folds, shuffle=True, random_state=random_state)
+    return cross_val_score(pipeline, X, y, cv=splitter, scoring='r2', n_jobs=n_jobs)
+
+
+def passes_gate(candidate, current=None, min_r2=MIN_R2, max_r2_drop=MAX_R2_DROP):
+    """Whether candidate metrics are good enough to replace the current model"""
+    r2 = candidate.get('cv_r2', candidate['r2'])
+    if r2 < min_r2:
+        return False, f"R² {r2:.4f} is below the minimum of {min_r2}"
+    if current is not None and candidate['r2'] < current['r2'] - max_r2_drop:
+        return False, f"R² {candidate['r2']:.4f} is worse than the current model's {current['r2']:.4f}"
+    return True, "passed"
+
+
+class ModelVersion:
+    """A trained model with everything needed to score and compare it
+
+    ``profile`` sketches the inputs the model was trained on, for drift checks.
+    """
+
+    def __init__(self, model, scaler, feature_columns, metrics, source="initial", profile=None):
+        self.model = model
+        self.scaler = scaler
+        self.feature_columns = list(feature_columns)
+        self.metrics = metrics
+        self.source = source
+        self.profile = profile
+        self.version = None
+        self.published_at = None
+
+
+class ModelRegistry:
+    """Holds the model every session scores with and swaps it atomically"""
+
+    def __init__(self):
+        self._current = None
+        self._lock = threading.Lock()
+        self.history = []
+
+    def current(self):
+        return self._current
+
+    def publish(self, candidate):
+        """Make candidate the current model; readers see the old one or the new one, never a mix"""
+        with self._lock:
+            candidate.version = len(self.history) + 1
+            candidate.published_at = time.strftime('%Y-%m-%d %H:%M:%S')
+            self.history.append({
+                'version': candidate.version,
+                'source': candidate.source,
+                'published_at': candidate.published_at,
+                **candidate.metrics,
+            })
+            self._current = candidate
+        return candidate.version
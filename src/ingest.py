@@ -0,0 +1,71 @@
+"""Read uploaded well data from plain, compressed and archived files
+
+Supported uploads:
+
+    .csv            one dataset
+    .csv.gz / .gz   one dataset, gzip-compressed
+    .parquet        one dataset
+    .zip            one dataset per CSV, CSV.GZ or Parquet member
+
+Compressed data is never inflated in full: the gzip and zip readers hand the
+CSV parser decompressed chunks as it asks for them.
+"""
+import gzip
+import os
+import zipfile
+
+import pandas as pd
+
+UPLOAD_TYPES = ['csv', 'gz', 'zip', 'parquet']
+DATA_SUFFIXES = ('.csv', '.csv.gz', '.gz', '.parquet')
+
+
+def dataset_name(filename, keep_dirs=False):
+    """Dataset name for a file: its base name (or whole path) without data or compression suffixes"""
+    name = filename if keep_dirs else os.path.basename(filename)
+    for suffix in ('.gz', '.csv', '.parquet'):
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def read_table(fileobj, filename):
+    """Parse one CSV, gzip-compressed CSV or Parquet file object"""
+    lower = filename.lower()
+    if lower.endswith('.parquet'):
+        return pd.read_parquet(fileobj)
+    if lower.endswith('.gz'):
+        # GzipFile inflates on demand as the parser reads
+        with gzip.GzipFile(fileobj=fileobj) as stream:
+            return pd.read_csv(stream)
+    return pd.read_csv(fileobj)
+
+
+def _archive_members(archive):
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or os.path.basename(name).startswith('.') or '__MACOSX' in name:
+            continue
+        if name.lower().endswith(DATA_SUFFIXES):
+            yield info
+
+
+def read_upload(fileobj, filename):
+    """Datasets in an uploaded file as (name, DataFrame) pairs"""
+    if not filename.lower().endswith('.zip'):
+        return [(dataset_name(filename), read_table(fileobj, filename))]
+
+    datasets = []
+    with zipfile.ZipFile(fileobj) as archive:
+        members = list(_archive_members(archive))
+        if not members:
+            raise ValueError("The archive contains no CSV or Parquet files")
+        # Members with the same name in different folders keep their path, so neither replaces the other
+        names = [dataset_name(info.filename) for info in members]
+        for info, name in zip(members, names):
+            if names.count(name) > 1:
+                name = dataset_name(info.filename, keep_dirs=True)
+            # Members are decompressed as the parser reads them
+            with archive.open(info) as member:
+                datasets.append((name, read_table(member, info.filename)))
+    return datasets
@@ -0,0 +1,191 @@
+"""Per-stage latency histograms for the hot paths of the app
+
+Wrap a stage in ``timed`` (or decorate a function with ``timed_function``)
+and its duration is recorded against the stage name and the size of the
+data it handled:
+
+    with timed('csv_parse') as timer:
+        df = pd.read_csv(path)
+        timer.rows = len(df)
+
+Durations are kept as Prometheus-style cumulative histograms per stage and
+dataset size bucket, plus a window of recent samples for the admin
+diagnostics page. If ``HYDRATE_METRICS_FILE`` is set, the histograms are
+written there in the Prometheus text format (at most every
+``HYDRATE_METRICS_INTERVAL`` seconds, default 10) for a node exporter
+textfile collector to pick up.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Upper bounds in seconds, as for a Prometheus histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Dataset size buckets: rows up to each bound
+SIZE_BUCKETS = ((1_000, '1k'), (10_000, '10k'), (100_000, '100k'), (1_000_000, '1M'))
+
+RECENT_SAMPLES = 5000
+METRIC_NAME = 'hydrate_stage_duration_seconds'
+
+logger = logging.getLogger(__name__)
+
+
+def size_bucket(rows):
+    """Label of the size bucket a dataset of `rows` rows falls in"""
+    if rows is None:
+        return 'unknown'
+    for bound, label in SIZE_BUCKETS:
+        if rows <= bound:
+            return label
+    return '+Inf'
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.rows = 0
+
+    def observe(self, seconds, rows):
+        self.counts[np.searchsorted(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.rows += rows or 0
+
+
+class StageMetrics:
+    """Thread-safe latency histograms keyed by stage and size bucket"""
+
+    def __init__(self, path=None, write_interval=10.0):
+        self.path = path
+        self.write_interval = write_interval
+        self._histograms = {}
+        self._recent = deque(maxlen=RECENT_SAMPLES)
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self.write_errors = 0
+
+    def record(self, stage, seconds, rows=None):
+        bucket = size_bucket(rows)
+        with self._lock:
+            histogram = self._histograms.get((stage, bucket))
+            if histogram is None:
+                histogram = self._histograms[(stage, bucket)] = _Histogram()
+            histogram.observe(seconds, rows)
+            self._recent.append((time.time(), stage, bucket, rows, seconds))
+            due = self.path and time.monotonic() - self._last_write >= self.write_interval
+            if due:
+                self._last_write = time.monotonic()
+        if due:
+            self.write_textfile()
+
+    def recent(self):
+        """Recent samples, oldest first"""
+        with self._lock:
+            samples = list(self._recent)
+        frame = pd.DataFrame(samples, columns=['time', 'stage', 'size', 'rows', 'seconds'])
+        frame['time'] = pd.to_datetime(frame['time'], unit='s')
+        return frame
+
+    def summary(self):
+        """Count and latency percentiles per stage and size bucket over the recent samples"""
+        recent = self.recent()
+        if recent.empty:
+            return pd.DataFrame(columns=['stage', 'size', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms', 'rows_per_s'])
+        grouped = recent.groupby(['stage', 'size'], sort=True)
+        milliseconds = grouped['seconds']
+        summary = pd.DataFrame({
+            'count': milliseconds.size(),
+            'mean_ms': milliseconds.mean() * 1000,
+            'p50_ms': milliseconds.quantile(0.5) * 1000,
+            'p95_ms': milliseconds.quantile(0.95) * 1000,
+            'max_ms': milliseconds.max() * 1000,
+            'rows_per_s': grouped['rows'].sum() / milliseconds.sum().where(milliseconds.sum() > 0),
+        })
+        return summary.round(2).reset_index()
+
+    def prometheus_text(self):
+        """All histograms in the Prometheus text exposition format"""
+        with self._lock:
+            snapshot = [(key, h.counts.copy(), h.sum, h.rows) for key, h in sorted(self._histograms.items())]
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in each processing stage, by dataset size bucket",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        for (stage, bucket), counts, total, _ in snapshot:
+            labels = f'stage="{stage}",size="{bucket}"'
+            cumulative = np.cumsum(counts)
+            for bound, count in zip(LATENCY_BUCKETS, cumulative):
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {cumulative[-1]}')
+            lines.append(f'{METRIC_NAME}_sum{{{labels}}} {total:.6f}')
+            lines.append(f'{METRIC_NAME}_count{{{labels}}} {cumulative[-1]}')
+        lines += [
+            "# HELP hydrate_stage_rows_total Rows processed by each stage",
+            "# TYPE hydrate_stage_rows_total counter",
+        ]
+        for (stage, bucket), _, _, rows in snapshot:
+            lines.append(f'hydrate_stage_rows_total{{stage="{stage}",size="{bucket}"}} {rows}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=None):
+        """Write the histograms to the metrics file, replacing it atomically"""
+        path = path or self.path
+        if not path:
+            return
+        try:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as handle:
+                handle.write(self.prometheus_text())
+            # Scrapers never see a half-written file
+            os.replace(tmp, path)
+        except OSError:
+            self.write_errors += 1
+            logger.exception("Could not write metrics to %s", path)
+
+
+@st.cache_resource
+def get_stage_metrics():
+    """Process-wide stage metrics shared by every session"""
+    return StageMetrics(os.environ.get("HYDRATE_METRICS_FILE"),
+                        float(os.environ.get("HYDRATE_METRICS_INTERVAL", 10)))
+
+
+class _Timer:
+    def __init__(self, stage, rows):
+        self.stage = stage
+        self.rows = rows
+        self.seconds = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        get_stage_metrics().record(self.stage, self.seconds, self.rows)
+        return False
+
+
+def timed(stage, rows=None):
+    """Context manager timing one stage; set `.rows` inside if not known up front"""
+    return _Timer(stage, rows)
+
+
+def timed_function(stage):
+    """Decorator timing every call, sized by the length of the first argument"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = len(args[0]) if args and hasattr(args[0], '__len__') else None
+            with timed(stage, rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
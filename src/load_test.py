@@ -0,0 +1,412 @@
+"""Concurrent-session load test for the Streamlit app
+
+The harness starts ``streamlit run app.py`` (or uses a server already running
+at --url) and connects simulated users to it over Streamlit's websocket
+protocol, the way browsers do. Each session walks through the app:
+
+    open      first page load
+    login     sign in with the local account
+    navigate  open the upload page
+    upload    batch upload every data file
+    analysis  open the analysis page, which scores the first dataset
+    select    switch to each of the other datasets
+    chart     switch through every chart type
+    export    download the dataset with predictions
+
+The sessions of a level are spread over --processes client processes, so
+the clients do not contend with each other for one interpreter, and the
+server runs their reruns exactly as it would for real users: concurrently,
+sharing the cached model, feature store and alert engine. A rerun's latency
+is the time from sending the widget change until the server reports the
+script has stopped running. For each concurrency level the harness reports
+rerun latency percentiles, throughput and the server's resident memory:
+
+    python src/load_test.py --sessions 1 2 4 8
+    python src/load_test.py --sessions 4 16 --files 'data/*_*H-*.csv' --think-time 1 --csv load.csv
+    python src/load_test.py --url http://localhost:8501 --sessions 8
+
+The model is trained by a warm-up session before the first level, so the
+levels measure steady-state reruns. Server memory is only reported for a
+server the harness started itself.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from memory_accounting import process_rss
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+DEFAULT_FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', '*.csv')
+STEPS = ('open', 'login', 'navigate', 'upload', 'analysis', 'select', 'chart', 'export')
+XSRF_COOKIE = '_streamlit_xsrf'
+MAX_MESSAGE_SIZE = 200 * 1024 * 1024
+
+
+class SessionFailed(Exception):
+    """A simulated session hit an exception in the app and cannot continue"""
+
+
+class SimulatedSession:
+    """One user's walk through the app over its own websocket, timing every rerun"""
+
+    def __init__(self, url, files, username, password, timeout, think_time=0.0, xsrf=None):
+        self.url = url.rstrip('/')
+        self.files = files
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.think_time = think_time
+        self.xsrf = xsrf
+        self.socket = None
+        self.session_id = None
+        self.page_hash = ''
+        self.file_urls = None
+        self.rerun_requested = False
+        # Widgets the last rerun drew, by (element type, label) or component name
+        self.widgets = {}
+        # Widget values this user has set, sent with every rerun as a browser does
+        self.states = {}
+        self.errors = []
+        self.samples = []
+
+    def _widget(self, kind, label):
+        try:
+            return self.widgets[(kind, label)]
+        except KeyError:
+            raise SessionFailed(f"no {kind} {label!r} on the page") from None
+
+    def _set(self, widget_id, **value):
+        state = WidgetState(id=widget_id, **value)
+        self.states[widget_id] = state
+        return state
+
+    def _read(self, message):
+        msg = ForwardMsg()
+        msg.ParseFromString(message)
+        kind = msg.WhichOneof('type')
+        if kind == 'new_session':
+            self.session_id = self.session_id or msg.new_session.initialize.session_id
+            self.page_hash = msg.new_session.page_script_hash
+            self.widgets = {}
+        elif kind == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+            element = msg.delta.new_element
+            name = element.WhichOneof('type')
+            if name == 'exception':
+                self.errors.append(f"{element.exception.type}: {element.exception.message.splitlines()[0]}")
+            elif name == 'component_instance':
+                self.widgets[(name, element.component_instance.component_name)] = element.component_instance
+            elif name is not None and hasattr(getattr(element, name), 'label'):
+                widget = getattr(element, name)
+                if getattr(widget, 'id', None):
+                    self.widgets[(name, widget.label)] = widget
+        elif kind == 'script_finished':
+            # A run stopped by st.rerun() is followed by the run it asked for
+            self.rerun_requested = msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN
+        elif kind == 'session_status_changed':
+            return msg.session_status_changed.script_is_running
+        elif kind == 'file_urls_response':
+            self.file_urls = msg.file_urls_response
+        return None
+
+    async def _until_idle(self):
+        """Read the server's messages until the rerun, and any st.rerun() it started, has stopped"""
+        running = False
+        while True:
+            message = await asyncio.wait_for(self.socket.recv(), self.timeout)
+            if isinstance(message, bytes):
+                status = self._read(message)
+                running = running or status is True
+                if running and status is False and not self.rerun_requested:
+                    return
+
+    async def _run(self, step, trigger=None):
+        if self.samples and self.think_time:
+            await asyncio.sleep(self.think_time)
+        msg = BackMsg()
+        rerun = msg.rerun_script
+        rerun.page_script_hash = self.page_hash
+        rerun.widget_states.widgets.extend(self.states.values())
+        if trigger is not None:
+            rerun.widget_states.widgets.append(trigger)
+        self.errors = []
+        started = time.perf_counter()
+        await self.socket.send(msg.SerializeToString())
+        await self._until_idle()
+        latency = time.perf_counter() - started
+        error = "; ".join(self.errors) or None
+        self.samples.append((step, latency, error))
+        if error:
+            raise SessionFailed(f"{step}: {error}")
+
+    def _put(self, upload_url, name, content):
+        boundary = uuid.uuid4().hex
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{name}"\r\n'
+                f'Content-Type: text/csv\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+        request = urllib.request.Request(self.url + upload_url, data=body, method='PUT', headers={
+            'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        if self.xsrf:
+            request.add_header('X-Xsrftoken', self.xsrf)
+            request.add_header('Cookie', f'{XSRF_COOKIE}={self.xsrf}')
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+    async def _upload(self, widget_id):
+        """Upload the files the way the browser's file uploader does, then rerun"""
+        self.file_urls = None
+        msg = BackMsg()
+        msg.file_urls_request.request_id = uuid.uuid4().hex
+        msg.file_urls_request.session_id = self.session_id
+        msg.file_urls_request.file_names.extend(os.path.basename(path) for path, _ in self.files)
+        started = time.perf_counter()
+        await self.socket.send(msg.SerializeToString())
+        await asyncio.wait_for(self._wait_for_file_urls(), self.timeout)
+        state = self._set(widget_id)
+        for (path, content), urls in zip(self.files, self.file_urls.file_urls):
+            await asyncio.to_thread(self._put, urls.upload_url, os.path.basename(path), content)
+            info = state.file_uploader_state_value.uploaded_file_info.add()
+            info.name = os.path.basename(path)
+            info.size = len(content)
+            info.file_id = urls.file_id
+            info.file_urls.CopyFrom(urls)
+        sent = time.perf_counter() - started
+        await self._run('upload')
+        step, latency, error = self.samples[-1]
+        self.samples[-1] = (step, latency + sent, error)
+
+    async def _wait_for_file_urls(self):
+        while self.file_urls is None:
+            message = await self.socket.recv()
+            if isinstance(message, bytes):
+                self._read(message)
+
+    async def _menu(self, page):
+        menu = self._widget('component_instance', 'streamlit_option_menu.option_menu')
+        self._set(menu.id, json_value=json.dumps(page))
+
+    async def run(self):
+        ws_url = 'ws' + self.url[len('http'):] + '/_stcore/stream'
+        headers = {'Cookie': f'{XSRF_COOKIE}={self.xsrf}'} if self.xsrf else None
+        try:
+            async with websockets.connect(ws_url, subprotocols=['streamlit'], additional_headers=headers,
+                                          max_size=MAX_MESSAGE_SIZE, open_timeout=self.timeout) as self.socket:
+                await self._run('open')
+
+                self._set(self._widget('text_input', "Username").id, string_value=self.username)
+                self._set(self._widget('text_input', "Password").id, string_value=self.password)
+                await self._run('login', WidgetState(id=self._widget('button', "Login").id, trigger_value=True))
+                if ('button', "Logout") not in self.widgets:
+                    raise SessionFailed("login: credentials were rejected")
+
+                await self._menu("Upload Data")
+                await self._run('navigate')
+
+                uploader = next((w for (kind, _), w in self.widgets.items()
+                                 if kind == 'file_uploader' and w.multiple_files), None)
+                if uploader is None:
+                    raise SessionFailed("navigate: no batch file uploader on the page")
+                await self._upload(uploader.id)
+
+                await self._menu("Data Analysis")
+                await self._run('analysis')
+
+                datasets = self._widget('selectbox', "Select dataset for analysis:")
+                for name in datasets.options[1:]:
+                    self._set(datasets.id, string_value=name)
+                    await self._run('select')
+
+                charts = self._widget('selectbox', "Select visualization type:")
+                for chart in charts.options[1:]:
+                    self._set(charts.id, string_value=chart)
+                    await self._run('chart')
+
+                download = next((w for (kind, _), w in self.widgets.items() if kind == 'download_button'), None)
+                if download is None:
+                    raise SessionFailed("export: no download button on the page")
+                await self._run('export', WidgetState(id=download.id, trigger_value=True))
+        except SessionFailed as e:
+            if not self.samples or self.samples[-1][2] is None:
+                self.samples.append(('harness', 0.0, str(e)))
+        except Exception as e:
+            # The connection dropped or a rerun never finished
+            self.samples.append(('harness', 0.0, f"{type(e).__name__}: {e}"))
+        return self.samples
+
+
+def read_files(pattern):
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise SystemExit(f"No files match {pattern}")
+    files = []
+    for path in paths:
+        with open(path, 'rb') as handle:
+            files.append((path, handle.read()))
+    return files
+
+
+def xsrf_token(url):
+    """The XSRF cookie the server hands a browser, or None when the server does not use one"""
+    with urllib.request.urlopen(url.rstrip('/') + '/_stcore/health', timeout=10) as response:
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, rest = header.partition('=')
+            if name.strip() == XSRF_COOKIE:
+                return rest.split(';')[0]
+    return None
+
+
+def _run_sessions(url, count, start_at, files, username, password, timeout, think_time):
+    """Client process: run `count` sessions concurrently once the wall clock reaches start_at"""
+    xsrf = xsrf_token(url)
+
+    async def simulate():
+        sessions = [SimulatedSession(url, files, username, password, timeout, think_time, xsrf)
+                    for _ in range(count)]
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        return await asyncio.gather(*(session.run() for session in sessions))
+
+    return [sample for samples in asyncio.run(simulate()) for sample in samples]
+
+
+def run_level(url, sessions, files, username, password, timeout, think_time=0.0, processes=1, server_pid=None):
+    """Run `sessions` simulated sessions at once from `processes` client processes
+
+    Returns every timed rerun, the wall time and the server's RSS before and after.
+    """
+    processes = max(1, min(processes, sessions))
+    shares = [sessions // processes + (i < sessions % processes) for i in range(processes)]
+    # Leave the client processes time to start so every session begins together
+    start_at = time.time() + 1.0 + 0.2 * processes
+
+    rss_before = process_rss(server_pid) if server_pid else None
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_run_sessions, url, share, start_at, files, username, password, timeout, think_time)
+                   for share in shares]
+        results = [future.result() for future in futures]
+    elapsed = time.time() - start_at
+    rss_after = process_rss(server_pid) if server_pid else None
+
+    samples = pd.DataFrame([sample for result in results for sample in result],
+                           columns=['step', 'latency', 'error'])
+    return samples, elapsed, rss_before, rss_after
+
+
+def summarize(sessions, samples, elapsed, rss_before, rss_after):
+    """One report row for a concurrency level"""
+    ok = samples[samples['error'].isna()]
+    latency = ok['latency'].to_numpy()
+    p50, p95, p99 = np.percentile(latency, [50, 95, 99]) * 1000 if len(latency) else (np.nan,) * 3
+    mb = 1024 * 1024
+    return {
+        'sessions': sessions,
+        'reruns': len(ok),
+        'errors': int(samples['error'].notna().sum()),
+        'p50_ms': round(p50, 1),
+        'p95_ms': round(p95, 1),
+        'p99_ms': round(p99, 1),
+        'mean_ms': round(latency.mean() * 1000, 1) if len(latency) else np.nan,
+        'reruns_per_s': round(len(ok) / elapsed, 2),
+        'elapsed_s': round(elapsed, 2),
+        'rss_mb': round(rss_after / mb, 1) if rss_after else None,
+        'rss_growth_mb': round((rss_after - rss_before) / mb, 1) if rss_after and rss_before else None,
+    }
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(timeout=60):
+    """Start `streamlit run app.py` on a free port; returns (process, url) once it is healthy"""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP_PATH, '--server.headless', 'true',
+         '--server.address', '127.0.0.1', '--server.port', str(port),
+         '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"streamlit run exited with code {server.returncode}")
+        try:
+            urllib.request.urlopen(url + '/_stcore/health', timeout=1).close()
+            return server, url
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise SystemExit(f"The server did not become healthy within {timeout} seconds")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the app with concurrent simulated sessions")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="concurrency levels to run, in order")
+    parser.add_argument("--files", default=DEFAULT_FILES, help="glob of CSV files each session uploads")
+    parser.add_argument("--url", help="test the server already running here instead of starting one")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="client processes the sessions of a level are spread over")
+    parser.add_argument("--username", default=os.environ.get("HYDRATE_LOAD_TEST_USER", "admin"))
+    parser.add_argument("--password", default=os.environ.get("HYDRATE_LOAD_TEST_PASSWORD", "password"))
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds each user waits between actions")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds a single rerun may take")
+    parser.add_argument("--no-warmup", action="store_true", help="skip the session that trains the model first")
+    parser.add_argument("--csv", help="also write the report to this CSV file")
+    parser.add_argument("--steps", action="store_true", help="also print latency per step")
+    args = parser.parse_args(argv)
+
+    files = read_files(args.files)
+    print(f"{len(files)} files, {sum(len(content) for _, content in files) / 1024 / 1024:.1f} MB per session")
+
+    server, url = (None, args.url) if args.url else start_server()
+    server_pid = server.pid if server else None
+    login = (args.username, args.password)
+    try:
+        if not args.no_warmup:
+            start = time.perf_counter()
+            samples, *_ = run_level(url, 1, files, *login, args.timeout)
+            print(f"Warm-up session: {time.perf_counter() - start:.1f}s, {samples['error'].notna().sum()} errors")
+
+        report = []
+        for sessions in args.sessions:
+            samples, elapsed, rss_before, rss_after = run_level(url, sessions, files, *login, args.timeout,
+                                                                args.think_time, args.processes, server_pid)
+            row = summarize(sessions, samples, elapsed, rss_before, rss_after)
+            report.append(row)
+            print(f"{sessions:>4} sessions: p50 {row['p50_ms']:>8.1f} ms  p95 {row['p95_ms']:>8.1f} ms  "
+                  f"p99 {row['p99_ms']:>8.1f} ms  {row['reruns_per_s']:>6.2f} reruns/s  "
+                  f"RSS {row['rss_mb']} MB  errors {row['errors']}")
+            if args.steps:
+                by_step = samples[samples['error'].isna()].groupby('step')['latency']
+                print((by_step.describe(percentiles=[0.5, 0.95])[['count', '50%', '95%', 'max']] * [1, 1000, 1000, 1000])
+                      .reindex([s for s in STEPS if s in by_step.groups]).round(1).to_string())
+            for error in samples['error'].dropna().unique()[:5]:
+                print(f"      error: {error}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    report = pd.DataFrame(report)
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Process-wide accounting of the memory sessions hold
+
+Every Streamlit session keeps its own copies of uploaded datasets, scored
+frames and table views in ``st.session_state``, and nothing else can see
+them. ``track_session`` (called once per run) keeps a small record in the
+session's state that references those containers, and registers it weakly
+with the process-wide ``MemoryRegistry``, so closed sessions drop out on
+their own. The admin diagnostics page can then size every session by
+category and clear the data of sessions that have been idle too long,
+including the files they follow.
+
+Shared objects (the global model, per-well models, the training set and the
+feature store) are registered once with ``register_shared`` and reported
+separately so they are not charged to every session that uses them.
+
+Eviction clears an idle session's containers from the admin's thread, as an
+idle session runs no script that could clear them itself. The record's lock
+keeps a run from starting half way through: ``track_session`` takes it first
+thing, and eviction re-checks the idle time under it. The next run then
+finds the session evicted and reloads its saved datasets.
+
+``tracemalloc`` sampling is off unless an admin starts it, as it slows every
+allocation down while it runs.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Session state keys holding per-session data, and what they are charged as
+SESSION_KEYS = {
+    'uploaded_datasets': 'datasets',
+    'quarantine_reports': 'datasets',
+    'ingested_uploads': 'datasets',
+    'scored_datasets': 'predictions',
+    'time_indexes': 'views',
+    'table_view': 'views',
+    'well_alignments': 'views',
+    'rollups': 'views',
+    'drift_profiles': 'views',
+    'query_result': 'views',
+    'followers': 'streams',
+}
+CATEGORIES = ('datasets', 'predictions', 'views', 'streams', 'models')
+
+# Containers deeper than this are not followed when sizing
+MAX_DEPTH = 6
+
+TRACEMALLOC_FRAMES = 10
+
+
+class _Sizer:
+    """Walk objects once each, adding their sizes to per-category totals"""
+
+    def __init__(self, skip=()):
+        # Imported here: the modules holding shared objects import this one to register them
+        from hydrate_model import ModelVersion
+        from streaming import StreamFollower
+        from well_models import model_nbytes
+        self.model_type = ModelVersion
+        self.follower_type = StreamFollower
+        self.model_nbytes = model_nbytes
+        self.seen = set(skip)
+        self.totals = dict.fromkeys(CATEGORIES, 0)
+
+    def add(self, obj, category, depth=0):
+        if id(obj) in self.seen or depth > MAX_DEPTH:
+            return
+        self.seen.add(id(obj))
+
+        if isinstance(obj, (pd.DataFrame, pd.Series)):
+            self.totals[category] += int(np.sum(obj.memory_usage(deep=True, index=True)))
+        elif isinstance(obj, np.memmap):
+            # File-backed; the page cache holds it, not the session
+            return
+        elif isinstance(obj, np.ndarray):
+            self.totals[category] += obj.nbytes
+        elif isinstance(obj, self.model_type):
+            self.totals['models'] += self.model_nbytes(obj.model)
+        elif isinstance(obj, self.follower_type):
+            # Only the rows it buffers; its scoring function points at the shared model
+            self.add(obj.buffers(), category, depth + 1)
+        elif isinstance(obj, dict):
+            self.totals[category] += sys.getsizeof(obj)
+            # Snapshot first: another session's script thread may be changing it
+            for key, value in list(obj.items()):
+                self.add(key, category, depth + 1)
+                self.add(value, category, depth + 1)
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            self.totals[category] += sys.getsizeof(obj)
+            for value in list(obj):
+                self.add(value, category, depth + 1)
+        elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+            self.totals[category] += sys.getsizeof(obj)
+            self.add(vars(obj), category, depth + 1)
+        else:
+            self.totals[category] += sys.getsizeof(obj)
+
+
+class SessionRecord:
+    """What one session holds, kept in its own session state"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.user = ""
+        self.started = time.time()
+        self.last_seen = self.started
+        self.containers = {}
+        self.evicted_at = None
+        self.reload_pending = False
+        self.lock = threading.Lock()
+
+    def evict(self, cutoff):
+        """Stop the session's followers and clear its data if it was last seen before cutoff
+
+        Returns whether it did. Called from the admin's thread.
+        """
+        with self.lock:
+            if self.last_seen >= cutoff:
+                return False
+            for follower in list(self.containers.get('followers', {}).values()):
+                follower.stop(wait=False)
+            for container in self.containers.values():
+                container.clear()
+            self.evicted_at = time.time()
+            self.reload_pending = True
+            return True
+
+
+class MemoryRegistry:
+    """Weak registry of live sessions and shared objects"""
+
+    def __init__(self):
+        self._sessions = weakref.WeakValueDictionary()
+        self._shared = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    def register_session(self, record):
+        with self._lock:
+            self._sessions[record.session_id] = record
+
+    def register_shared(self, name, obj):
+        with self._lock:
+            self._shared[name] = obj
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def _size_shared(self):
+        with self._lock:
+            shared = dict(self._shared)
+        sizer = _Sizer()
+        usage = {}
+        for name, obj in shared.items():
+            before = sum(sizer.totals.values())
+            sizer.add(obj, 'models')
+            usage[name] = sum(sizer.totals.values()) - before
+        return sizer, usage
+
+    def shared_usage(self):
+        """Bytes held by each shared object"""
+        return self._size_shared()[1]
+
+    def session_usage(self):
+        """One row per live session: bytes by category, largest first"""
+        # Anything reachable from a shared object, like the current model, is charged to no session
+        shared, _ = self._size_shared()
+        now = time.time()
+        rows = []
+        for record in self.sessions():
+            sizer = _Sizer(skip=shared.seen)
+            for key, container in list(record.containers.items()):
+                sizer.add(container, SESSION_KEYS.get(key, 'datasets'))
+            rows.append({
+                'session': record.session_id,
+                'user': record.user,
+                'idle_minutes': round((now - record.last_seen) / 60, 1),
+                **{category: sizer.totals[category] for category in CATEGORIES},
+                'total': sum(sizer.totals.values()),
+                'evicted': record.reload_pending,
+            })
+        columns = ['session', 'user', 'idle_minutes', *CATEGORIES, 'total', 'evicted']
+        return pd.DataFrame(rows, columns=columns).sort_values('total', ascending=False, ignore_index=True)
+
+    def evict_idle(self, idle_seconds, keep=None):
+        """Clear the data of sessions idle longer than idle_seconds; returns how many"""
+        cutoff = time.time() - idle_seconds
+        evicted = 0
+        for record in self.sessions():
+            if record.session_id == keep or record.reload_pending:
+                continue
+            evicted += record.evict(cutoff)
+        return evicted
+
+    # tracemalloc sampling, on demand only
+
+    def start_sampling(self, frames=TRACEMALLOC_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop_sampling(self):
+        tracemalloc.stop()
+        self._baseline = None
+
+    @staticmethod
+    def sampling():
+        return tracemalloc.is_tracing()
+
+    def top_allocations(self, limit=20):
+        """Largest live allocation sites, and their growth since sampling started"""
+        if not tracemalloc.is_tracing():
+            return pd.DataFrame(columns=['location', 'size_mb', 'blocks', 'growth_mb'])
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, __file__),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")]
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        if self._baseline is not None:
+            stats = snapshot.compare_to(self._baseline.filter_traces(ignore), 'lineno')
+        else:
+            stats = snapshot.statistics('lineno')
+        stats = sorted(stats, key=lambda stat: stat.size, reverse=True)[:limit]
+        return pd.DataFrame([{
+            'location': str(stat.traceback[0]),
+            'size_mb': round(stat.size / 1024 / 1024, 3),
+            'blocks': stat.count,
+            'growth_mb': round(getattr(stat, 'size_diff', 0) / 1024 / 1024, 3),
+        } for stat in stats], columns=['location', 'size_mb', 'blocks', 'growth_mb'])
+
+
+@st.cache_resource
+def get_memory_registry():
+    """Process-wide memory registry shared by every session"""
+    return MemoryRegistry()
+
+
+def register_shared(name, obj):
+    """Report a process-wide object once instead of per session"""
+    if obj is not None:
+        get_memory_registry().register_shared(name, obj)
+    return obj
+
+
+def track_session(user=""):
+    """Record this session's data containers; returns True if an admin cleared them since the last run"""
+    record = st.session_state.get('memory_record')
+    if record is None:
+        record = st.session_state.memory_record = SessionRecord(uuid.uuid4().hex[:8])
+        get_memory_registry().register_session(record)
+
+    # Waits for an eviction under way, and keeps a new one off this run
+    with record.lock:
+        record.last_seen = time.time()
+        record.containers = {key: st.session_state[key] for key in SESSION_KEYS if key in st.session_state}
+        evicted, record.reload_pending = record.reload_pending, False
+        record.user = user
+    return evicted
+
+
+def process_rss(pid=None):
+    """Resident memory of this process, or of process pid, in bytes where the platform reports it"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
@@ -0,0 +1,135 @@
+import streamlit as st
+import os
+
+import plotly.express as px
+
+from instrumentation import get_stage_metrics
+from memory_accounting import CATEGORIES, get_memory_registry, process_rss
+
+# No one is an admin unless listed; the demo login's credentials are public
+DEFAULT_ADMINS = ""
+
+
+def is_admin(email):
+    """Whether a signed-in user may see the diagnostics page
+
+    Admins are listed by email, comma-separated, in HYDRATE_ADMINS. Pass
+    the Google-verified email only: the username/email restored from the
+    query string is signed with a forgeable token.
+    """
+    admins = os.environ.get("HYDRATE_ADMINS", DEFAULT_ADMINS)
+    return bool(email) and email.lower() in {a.strip().lower() for a in admins.split(",") if a.strip()}
+
+
+def admin_page():
+    st.header("Diagnostics")
+
+    if not is_admin(st.session_state.get('verified_email')):
+        st.error("This page is only available to administrators.")
+        return
+
+    stage_latency()
+    session_memory()
+    allocation_sampling()
+
+
+@st.fragment
+def stage_latency():
+    """Where time goes: latency per processing stage and dataset size"""
+    metrics = get_stage_metrics()
+    st.subheader("Stage Latency")
+
+    # Clicking reruns just this fragment
+    st.button("Refresh", key="refresh_stage_latency")
+
+    summary = metrics.summary()
+    if summary.empty:
+        st.info("No stages have been timed yet. Upload and analyze a dataset to collect timings.")
+        return
+
+    st.caption(f"Over the last {int(summary['count'].sum()):,} timed stages in this process")
+    st.dataframe(summary, hide_index=True, use_container_width=True)
+
+    recent = metrics.recent()
+    fig = px.box(recent.assign(milliseconds=recent['seconds'] * 1000), x='stage', y='milliseconds', color='size',
+                 points='outliers', log_y=True, title="Recent stage durations by dataset size")
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.download_button(
+        label="Download Prometheus metrics",
+        data=metrics.prometheus_text,
+        file_name="hydrate_metrics.prom",
+        mime="text/plain"
+    )
+    if metrics.path:
+        st.caption(f"Also written to `{metrics.path}`" +
+                   (f" ({metrics.write_errors} failed writes)" if metrics.write_errors else ""))
+    else:
+        st.caption("Set HYDRATE_METRICS_FILE to write these metrics to a file for a Prometheus textfile collector.")
+
+
+def _mb(nbytes):
+    return round(nbytes / 1024 / 1024, 2)
+
+
+@st.fragment
+def session_memory():
+    """Memory held by every session and by the shared caches, with idle eviction"""
+    registry = get_memory_registry()
+    st.subheader("Memory by Session")
+
+    st.button("Refresh", key="refresh_session_memory")
+
+    usage = registry.session_usage()
+    shared = registry.shared_usage()
+
+    col1, col2, col3 = st.columns(3)
+    rss = process_rss()
+    col1.metric("Process Resident Memory", f"{_mb(rss):,.1f} MB" if rss is not None else "n/a")
+    col2.metric("Held by Sessions", f"{_mb(usage['total'].sum()):,.1f} MB", help=f"{len(usage)} live sessions")
+    col3.metric("Shared Models and Caches", f"{_mb(sum(shared.values())):,.1f} MB")
+
+    if usage.empty:
+        st.info("No sessions are being tracked yet.")
+    else:
+        st.dataframe(usage.assign(**{col: usage[col].map(_mb) for col in (*CATEGORIES, 'total')}),
+                     hide_index=True, use_container_width=True,
+                     column_config={col: st.column_config.NumberColumn(f"{col} (MB)") for col in (*CATEGORIES, 'total')})
+    if shared:
+        st.caption("Shared: " + ", ".join(f"{name} {_mb(nbytes):,.1f} MB" for name, nbytes in shared.items()))
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        idle_minutes = st.number_input("Evict data of sessions idle for more than (minutes)",
+                                       min_value=1, value=30, step=5, key="evict_idle_minutes")
+    with col2:
+        st.write("")
+        if st.button("Evict Idle Sessions", use_container_width=True):
+            own = st.session_state.get('memory_record')
+            evicted = registry.evict_idle(idle_minutes * 60, keep=own.session_id if own else None)
+            st.success(f"Cleared the data of {evicted} idle session(s) and stopped the files they followed; "
+                       "each reloads its saved datasets the next time it runs.")
+
+
+@st.fragment
+def allocation_sampling():
+    """Allocation sites from tracemalloc, sampled only while an admin asks for it"""
+    registry = get_memory_registry()
+    st.subheader("Allocation Sampling")
+
+    sampling = registry.sampling()
+    col1, col2 = st.columns(2)
+    with col1:
+        # Toggled in a callback so the page renders the new state straight away
+        st.button("Stop Sampling" if sampling else "Start Sampling", key="toggle_sampling",
+                  on_click=registry.stop_sampling if sampling else registry.start_sampling,
+                  use_container_width=True)
+    with col2:
+        # Clicking reruns the fragment, which takes a fresh snapshot
+        st.button("Take Snapshot", disabled=not sampling, use_container_width=True)
+
+    if sampling:
+        st.caption("Largest live allocation sites; growth is since sampling started")
+        st.dataframe(registry.top_allocations(), hide_index=True, use_container_width=True)
+    else:
+        st.caption("tracemalloc is off. It slows every allocation while it runs, so turn it off when done.")
@@ -5,161 +5,84 @@ import matplotlib.pyplot as plt
 import numpy as np
 import os
 
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score
-
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
+from alerts import find_risk_episodes, get_alert_engine
+from dataset_store import get_dataset_store, model_key
+from drift import drift_report
+from features import FEATURE_COLUMNS, build_feature_matrix
+from fleet_export import EXPORT_FORMATS, fleet_episodes, fleet_zip
+from feature_store import get_feature_store
+from instrumentation import timed, timed_function
+from memory_accounting import register_shared
+from hydrate_model import (LABEL_COLUMN, MAX_TREES, ModelRegistry, ModelVersion, fit_hydrate_model,
+                           load_training_set)
+from prefilter import screened_predict
+from query_console import DUCKDB_AVAILABLE, EXAMPLE_QUERIES, QueryError, run_query
+from retraining import get_retrain_manager, run_incremental_job
+from table_view import PAGE_SIZES, RISK_COLUMN, filter_positions, page_count, page_rows, sort_positions
+from time_index import WINDOW_PRESETS, TimeIndex
+from training_set import well_id
+from well_comparison import ALIGN_MODES, QUANTITIES, align_wells, coverage, format_interval, sampling_interval
+from well_models import get_well_model_cache
+
   
 def data_analysis():
     st.header("Data Analysis & Hydrate Formation Prediction")
     
     # Import the get_uploaded_datasets function
-    from .data_upload import get_uploaded_datasets
-    
-    # Train the ML model
-    st.subheader("Machine Learning Model")
-    with st.expander("Model Training Information", expanded=False):
-        st.info("The model is trained using final.csv data with features like gas volume, valve position, and rolling statistics to predict hydrate formation likelihood.")
-        
-        if st.button("Retrain Model"):
-            st.cache_resource.clear()
-            model, scaler, feature_columns = train_hydrate_model()
-        else:
-            model, scaler, feature_columns = train_hydrate_model()
-    
-    # Get uploaded datasets
+    from .data_upload import get_dataset_rollups, get_uploaded_datasets
     uploaded_datasets = get_uploaded_datasets()
     
+    # Each section below is a fragment, so a widget inside one only reruns that section
+    model_status(uploaded_datasets)
+    
     if uploaded_datasets:
         # Dataset selection
         st.subheader("Dataset Selection")
-        selected_dataset = st.selectbox(
+        compare = len(uploaded_datasets) > 1 and st.toggle("Compare wells side by side", key="compare_wells")
+        selected_dataset = None if compare else st.selectbox(
             "Select dataset for analysis:",
             options=list(uploaded_datasets.keys()),
             key="dataset_selector"
         )
+        per_well = st.toggle("Use a model trained on this well's own history when available", key="per_well_models")
         
-        if selected_dataset:
-            df = uploaded_datasets[selected_dataset].copy()
-            
-            # Generate predictions
-            st.subheader("Hydrate Formation Predictions")
-            if model is not None and scaler is not None:
-                with st.spinner("Generating predictions..."):
-                    predictions = predict_hydrate_likelihood(df, model, scaler, feature_columns)
-                    if predictions is not None:
-                        df['Predicted_Hydrate_Likelihood'] = predictions
-                        
-                        # Display prediction statistics
-                        col1, col2, col3, col4 = st.columns(4)
-                        with col1:
-                            st.metric("Max Risk", f"{predictions.max():.2f}")
-                        with col2:
-                            st.metric("Avg Risk", f"{predictions.mean():.2f}")
-                        with col3:
-                            high_risk_count = np.sum(predictions > 5.0)
-                            st.metric("High Risk Points", high_risk_count)
-                        with col4:
-                            st.metric("Total Points", len(predictions))
-                        
-                        # Risk alerts
-                        if predictions.max() > 7.0:
-                            st.error("CRITICAL: Very high hydrate formation risk detected!")
-                        elif predictions.max() > 5.0:
-                            st.warning("WARNING: High hydrate formation risk detected!")
-                        else:
-                            st.success("Hydrate formation risk is within acceptable limits")
+        if compare:
+            well_comparison(uploaded_datasets, per_well)
+        elif selected_dataset:
+            scored = scored_dataset(selected_dataset, uploaded_datasets[selected_dataset], per_well)
             
-            # Visualization options
-            st.subheader("Data Visualization")
-            chart_options = [
-                "Time Series - All Variables",
-                "Correlation Heatmap", 
-                "Hydrate Risk Distribution",
-                "Valve vs Volume Relationship",
-                "Risk Alert Timeline"
-            ]
+            # One time window for the whole page; the sections below only see its rows
+            df, times, rollups = scored, None, None
+            if 'Time' in scored.columns:
+                index = dataset_time_index(selected_dataset, uploaded_datasets[selected_dataset])
+                if index.n_valid:
+                    df, times = index.window(scored, *time_window_selector(index))
+                    rollups = get_dataset_rollups(selected_dataset, uploaded_datasets[selected_dataset])
             
-            selected_chart = st.selectbox(
-                "Select visualization type:",
-                options=chart_options,
-                key="chart_selector"
-            )
-            
-            # Generate and display the selected chart
-            if selected_chart:
-                fig = create_visualization(df, selected_chart, selected_dataset)
-                if fig is not None:
-                    st.plotly_chart(fig, use_container_width=True)
-
-            # Data table with predictions
-            st.subheader("Data Table")
-            display_columns = st.multiselect(
-                "Select columns to display:",
-                options=df.columns.tolist(),
-                default=df.columns.tolist()[:5],  # Show first 5 columns by default
-                key="column_selector"
-            )
-            
-            if display_columns:
-                st.dataframe(df[display_columns], use_container_width=True)
-            
-            # Export predictions
-            st.subheader("Export Results")
-            
-            # Show what's available for download
-            if 'Predicted_Hydrate_Likelihood' in df.columns:
-                st.success("Dataset includes ML predictions - ready for download")
-                
-                # Preview what will be downloaded
-                with st.expander("Preview Download Data", expanded=False):
-                    st.write(f"**Columns to be included:** {len(df.columns)}")
-                    st.write(f"**Rows:** {len(df)}")
-                    st.write("**Column Names:**")
-                    for i, col in enumerate(df.columns, 1):
-                        st.write(f"{i}. {col}")
-                
-                # Generate CSV data
-                try:
-                    csv_data = df.to_csv(index=False)
-                    
-                    # Create download button
-                    st.download_button(
-                        label="Download data with predictions",
-                        data=csv_data,
-                        file_name=f"{selected_dataset}_with_predictions.csv",
-                        mime="text/csv",
-                        help="Download the dataset with ML predictions included"
-                    )
-                    
-                    st.info(f"File will be saved as: {selected_dataset}_with_predictions.csv")
-                    
-                except Exception as e:
-                    st.error(f"Error preparing download: {str(e)}")
-                    st.info("Please try selecting the dataset again or contact support.")
-                    
+            if len(df) == 0:
+                st.info("No readings in the selected time window.")
             else:
-                st.warning("No predictions available for this dataset")
-                st.info("Please wait for the ML model to generate predictions, then try again.")
+                # Generate predictions
+                st.subheader("Hydrate Formation Predictions")
+                # Rows without a time come last and do not bound the window
+                known = times[~np.isnat(times)] if times is not None else ()
+                window = (known[0], known[-1]) if len(known) else (None, None)
+                if 'Predicted_Hydrate_Likelihood' in df.columns:
+                    prediction_summary(df, selected_dataset)
+                    input_drift(selected_dataset, uploaded_datasets[selected_dataset])
+                    stored_episodes(selected_dataset, window)
                 
-                # Still offer to download original data
-                if st.button("Download original data (without predictions)"):
-                    try:
-                        csv_data = df.to_csv(index=False)
-                        st.download_button(
-                            label="Download original data",
-                            data=csv_data,
-                            file_name=f"{selected_dataset}_original.csv",
-                            mime="text/csv",
-                            help="Download the original dataset without predictions"
-                        )
-                    except Exception as e:
-                        st.error(f"Error preparing download: {str(e)}")
+                chart_section(df, selected_dataset, scored, rollups, window)
+                data_table(df, times)
+                export_section(df, selected_dataset)
+        
+        # Same models as the analysis above, so the cached predictions are reused
+        query_console(uploaded_datasets, per_well)
+        fleet_export(uploaded_datasets, per_well)
         
         # Manage Datasets section
         st.subheader("Manage Datasets")
@@ -176,6 +99,17 @@ def data_analysis():
                 if st.button("Remove Dataset"):
                     if dataset_to_remove in st.session_state.uploaded_datasets:
                         del st.session_state.uploaded_datasets[dataset_to_remove]
+                        st.session_state.get('scored_datasets', {}).pop(dataset_to_remove, None)
+                        st.session_state.get('time_indexes', {}).pop(dataset_to_remove, None)
+                        st.session_state.get('quarantine_reports', {}).pop(dataset_to_remove, None)
+                        st.session_state.get('rollups', {}).pop(dataset_to_remove, None)
+                        st.session_state.get('drift_profiles', {}).pop(dataset_to_remove, None)
+                        from .data_upload import dataset_owner
+                        if dataset_owner():
+                            get_dataset_store().delete_dataset(dataset_owner(), dataset_to_remove)
+                        alignments = st.session_state.get('well_alignments', {})
+                        for key in [key for key in alignments if dataset_to_remove in key[0]]:
+                            del alignments[key]
                         if 'remove_dataset_analysis' in st.session_state:
                             del st.session_state['remove_dataset_analysis']
                         st.success(f"Removed {dataset_to_remove}")
@@ -185,104 +119,593 @@ def data_analysis():
         st.warning("No datasets uploaded yet. Please upload CSV files in the Data Upload page to proceed.")
         st.info("**Tip**: Upload your pipeline data CSV files to get started with hydrate formation analysis and predictions!")
 
-# Machine Learning Functions
-@st.cache_data
-def load_training_data():
-    """Load the training data from final.csv"""
-    try:
-        # Get the path to the data folder
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        data_path = os.path.join(current_dir, '..', '..', 'data', 'final.csv')
+@st.fragment
+def model_status(uploaded_datasets):
+    """Model version, retraining and incremental updates"""
+    # Train the ML model
+    st.subheader("Machine Learning Model")
+    with st.expander("Model Training Information", expanded=False):
+        st.info("The model is trained on labeled data from every well, sampled evenly across wells and risk bands, with features like gas volume, valve position, and rolling statistics to predict hydrate formation likelihood.")
         
-        df = pd.read_csv(data_path)
-        df['Time'] = pd.to_datetime(df['Time'])
+        registry = get_model_registry()
+        current = registry.current()
+        if current is not None:
+            st.write(f"**Model version:** {current.version} ({current.source}, published {current.published_at})")
+            st.write(f"**Hold-out R²:** {current.metrics['r2']:.4f} | **MSE:** {current.metrics['mse']:.4f}")
+        
+        # Retraining runs in a worker process; everyone keeps the current model until it is swapped
+        retrain_manager = get_retrain_manager(registry)
+        if st.button("Retrain Model", disabled=retrain_manager.running()):
+            retrain_manager.submit()
+        
+        incremental_update_form(retrain_manager, registry, uploaded_datasets)
+        
+        if retrain_manager.running():
+            retrain_progress(retrain_manager)
+        else:
+            job = retrain_manager.latest_job()
+            if job is not None:
+                show_retrain_result(job)
+        
+        if len(registry.history) > 1:
+            st.dataframe(pd.DataFrame(registry.history), use_container_width=True)
+        
+        well_models = get_well_model_cache(load_training_data)
+        if well_models.resident():
+            st.write(f"**Per-well models in memory:** {', '.join(well_models.resident())} "
+                     f"({well_models.nbytes / 2**20:.1f} of {well_models.max_bytes / 2**20:.0f} MB)")
+
+def scored_dataset(name, df, per_well=False):
+    """Copy of a dataset with predictions, reused until the data or the model changes"""
+    version = get_model_registry().current()
+    if version is None:
         return df
-    except Exception as e:
-        st.error(f"Error loading training data: {str(e)}")
-        return None
+    
+    if per_well:
+        well = well_id(name)
+        well_models = get_well_model_cache(load_training_data)
+        with st.spinner(f"Loading the {well} model..."):
+            # Per-well models are kept for one global model version and retried after a retrain
+            well_version = well_models.get(well, version.version)
+        if well_version is not None:
+            version = well_version
+            st.caption(f"Scored with the {well} model (hold-out R² {version.metrics['r2']:.4f})")
+        else:
+            st.caption(f"Scored with the global model ({well}: {well_models.unavailable(well)})")
+    
+    # Uploads and live follows replace the frame, so identity tells us the data changed
+    scored = st.session_state.setdefault('scored_datasets', {})
+    if name in scored and scored[name][0] is df and scored[name][1] is version:
+        return scored[name][2]
+    
+    # Saved datasets keep their predictions, so a restored session does not score them again
+    from .data_upload import dataset_owner
+    store, owner, key = get_dataset_store(), dataset_owner(), model_key(version)
+    with st.spinner("Generating predictions..."):
+        result = df.copy()
+        predictions = None
+        if owner:
+            with timed('restore_predictions', len(df)):
+                predictions = store.load_predictions(owner, name, df, key)
+        if predictions is None:
+            predictions = predict_hydrate_likelihood(result, version.model, version.scaler, version.feature_columns)
+            times = result['Time'] if 'Time' in result.columns else None
+            if owner and times is not None:
+                episodes = find_risk_episodes(predictions, times, **get_alert_engine().rules)
+                with timed('persist', len(df)):
+                    store.save_predictions(owner, name, df, key, predictions, episodes)
+        result['Predicted_Hydrate_Likelihood'] = predictions
+    
+    # Sustained episodes are evaluated and dispatched in the background
+    from .data_upload import alert_owner
+    get_alert_engine().submit(name, result['Time'] if 'Time' in result.columns else None, predictions,
+                              owner=alert_owner())
+    scored[name] = (df, version, result)
+    if 'Time' in result.columns:
+        from .data_upload import get_dataset_rollups
+        get_dataset_rollups(name, df).replace(result, ['Risk'])
+    return result
 
-@st.cache_resource
-def train_hydrate_model():
-    """Train the hydrate formation prediction model"""
-    df = load_training_data()
-    if df is None:
-        return None, None, None
+def dataset_time_index(name, df):
+    """Sorted time index of a dataset, built once per uploaded frame"""
+    indexes = st.session_state.setdefault('time_indexes', {})
+    if name not in indexes or indexes[name][0] is not df:
+        indexes[name] = (df, TimeIndex(df['Time']))
+    return indexes[name][1]
+
+def time_window_selector(index):
+    """Page-wide time window as (start, end); (None, None) covers everything"""
+    choice = st.selectbox("Time window", options=list(WINDOW_PRESETS), key="time_window")
+    if choice == "Custom range" and index.first < index.last:
+        return st.slider(
+            "Custom range",
+            min_value=index.first.to_pydatetime(),
+            max_value=index.last.to_pydatetime(),
+            value=(index.first.to_pydatetime(), index.last.to_pydatetime()),
+            format="MM/DD HH:mm"
+        )
+    return index.preset(choice)
+
+# Well sets whose alignment is kept, most recent last
+MAX_ALIGNMENTS = 8
+
+def aligned_wells(names, scored, mode):
+    """Wells aligned on a common grid, joined once per well set until their data changes"""
+    alignments = st.session_state.setdefault('well_alignments', {})
+    key = (tuple(sorted(names)), mode)
+    frames = tuple(scored[name] for name in key[0])
+    cached = alignments.pop(key, None)
+    if cached is None or len(cached[0]) != len(frames) or any(a is not b for a, b in zip(cached[0], frames)):
+        cached = (frames, *align_wells(dict(zip(key[0], frames)), mode))
+    alignments[key] = cached
+    while len(alignments) > MAX_ALIGNMENTS:
+        del alignments[next(iter(alignments))]
+    return cached[1], cached[2]
+
+@st.fragment
+def well_comparison(uploaded_datasets, per_well=False):
+    """Volumes, valve positions and predicted risk of several wells on one timeline"""
+    st.subheader("Well Comparison")
+    names = [name for name in uploaded_datasets if 'Time' in uploaded_datasets[name].columns]
+    selected = st.multiselect("Wells to compare", options=names, default=names[:2], key="compare_selection")
+    mode = st.radio("Align by", options=ALIGN_MODES, horizontal=True, key="compare_align",
+                    help="Time since first reading lines up wells recorded in different weeks")
+    if len(selected) < 2:
+        st.info("Select at least two wells to compare.")
+        return
+    
+    scored = {name: scored_dataset(name, uploaded_datasets[name], per_well) for name in selected}
+    with timed('alignment', sum(len(df) for df in scored.values())):
+        aligned, step = aligned_wells(selected, scored, mode)
+    if aligned.empty:
+        st.info("The selected wells have no timestamped readings.")
+        return
+    
+    titles = {'Volume': "Gas Volume", 'Valve': "Valve % Open", 'Risk': "Predicted Risk"}
+    quantities = [q for q in QUANTITIES if q in aligned.columns.get_level_values('quantity')]
+    fig = make_subplots(rows=len(quantities), cols=1, shared_xaxes=True, vertical_spacing=0.05,
+                        subplot_titles=[titles[q] for q in quantities])
+    x = aligned.index / pd.Timedelta(hours=1) if mode == ALIGN_MODES[1] else aligned.index
+    colors = px.colors.qualitative.Plotly
+    for row, quantity in enumerate(quantities, start=1):
+        for i, name in enumerate(selected):
+            if (quantity, name) not in aligned.columns:
+                continue
+            fig.add_trace(go.Scattergl(x=x, y=aligned[(quantity, name)], name=name, legendgroup=name,
+                                       showlegend=row == 1, line=dict(color=colors[i % len(colors)], width=1)),
+                          row=row, col=1)
+    if 'Risk' in quantities:
+        fig.add_hline(y=5, line_dash="dash", line_color="orange", row=quantities.index('Risk') + 1, col=1)
+        fig.add_hline(y=7, line_dash="dash", line_color="red", row=quantities.index('Risk') + 1, col=1)
+    fig.update_layout(height=250 * len(quantities), title=f"Aligned on {mode.lower()}")
+    if mode == ALIGN_MODES[1]:
+        fig.update_xaxes(title_text="Hours since first reading", row=len(quantities), col=1)
+    st.plotly_chart(fig, use_container_width=True)
     
-    # Feature engineering
-    df['Volume_Diff'] = df['Inj Gas Meter Volume Instantaneous'] - df['Inj Gas Meter Volume Setpoint']
-    df['Volume_Ratio'] = df['Inj Gas Meter Volume Instantaneous'] / df['Inj Gas Meter Volume Setpoint']
-    df['Hour'] = df['Time'].dt.hour
-    df['Day'] = df['Time'].dt.day
-    
-    # Select features for training
-    feature_columns = [
-        'Inj Gas Meter Volume Instantaneous',
-        'Inj Gas Meter Volume Setpoint',
-        'Inj Gas Valve Percent Open',
-        'Rolling Std',
-        'Volume_Diff',
-        'Volume_Ratio',
-        'Hour',
-        'Day'
+    covered = coverage(aligned)
+    st.dataframe(pd.DataFrame({
+        'Well': selected,
+        'Readings': [len(scored[name]) for name in selected],
+        'Sampling Interval': [format_interval(sampling_interval(pd.to_datetime(scored[name]['Time'], format='mixed', errors='coerce').dropna().sort_values())) for name in selected],
+        'Grid Coverage': [f"{covered.get(name, 0):.0%}" for name in selected],
+    }), hide_index=True, use_container_width=True)
+    st.caption(f"{len(aligned):,} grid points every {format_interval(step)}; a reading is carried forward for up to two of its own sampling intervals.")
+
+@st.fragment
+def prediction_summary(df, selected_dataset):
+    """Prediction statistics, risk banner and recent alerts"""
+    predictions = df['Predicted_Hydrate_Likelihood'].to_numpy()
+    
+    # Display prediction statistics
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Max Risk", f"{predictions.max():.2f}")
+    with col2:
+        st.metric("Avg Risk", f"{predictions.mean():.2f}")
+    with col3:
+        high_risk_count = np.sum(predictions > 5.0)
+        st.metric("High Risk Points", high_risk_count)
+    with col4:
+        st.metric("Total Points", len(predictions))
+    
+    # Risk alerts
+    if predictions.max() > 7.0:
+        st.error("CRITICAL: Very high hydrate formation risk detected!")
+    elif predictions.max() > 5.0:
+        st.warning("WARNING: High hydrate formation risk detected!")
+    else:
+        st.success("Hydrate formation risk is within acceptable limits")
+    
+    from .data_upload import alert_owner
+    recent_alerts = get_alert_engine().recent(selected_dataset, owner=alert_owner())
+    if recent_alerts:
+        with st.expander(f"Recent Alerts ({len(recent_alerts)})", expanded=False):
+            st.dataframe(pd.DataFrame(recent_alerts), use_container_width=True)
+
+def input_drift(name, df):
+    """How far the dataset's readings are from those the scoring model was trained on"""
+    from .data_upload import get_drift_profile
+    scored = st.session_state.get('scored_datasets', {}).get(name)
+    version = scored[1] if scored is not None else get_model_registry().current()
+    if version is None or version.profile is None:
+        return
+    
+    # Both sides are sketches, so this never goes back to the readings
+    report = drift_report(version.profile, get_drift_profile(name, df))
+    if report.empty:
+        return
+    significant = report[report['drift'] == "Significant"]
+    if len(significant):
+        st.warning(f"Input drift: readings of {', '.join(significant['input'])} are largely outside what the "
+                   f"model was trained on; treat these predictions with caution.")
+    
+    with st.expander(f"Input Drift vs Training Data ({report['drift'].iloc[0]})", expanded=False):
+        st.dataframe(report.rename(columns={
+            'input': 'Input', 'training_range': 'Training Range', 'dataset_range': 'Dataset Range',
+            'unsupported': 'Unsupported', 'psi': 'PSI', 'ks': 'KS', 'drift': 'Drift',
+        }).style.format({'Unsupported': '{:.1%}', 'PSI': '{:.3f}', 'KS': '{:.3f}'}),
+            hide_index=True, use_container_width=True)
+        st.caption("Unsupported is the share of readings outside the training range or where training data is "
+                   "sparse. PSI and KS compare the whole distribution with the training set, which pools every "
+                   "well, so compare them between wells rather than reading them on their own.")
+
+def stored_episodes(name, window):
+    """Risk episodes saved with the dataset's predictions, read from the store by time range"""
+    from .data_upload import dataset_owner
+    if not dataset_owner():
+        return
+    episodes = get_dataset_store().episodes(dataset_owner(), name, *window)
+    if episodes.empty:
+        return
+    
+    with st.expander(f"Risk Episodes in Window ({len(episodes)})", expanded=False):
+        st.dataframe(episodes.drop(columns='dataset').rename(columns={
+            'start': 'Start', 'end': 'End', 'level': 'Level', 'peak': 'Peak Risk', 'points': 'Readings',
+        }).style.format({'Peak Risk': '{:.2f}'}), hide_index=True, use_container_width=True)
+
+def load_example_query():
+    st.session_state.query_sql = EXAMPLE_QUERIES[st.session_state.query_example]
+
+@st.fragment
+def query_console(uploaded_datasets, per_well=False):
+    """SQL over every uploaded dataset and its predictions; only the console reruns"""
+    st.subheader("Query Console")
+    if not DUCKDB_AVAILABLE:
+        st.info("Install duckdb to query all uploaded wells with SQL.")
+        return
+    
+    with st.expander("Query all wells with SQL", expanded=False):
+        st.selectbox("Example queries", options=list(EXAMPLE_QUERIES), key="query_example", on_change=load_example_query)
+        if 'query_sql' not in st.session_state:
+            load_example_query()
+        sql = st.text_area("SQL", key="query_sql", height=260)
+        st.caption("Tables: `readings` (well, time, volume, setpoint, valve, label, risk) with one row per reading "
+                   "of every uploaded dataset, and `episodes` (dataset, start, end, level, peak, points) with "
+                   "their risk episodes.")
+        
+        if st.button("Run Query", key="run_query"):
+            # Scored frames are cached, so only wells never scored are predicted here
+            frames = {name: scored_dataset(name, df, per_well) for name, df in uploaded_datasets.items()}
+            # Found from this session's own predictions, never from the store
+            episodes = fleet_episodes(frames, **get_alert_engine().rules)
+            try:
+                with timed('query', sum(len(df) for df in frames.values())):
+                    result, seconds = run_query(sql, frames, episodes)
+                st.session_state.query_result = (result, seconds)
+            except QueryError as e:
+                st.session_state.pop('query_result', None)
+                st.error(f"Query failed: {e}")
+        
+        if 'query_result' in st.session_state:
+            result, seconds = st.session_state.query_result
+            st.caption(f"{len(result):,} rows in {seconds * 1000:,.0f} ms"
+                       + (f"; showing the first {MAX_QUERY_ROWS_SHOWN:,}" if len(result) > MAX_QUERY_ROWS_SHOWN else ""))
+            st.dataframe(result.head(MAX_QUERY_ROWS_SHOWN), hide_index=True, use_container_width=True)
+            st.download_button(
+                label="Download Query Result",
+                data=result.to_csv(index=False),
+                file_name="query_result.csv",
+                mime="text/csv",
+                key="download_query_result"
+            )
+
+@st.fragment
+def chart_section(df, selected_dataset, source=None, rollups=None, window=(None, None)):
+    """Chart picker; changing it only rebuilds the chart
+
+    Time charts of windows with more than MAX_CHART_POINTS readings are drawn
+    from the dataset's rollups instead of its raw rows.
+    """
+    # Visualization options
+    st.subheader("Data Visualization")
+    chart_options = [
+        "Time Series - All Variables",
+        "Correlation Heatmap", 
+        "Hydrate Risk Distribution",
+        "Valve vs Volume Relationship",
+        "Risk Alert Timeline",
+        "Engineered Features"
     ]
     
-    X = df[feature_columns].fillna(0)
-    y = df['Likelihood of Hydrate']
+    selected_chart = st.selectbox(
+        "Select visualization type:",
+        options=chart_options,
+        key="chart_selector"
+    )
     
-    # Split the data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Generate and display the selected chart
+    if selected_chart:
+        if rollups is not None and selected_chart in ROLLUP_CHARTS and len(df) > MAX_CHART_POINTS:
+            fig = create_rollup_visualization(rollups, selected_chart, selected_dataset, *window)
+        else:
+            fig = create_visualization(df, selected_chart, selected_dataset, source)
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
+
+@st.fragment
+def data_table(df, times=None):
+    """Data table with predictions; only the visible page is sent to the browser"""
+    st.subheader("Data Table")
+    display_columns = st.multiselect(
+        "Select columns to display:",
+        options=df.columns.tolist(),
+        default=df.columns.tolist()[:5],  # Show first 5 columns by default
+        key="column_selector"
+    )
     
-    # Scale the features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
+    # Parsed times and the filtered, sorted row order are kept until the data or the query changes
+    view = st.session_state.setdefault('table_view', {})
+    if view.get('df') is not df:
+        if times is None and 'Time' in df.columns:
+            times = pd.to_datetime(df['Time'], format='mixed', errors='coerce').to_numpy()
+        # Updated in place so memory accounting always sees the current view
+        view.clear()
+        view.update({'df': df, 'times': times, 'query': None, 'positions': None})
+    times = view['times']
     
-    # Train the model
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train_scaled, y_train)
+    col1, col2 = st.columns(2)
+    with col1:
+        time_range = (None, None)
+        if times is not None:
+            first, last = pd.Series(times).min(), pd.Series(times).max()
+            if pd.notna(first) and first < last:
+                time_range = st.slider(
+                    "Time range",
+                    min_value=first.to_pydatetime(),
+                    max_value=last.to_pydatetime(),
+                    value=(first.to_pydatetime(), last.to_pydatetime()),
+                    format="MM/DD HH:mm"
+                )
+    with col2:
+        min_risk = None
+        if RISK_COLUMN in df.columns:
+            min_risk = st.number_input("Minimum predicted risk", value=0.0, step=0.5)
     
-    # Evaluate the model
-    y_pred = model.predict(X_test_scaled)
-    mse = mean_squared_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_by = st.selectbox("Sort by", options=["Original order"] + df.columns.tolist(), key="table_sort")
+    with col2:
+        page_size = st.selectbox("Rows per page", options=PAGE_SIZES, index=1, key="table_page_size")
+    with col3:
+        descending = st.checkbox("Descending", key="table_descending")
     
-    st.success(f"Model trained successfully! MSE: {mse:.4f}, R²: {r2:.4f}")
+    query = (time_range, min_risk, sort_by, descending)
+    if view['query'] != query:
+        positions = filter_positions(df, times, *time_range, min_risk=min_risk)
+        view['positions'] = sort_positions(df, positions, None if sort_by == "Original order" else sort_by, descending, times)
+        view['query'] = query
+    positions = view['positions']
     
-    return model, scaler, feature_columns
+    # The page count is part of the widget, so a new filter starts again at page 1
+    pages = page_count(len(positions), page_size)
+    page = st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1)
+    
+    if display_columns:
+        start = (page - 1) * page_size
+        st.dataframe(page_rows(df, positions, page, page_size, display_columns), use_container_width=True)
+        st.caption(f"Rows {min(start + 1, len(positions)):,}-{min(start + page_size, len(positions)):,} "
+                   f"of {len(positions):,} matching ({len(df):,} in the dataset)")
 
-def predict_hydrate_likelihood(df, model, scaler, feature_columns):
-    """Predict hydrate formation likelihood for uploaded data"""
+@st.fragment
+def export_section(df, selected_dataset):
+    """Download buttons; the CSV is only written when a download is clicked"""
+    # Export predictions
+    st.subheader("Export Results")
+    
+    # Show what's available for download
+    if 'Predicted_Hydrate_Likelihood' in df.columns:
+        st.success("Dataset includes ML predictions - ready for download")
         
-    if model is None or scaler is None:
-        return None
+        # Preview what will be downloaded
+        with st.expander("Preview Download Data", expanded=False):
+            st.write(f"**Columns to be included:** {len(df.columns)}")
+            st.write(f"**Rows:** {len(df)}")
+            st.write("**Column Names:**")
+            for i, col in enumerate(df.columns, 1):
+                st.write(f"{i}. {col}")
+        
+        # Create download button
+        st.download_button(
+            label="Download data with predictions",
+            data=lambda: export_csv(df),
+            file_name=f"{selected_dataset}_with_predictions.csv",
+            mime="text/csv",
+            help="Download the dataset with ML predictions included"
+        )
+        
+        st.info(f"File will be saved as: {selected_dataset}_with_predictions.csv")
+            
+    else:
+        st.warning("No predictions available for this dataset")
+        st.info("Please wait for the ML model to generate predictions, then try again.")
+        
+        # Still offer to download original data
+        st.download_button(
+            label="Download original data (without predictions)",
+            data=lambda: export_csv(df),
+            file_name=f"{selected_dataset}_original.csv",
+            mime="text/csv",
+            help="Download the original dataset without predictions"
+        )
+
+def export_csv(df):
+    with timed('csv_export', len(df)):
+        return df.to_csv(index=False)
+
+@st.fragment
+def fleet_export(uploaded_datasets, per_well=False):
+    """One zip of every dataset with predictions, the fleet summary and risk episodes"""
+    st.subheader("Export All Datasets")
+    if not st.toggle("Prepare a download of every dataset", key="fleet_export"):
+        return
+    
+    # Scored frames are cached, so only wells never scored are predicted here
+    frames = {name: scored_dataset(name, df, per_well) for name, df in uploaded_datasets.items()}
+    fmt = st.radio("File format", EXPORT_FORMATS, horizontal=True, key="fleet_export_format")
+    rules = dict(get_alert_engine().rules)
+    st.download_button(
+        label=f"Download all {len(frames)} datasets (zip)",
+        data=lambda: export_fleet(frames, fmt, rules),
+        file_name="hydrate_fleet_export.zip",
+        mime="application/zip",
+        help="Each dataset with its predictions, a fleet summary and every risk episode"
+    )
+
+def export_fleet(frames, fmt, rules):
+    with timed('fleet_export', sum(len(df) for df in frames.values())):
+        return fleet_zip(frames, fmt, rules)
+
+@st.fragment(run_every=2)
+def retrain_progress(retrain_manager):
+    """Poll the running retrain job"""
+    job = retrain_manager.latest_job()
+    st.progress(job['progress'], text=job['message'])
+    if not retrain_manager.running():
+        # Rerun the whole page so predictions pick up a newly published model
+        st.rerun(scope="app")
+
+def incremental_update_form(retrain_manager, registry, uploaded_datasets):
+    """Offer to grow the current model with trees fitted on newly labeled datasets"""
+    labeled = [name for name, df in uploaded_datasets.items() if LABEL_COLUMN in df.columns]
+    if not labeled or registry.current() is None:
+        return
     
-    # Feature engineering (same as training)
-    df_processed = df.copy()
-    df_processed['Volume_Diff'] = df_processed['Inj Gas Meter Volume Instantaneous'] - df_processed['Inj Gas Meter Volume Setpoint']
-    df_processed['Volume_Ratio'] = df_processed['Inj Gas Meter Volume Instantaneous'] / df_processed['Inj Gas Meter Volume Setpoint']
+    st.markdown("**Incremental Update**")
+    st.caption(f"Adds trees fitted only on the selected labeled datasets and retires the oldest ones beyond {MAX_TREES} trees.")
+    selected = st.multiselect("Newly labeled datasets", options=labeled, default=labeled, key="incremental_datasets")
+    col1, col2 = st.columns(2)
+    with col1:
+        new_trees = st.number_input("New trees", min_value=5, max_value=MAX_TREES, value=20, step=5)
+    with col2:
+        recent_days = st.number_input("Only use the last N days (0 = all rows)", min_value=0, value=0)
+    compare = st.checkbox("Compare against a full refit", value=False)
     
-    # Handle time features if Time column exists
-    if 'Time' in df_processed.columns:
-        df_processed['Time'] = pd.to_datetime(df_processed['Time'])
-        df_processed['Hour'] = df_processed['Time'].dt.hour
-        df_processed['Day'] = df_processed['Time'].dt.day
+    if st.button("Update Model Incrementally", disabled=retrain_manager.running() or not selected):
+        frames = []
+        for name in selected:
+            frame = uploaded_datasets[name]
+            if recent_days and 'Time' in frame.columns:
+                times = pd.to_datetime(frame['Time'], format='mixed')
+                frame = frame[times >= times.max() - pd.Timedelta(days=recent_days)]
+            if frame[LABEL_COLUMN].notna().any():
+                frames.append(frame)
+        if frames:
+            current = registry.current()
+            retrain_manager.submit(run_incremental_job, source="incremental", model=current.model,
+                                   scaler=current.scaler, frames=frames, new_trees=int(new_trees), compare=compare,
+                                   profile=current.profile)
+        else:
+            st.warning("No labeled rows in the selected window.")
+
+def show_retrain_result(job):
+    """Show how the last retrain job ended"""
+    if job['state'] == "published":
+        st.success(job['message'])
+    elif job['state'] == "rejected":
+        st.warning(job['message'])
     else:
-        df_processed['Hour'] = 0
-        df_processed['Day'] = 1
+        st.error(job['message'])
+    if job['metrics']:
+        st.write(", ".join(f"**{name}:** {value:.4f}" for name, value in job['metrics'].items()))
+
+# Machine Learning Functions
+@st.cache_resource
+def load_training_data():
+    """Build the labeled training set from every well's history"""
+    try:
+        # Features come from the shared feature store, exactly as at prediction time
+        return register_shared("training set", load_training_set(store=get_feature_store()))
+    except Exception as e:
+        st.error(f"Error loading training data: {str(e)}")
+        return None
+
+@st.cache_resource
+def get_model_registry():
+    """Train the initial model and hold it in the process-wide registry"""
+    registry = register_shared("model registry", ModelRegistry())
+    training = load_training_data()
+    if training is None:
+        return registry
     
-    # Add Rolling Std if not present
-    if 'Rolling Std' not in df_processed.columns:
-        df_processed['Rolling Std'] = df_processed['Inj Gas Meter Volume Instantaneous'].rolling(window=5).std().fillna(0)
+    with timed('training', len(training.y)):
+        model, scaler, metrics = fit_hydrate_model(training.X, training.y)
+    registry.publish(ModelVersion(model, scaler, FEATURE_COLUMNS, metrics,
+                                  profile=training.profile()))
+    
+    st.success(f"Model trained successfully! MSE: {metrics['mse']:.4f}, R²: {metrics['r2']:.4f}")
+    
+    return registry
+
+def train_hydrate_model():
+    """Return the current hydrate formation prediction model, training it on first use"""
+    current = get_model_registry().current()
+    if current is None:
+        return None, None, None
+    return current.model, current.scaler, current.feature_columns
+
+def predict_hydrate_likelihood(df, model, scaler, feature_columns, cache=True, screen=False):
+    """Predict hydrate formation likelihood for uploaded data
+
+    With screen=True only rows flagged by the volume-drop pre-filter go
+    through the forest; the rest are reported as 0.
+    """
+        
+    if model is None or scaler is None:
+        return None
     
     # Select features and predict
-    X = df_processed[feature_columns].fillna(0)
-    X_scaled = scaler.transform(X)
-    predictions = model.predict(X_scaled)
+    with timed('feature_engineering', len(df)):
+        X = prepare_features(df, feature_columns, cache=cache)
+    with timed('predict', len(df)):
+        if screen:
+            predictions, _ = screened_predict(model, scaler, X, feature_columns)
+        else:
+            predictions = model.predict(scaler.transform(X))
     
     return predictions
 
-def create_visualization(df, chart_type, dataset_name):
-    """Create different types of visualizations"""
+def prepare_features(df, feature_columns, cache=True):
+    """Feature matrix for one contiguous series of readings
+
+    Uploaded datasets go through the feature store; pass cache=False for
+    short-lived frames such as streamed batches or service requests.
+    """
+    if cache:
+        matrix = get_feature_store().features(df)
+    else:
+        matrix = build_feature_matrix(df)
+    
+    if list(feature_columns) != FEATURE_COLUMNS:
+        matrix = matrix[:, [FEATURE_COLUMNS.index(col) for col in feature_columns]]
+    return matrix
+
+@timed_function('visualization')
+def create_visualization(df, chart_type, dataset_name, source=None):
+    """Create different types of visualizations
+
+    When df is a time window of a larger frame, pass that frame as source so
+    engineered features keep the history from before the window.
+    """
     fig = None
     
     if chart_type == "Time Series - All Variables":
@@ -361,9 +784,10 @@ def create_visualization(df, chart_type, dataset_name):
     elif chart_type == "Risk Alert Timeline":
         if 'Predicted_Hydrate_Likelihood' in df.columns:
             high_risk_threshold = 5.0
-            df['Risk_Level'] = df['Predicted_Hydrate_Likelihood'].apply(
+            # Scored frames are shared between reruns, so don't add the column in place
+            df = df.assign(Risk_Level=df['Predicted_Hydrate_Likelihood'].apply(
                 lambda x: 'High' if x > high_risk_threshold else 'Medium' if x > 2.0 else 'Low'
-            )
+            ))
             
             time_col = 'Time' if 'Time' in df.columns else df.index
             fig = px.line(df, x=time_col, y='Predicted_Hydrate_Likelihood',
@@ -375,8 +799,80 @@ def create_visualization(df, chart_type, dataset_name):
             st.warning("No hydrate predictions available for this dataset")
             return None
     
+    elif chart_type == "Engineered Features":
+        # Served from the feature store, so these are the exact values the model scored
+        if source is not None and source is not df:
+            features = get_feature_store().features(source)[source.index.get_indexer(df.index)]
+        else:
+            features = get_feature_store().features(df)
+        shown = ['Volume_Diff', 'Rolling Std', 'Volume_Drop_15', 'Valve_Change_Rate_15']
+        time_data = pd.to_datetime(df['Time'], format='mixed') if 'Time' in df.columns else df.index
+        
+        fig = make_subplots(rows=len(shown), cols=1, shared_xaxes=True, subplot_titles=shown, vertical_spacing=0.05)
+        for row, name in enumerate(shown, start=1):
+            fig.add_trace(go.Scatter(x=time_data, y=features[:, FEATURE_COLUMNS.index(name)], name=name), row=row, col=1)
+        fig.update_layout(height=800, title_text=f"Engineered Features - {dataset_name}", showlegend=False)
+    
     return fig
 
+# Raw readings a time chart draws before it switches to rollups
+MAX_CHART_POINTS = 5000
+MAX_QUERY_ROWS_SHOWN = 1000
+ROLLUP_CHARTS = ("Time Series - All Variables", "Risk Alert Timeline")
+TIER_LABELS = {'15min': "15-minute", '1h': "hourly", '1D': "daily"}
+
+@timed_function('visualization')
+def create_rollup_visualization(rollups, chart_type, dataset_name, start=None, end=None):
+    """Zoomed-out time charts drawn from rollup buckets rather than raw readings"""
+    tier = rollups.tier_for(start, end, MAX_CHART_POINTS)
+    buckets = rollups.frame(tier, start, end)
+    if buckets.empty:
+        return None
+    label = TIER_LABELS[tier]
+    time_data = buckets.index
+    
+    if chart_type == "Time Series - All Variables":
+        fig = make_subplots(
+            rows=2, cols=2,
+            subplot_titles=('Volume Instantaneous', 'Volume Setpoint', 'Valve Percent Open', 'Hydrate Likelihood'),
+            vertical_spacing=0.1,
+            horizontal_spacing=0.1
+        )
+        panels = [('Volume', 'blue', 1, 1), ('Setpoint', 'red', 1, 2), ('Valve', 'green', 2, 1)]
+        for quantity, color, row, col in panels:
+            if f"{quantity}_mean" not in buckets.columns:
+                continue
+            # Min-max band behind the bucket mean
+            fig.add_trace(go.Scatter(x=time_data, y=buckets[f"{quantity}_max"], line=dict(width=0),
+                                     showlegend=False, hoverinfo='skip'), row=row, col=col)
+            fig.add_trace(go.Scatter(x=time_data, y=buckets[f"{quantity}_min"], line=dict(width=0), fill='tonexty',
+                                     fillcolor='rgba(128,128,128,0.2)', showlegend=False, hoverinfo='skip'), row=row, col=col)
+            fig.add_trace(go.Scatter(x=time_data, y=buckets[f"{quantity}_mean"], name=f"{quantity} ({label} mean)",
+                                     line=dict(color=color)), row=row, col=col)
+        if 'Risk_max' in buckets.columns:
+            fig.add_trace(go.Scatter(x=time_data, y=buckets['Risk_max'], name=f"Hydrate Likelihood ({label} max)",
+                                     line=dict(color='orange')), row=2, col=2)
+            fig.add_trace(go.Scatter(x=time_data, y=buckets['Risk_mean'], name=f"Hydrate Likelihood ({label} mean)",
+                                     line=dict(color='orange', dash='dot')), row=2, col=2)
+        fig.update_layout(height=600, title_text=f"Time Series Analysis - {dataset_name} ({label} rollups)", showlegend=True)
+        return fig
+    
+    if chart_type == "Risk Alert Timeline":
+        if 'Risk_max' not in buckets.columns:
+            st.warning("No hydrate predictions available for this dataset")
+            return None
+        high_risk_threshold = 5.0
+        peaks = buckets[['Risk_max']].assign(Risk_Level=buckets['Risk_max'].apply(
+            lambda x: 'High' if x > high_risk_threshold else 'Medium' if x > 2.0 else 'Low'
+        )).reset_index()
+        fig = px.line(peaks, x='Time', y='Risk_max', color='Risk_Level',
+                      labels={'Risk_max': f"Peak Hydrate Likelihood ({label})"},
+                      title=f"Hydrate Risk Timeline - {dataset_name} ({label} peaks)")
+        fig.add_hline(y=high_risk_threshold, line_dash="dash", line_color="red",
+                      annotation_text="High Risk Threshold")
+        return fig
+    return None
+
 def create_matplotlib_visualization(df, chart_type, dataset_name):
     """Create matplotlib-based visualizations as fallback"""
     fig, ax = plt.subplots(figsize=(12, 8))
@@ -1,6 +1,17 @@
 import streamlit as st
 import pandas as pd
-from typing import Dict, List
+import os
+import uuid
+from typing import Dict, List, Optional
+
+from alerts import get_alert_engine
+from dataset_store import get_dataset_store
+from ingest import UPLOAD_TYPES, read_upload
+from instrumentation import timed
+from drift import DriftProfile
+from rollups import Rollups
+from schema import SchemaError, validate_frame
+from streaming import FOLLOW_DIR_ENV, StreamFollower, follow_root, resolve_follow_path
 
 def upload_data():
     st.header("Upload Your Pipeline Data")
@@ -10,7 +21,7 @@ def upload_data():
         st.session_state.uploaded_datasets = {}
     
     # Create tabs for different upload methods
-    tab1, tab2 = st.tabs(["Single Upload", "Batch Upload"])
+    tab1, tab2, tab3 = st.tabs(["Single Upload", "Batch Upload", "Live Follow"])
     
     with tab1:
         st.subheader("Upload Individual Pipeline Data")
@@ -20,18 +31,34 @@ def upload_data():
         
         # File uploader for single file
         uploaded_file = st.file_uploader(
-            "Choose a CSV file", 
-            type=['csv'],
+            "Choose a CSV, CSV.GZ, ZIP or Parquet file", 
+            type=UPLOAD_TYPES,
             key="single_upload"
         )
         
         if uploaded_file and pipeline_name:
+            # The file stays in the uploader across reruns; only parse it once per pipeline name
+            ingested = st.session_state.setdefault('ingested_uploads', {})
+            key = (uploaded_file.file_id, pipeline_name)
             try:
-                df = pd.read_csv(uploaded_file)
-                st.session_state.uploaded_datasets[pipeline_name] = df
-                st.success(f"Successfully uploaded data for {pipeline_name}")
-                st.dataframe(df.head())
-                st.info(f"Dataset shape: {df.shape}")
+                if key not in ingested:
+                    datasets = parse_upload(uploaded_file)
+                    names = []
+                    for member, df in datasets:
+                        # An archive holds several wells; keep them apart under the pipeline name
+                        name = pipeline_name if len(datasets) == 1 else f"{pipeline_name} - {member}"
+                        store_dataset(name, df)
+                        names.append(name)
+                    ingested[key] = names
+                for name in ingested[key]:
+                    df = st.session_state.uploaded_datasets.get(name)
+                    if df is None:
+                        continue
+                    st.success(f"Successfully uploaded data for {name}")
+                    st.dataframe(df.head())
+                    st.info(f"Dataset shape: {df.shape}")
+            except SchemaError as e:
+                st.error(f"{uploaded_file.name}: {e}")
             except Exception as e:
                 st.error(f"Error reading file: {str(e)}")
         elif uploaded_file and not pipeline_name:
@@ -42,42 +69,55 @@ def upload_data():
         
         # Multiple file uploader
         uploaded_files = st.file_uploader(
-            "Choose CSV files", 
-            type=['csv'],
+            "Choose CSV, CSV.GZ, ZIP or Parquet files", 
+            type=UPLOAD_TYPES,
             accept_multiple_files=True,
             key="batch_upload"
         )
         
         if uploaded_files:
+            # Files stay in the uploader across reruns; only parse each one once
+            ingested = st.session_state.setdefault('ingested_uploads', {})
             for uploaded_file in uploaded_files:
-                # Extract pipeline name from filename (remove .csv extension)
-                pipeline_name = uploaded_file.name.replace('.csv', '')
-                
+                if uploaded_file.file_id in ingested:
+                    continue
                 try:
-                    df = pd.read_csv(uploaded_file)
-                    st.session_state.uploaded_datasets[pipeline_name] = df
+                    # Pipeline names come from the file names, one per well in an archive
+                    datasets = parse_upload(uploaded_file)
+                    for pipeline_name, df in datasets:
+                        store_dataset(pipeline_name, df)
+                    ingested[uploaded_file.file_id] = [name for name, _ in datasets]
                         
+                except SchemaError as e:
+                    st.error(f"{uploaded_file.name}: {e}")
                 except Exception as e:
                     st.error(f"Error reading {uploaded_file.name}: {str(e)}")
             
-            st.success(f"Successfully processed {len(uploaded_files)} files please hold.")
+            loaded = sum(len(ingested.get(f.file_id, [])) for f in uploaded_files)
+            st.success(f"Successfully processed {len(uploaded_files)} files ({loaded} datasets).")
+
+    with tab3:
+        follow_file()
     
     # Display summary of uploaded datasets
     if st.session_state.uploaded_datasets:
         st.subheader("Uploaded Datasets Summary")
         
         # Create summary table
+        quarantine_reports = st.session_state.setdefault('quarantine_reports', {})
         summary_data = []
         for name, df in st.session_state.uploaded_datasets.items():
             summary_data.append({
                 'Pipeline': name,
                 'Rows': df.shape[0],
                 'Columns': df.shape[1],
+                'Quarantined Rows': quarantine_reports.get(name).rows_quarantined if name in quarantine_reports else 0,
                 'Memory Usage (MB)': round(df.memory_usage(deep=True).sum() / 1024 / 1024, 2)
             })
         
         summary_df = pd.DataFrame(summary_data)
         st.dataframe(summary_df)
+        quarantine_section(quarantine_reports)
         
         # Export combined data option
         if len(st.session_state.uploaded_datasets) > 1:
@@ -93,6 +133,137 @@ def upload_data():
     else:
         st.info("No datasets uploaded yet. Please upload CSV files to proceed.")
 
+def parse_upload(uploaded_file):
+    with timed('csv_parse') as timer:
+        datasets = read_upload(uploaded_file, uploaded_file.name)
+        timer.rows = sum(len(df) for _, df in datasets)
+    return datasets
+
+
+def store_dataset(name, df):
+    """Validate an uploaded dataset and keep its clean rows and quarantine report"""
+    with timed('validation', len(df)):
+        result = validate_frame(df)
+    st.session_state.uploaded_datasets[name] = result.frame
+    # Unchanged re-uploads are recognised by their fingerprint and not written again
+    owner = dataset_owner()
+    if owner:
+        with timed('persist', len(result.frame)):
+            get_dataset_store().save_dataset(owner, name, result.frame)
+    get_dataset_rollups(name, result.frame)
+    get_drift_profile(name, result.frame)
+    reports = st.session_state.setdefault('quarantine_reports', {})
+    if result.rows_quarantined:
+        reports[name] = result
+    else:
+        reports.pop(name, None)
+    if result.renamed:
+        st.caption(f"{name}: renamed columns " + ", ".join(f"'{old}' → '{new}'" for old, new in result.renamed.items()))
+    return result.frame
+
+
+def quarantine_section(reports):
+    """Rows held back from uploaded datasets because their values could not be read"""
+    reports = {name: result for name, result in reports.items()
+               if name in st.session_state.uploaded_datasets}
+    if not reports:
+        return
+    total = sum(result.rows_quarantined for result in reports.values())
+    st.warning(f"{total:,} rows with unreadable values were left out of {len(reports)} dataset(s).")
+    with st.expander("Quarantined Rows"):
+        for name, result in reports.items():
+            st.markdown(f"**{name}**")
+            st.dataframe(result.summary(), hide_index=True)
+            st.download_button(
+                label=f"Download error report for {name}",
+                data=result.quarantine.to_csv(index=False),
+                file_name=f"{name}_quarantine.csv",
+                mime="text/csv",
+                key=f"quarantine_{name}"
+            )
+
+
+def follow_file():
+    """Follow a CSV that the historian keeps appending to"""
+    st.subheader("Follow a Growing Historian File")
+    st.caption("New rows are parsed and scored in small batches as they are appended to the file.")
+
+    if 'followers' not in st.session_state:
+        st.session_state.followers = {}
+
+    root = follow_root()
+    if root is None:
+        st.info(f"Following is off. Set {FOLLOW_DIR_ENV} to the directory the historian writes to.")
+        if st.session_state.followers:
+            follow_status()
+        return
+
+    path = st.text_input(f"File path under {root}", placeholder="well.csv")
+    well_name = st.text_input("Pipeline Name", placeholder="Defaults to the file name", key="follow_name")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        batch_rows = st.number_input("Max rows per batch", min_value=1, value=256)
+    with col2:
+        max_latency = st.number_input("Max seconds before scoring", min_value=0.5, value=2.0, step=0.5)
+
+    if st.button("Start Following"):
+        # Only files inside the configured directory, after resolving symlinks and '..'
+        resolved = resolve_follow_path(path, root)
+        if resolved is None:
+            st.error(f"Please enter the path of an existing file under {root}.")
+        else:
+            path = resolved
+            from .data_analysis import train_hydrate_model, predict_hydrate_likelihood
+            model, scaler, feature_columns = train_hydrate_model()
+
+            def score(df):
+                return predict_hydrate_likelihood(df, model, scaler, feature_columns, cache=False)
+
+            name = well_name or os.path.splitext(os.path.basename(path))[0]
+            if name in st.session_state.followers:
+                st.session_state.followers[name].stop()
+            follower = StreamFollower(path, score, well_name=name, alert_engine=get_alert_engine(), owner=alert_owner(),
+                                      batch_rows=int(batch_rows), max_latency=float(max_latency))
+            follower.start()
+            st.session_state.followers[name] = follower
+
+    if st.session_state.followers:
+        follow_status()
+
+
+@st.fragment(run_every=2)
+def follow_status():
+    """Refresh followed datasets and show their progress"""
+    datasets = st.session_state.uploaded_datasets
+    rollups = st.session_state.setdefault('rollups', {})
+    profiles = st.session_state.setdefault('drift_profiles', {})
+    for name, follower in list(st.session_state.followers.items()):
+        frame = follower.frame
+        if frame is not None:
+            datasets[name] = frame
+            # The follower keeps its rollups up to date batch by batch
+            follower.rollups.source = frame
+            rollups[name] = follower.rollups
+            profiles[name] = (frame, follower.profile)
+
+        col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
+        with col1:
+            state = "Following" if follower.running else "Stopped"
+            st.write(f"**{name}** - {state}")
+        with col2:
+            st.metric("Rows scored", f"{follower.rows_scored:,}")
+        with col3:
+            p95 = follower.latency_stats().get('p95')
+            st.metric("p95 latency", f"{p95:.2f} s" if p95 is not None else "-")
+        with col4:
+            if follower.running and st.button("Stop", key=f"stop_follow_{name}"):
+                follower.stop()
+        if follower.last_error:
+            unscored = f" {follower.rows_failed:,} rows are kept without scores." if follower.rows_failed else ""
+            st.error(f"Error following {name}: {follower.last_error}.{unscored}")
+
+
 def get_combined_dataset_info(datasets: Dict[str, pd.DataFrame]) -> pd.DataFrame:
     """Create a summary of all uploaded datasets"""
     info_data = []
@@ -115,3 +286,46 @@ def get_combined_dataset_info(datasets: Dict[str, pd.DataFrame]) -> pd.DataFrame
 def get_uploaded_datasets() -> Dict[str, pd.DataFrame]:
     """Return the uploaded datasets from session state"""
     return st.session_state.get('uploaded_datasets', {})
+
+def dataset_owner() -> Optional[str]:
+    """Who saved datasets belong to: the Google-verified email, else None and nothing is saved
+
+    Every visitor shares the demo login, and the restore token in the URL
+    can be computed by anyone, so neither identifies whose data to load.
+    """
+    return st.session_state.get('verified_email') or None
+
+def alert_owner() -> str:
+    """Whose alerts these are: the Google-verified email, else this session alone"""
+    if 'alert_session' not in st.session_state:
+        st.session_state.alert_session = f"session:{uuid.uuid4().hex}"
+    return dataset_owner() or st.session_state.alert_session
+
+def restore_datasets(reload=False) -> int:
+    """Load the datasets this user saved in earlier sessions, once per session; returns how many"""
+    owner = dataset_owner()
+    if not owner or (not reload and st.session_state.get('restored_for') == owner):
+        return 0
+    st.session_state.restored_for = owner
+    datasets = st.session_state.setdefault('uploaded_datasets', {})
+    with timed('restore') as timer:
+        saved = get_dataset_store().load_all(owner, skip=datasets)
+        timer.rows = sum(len(df) for df in saved.values())
+    datasets.update(saved)
+    return len(saved)
+
+def get_dataset_rollups(name, df) -> Rollups:
+    """Rollup tiers of a dataset, built once per uploaded frame"""
+    rollups = st.session_state.setdefault('rollups', {})
+    if name not in rollups or rollups[name].source is not df:
+        with timed('rollup', len(df)):
+            rollups[name] = Rollups.from_frame(df)
+    return rollups[name]
+
+def get_drift_profile(name, df) -> DriftProfile:
+    """Sketch of a dataset's readings for drift checks, built once per uploaded frame"""
+    profiles = st.session_state.setdefault('drift_profiles', {})
+    if name not in profiles or profiles[name][0] is not df:
+        with timed('drift_sketch', len(df)):
+            profiles[name] = (df, DriftProfile.from_frame(df))
+    return profiles[name][1]
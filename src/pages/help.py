@@ -31,8 +31,13 @@ def help_page():
         - `Inj Gas Meter Volume Setpoint` - Target gas volume
         - `Inj Gas Valve Percent Open` - Valve opening percentage
         
+        Common historian header variants (e.g. `Timestamp`, `Gas Volume (MCF)`, `Setpoint`, `Valve % Open`) are renamed automatically. Rows with values that cannot be read as numbers or timestamps are set aside in a downloadable error report; the rest of the file is still loaded.
+        
         #### **Supported File Types:**
         - CSV files (.csv)
+        - Gzip-compressed CSV files (.csv.gz)
+        - Parquet files (.parquet)
+        - ZIP archives of the above, one dataset per file inside
         - Maximum file size: 200MB
         - Multiple file upload supported
         """)
@@ -85,19 +90,21 @@ def help_page():
         
         #### **Training Data:**
         - Model is trained on historical pipeline data
-        - Uses `final.csv` as the training dataset
+        - Uses labeled history from every well, sampled evenly across wells and risk bands
         - Continuously updated for better accuracy
         
         #### **Features Used:**
         - Gas volume measurements (instantaneous & setpoint)
         - Valve position data
         - Rolling standard deviation
+        - Lags, rolling min/max and slopes over recent readings
+        - Volume drop from its recent peak and valve change rate
         - Time-based features (hour, day)
         - Calculated ratios and differences
         
         #### **Model Details:**
         - **Algorithm**: Random Forest Regressor
-        - **Features**: 8 engineered features
+        - **Features**: 8 base features plus sliding-window lag and trend features
         - **Output**: Hydrate formation likelihood (0-10 scale)
         - **Accuracy**: R² score displayed during training
         
@@ -127,7 +134,7 @@ def help_page():
         A: Model accuracy depends on data quality and similarity to training data. Check the R² score shown during training for current performance.
         
         #### **Q: Can I upload multiple files?**
-        A: Yes! Use the "Batch Upload" tab to upload multiple CSV files at once. Each file will be treated as a separate dataset.
+        A: Yes! Use the "Batch Upload" tab to upload multiple CSV files at once. Each file, and each file inside a ZIP archive, will be treated as a separate dataset.
         
         #### **Q: Why are my predictions not showing?**
         A: Ensure your data has the required columns and the ML model has finished training. Check the "Machine Learning Model" section for status.
@@ -167,6 +174,11 @@ def help_page():
         - Ensure no extra spaces in column names
         - Verify data types are correct
         
+        **Problem**: Some rows are quarantined
+        - Open "Quarantined Rows" on the upload page to see the bad values per column
+        - Download the error report for the file line numbers
+        - Blank setpoint or valve readings are fine and are not quarantined
+        
         #### **Visualization Issues**
         
         **Problem**: Charts not displaying
@@ -1,6 +1,13 @@
 import streamlit as st
+import plotly.graph_objects as go
+
+from rollups import fleet_heatmap
 from . import style
 
+# Hours of each well's latest data checked for high risk
+RECENT_HOURS = 24
+HIGH_RISK = 5.0
+
 def home_page():
     # Apply custom styling
     style.style()
@@ -27,8 +34,10 @@ def home_page():
     col1, col2, col3, col4 = st.columns(4)
 
     # Get uploaded datasets info
-    from .data_upload import get_uploaded_datasets
+    from .data_upload import get_dataset_rollups, get_uploaded_datasets
     uploaded_datasets = get_uploaded_datasets()
+    # Summaries below read rollup buckets, not raw readings
+    rollups = {name: get_dataset_rollups(name, df) for name, df in uploaded_datasets.items() if 'Time' in df.columns}
 
     with col1:
         st.markdown("<div style='text-align: center;'>", unsafe_allow_html=True)
@@ -69,6 +78,9 @@ def home_page():
         )
         st.markdown("</div>", unsafe_allow_html=True)
     
+    if rollups:
+        fleet_stats(rollups)
+    
     # Quick Actions Section
     st.markdown("""
     <div style='text-align: center; margin: 40px 0;'>
@@ -118,11 +130,25 @@ def home_page():
                 
                 # Show column names
                 st.write("**Columns:** " + ", ".join(df.columns.tolist()))
+                
+                if name in rollups:
+                    first, last = rollups[name].span
+                    if first is not None:
+                        st.write(f"**Span:** {first:%Y-%m-%d %H:%M} to {last:%Y-%m-%d %H:%M}")
+                        daily = rollups[name].frame('1D')
+                        shown = {'Volume_mean': 'Mean Volume', 'Volume_min': 'Min Volume',
+                                 'Valve_mean': 'Mean Valve % Open', 'Risk_max': 'Peak Risk'}
+                        daily = daily[[col for col in shown if col in daily.columns]].rename(columns=shown)
+                        daily.index = daily.index.date
+                        st.dataframe(daily.round(2), use_container_width=True)
         
         # Show more datasets message if there are more than 3
         if len(uploaded_datasets) > 3:
             st.info(f"And {len(uploaded_datasets) - 3} more datasets available in Data Analysis page")
     
+    if rollups:
+        fleet_risk_heatmap(rollups)
+    
     # System Health Section
     st.markdown("""
     <div style='text-align: center; margin: 40px 0;'>
@@ -192,4 +218,52 @@ def home_page():
      <strong>Pro Tip:</strong> Upload multiple datasets to compare pipeline performance across different time periods or locations.
         Use the Data Analysis page to generate comprehensive reports and identify trends.
     </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+    """, unsafe_allow_html=True)
+
+def fleet_stats(rollups):
+    """Fleet-wide risk figures from the hourly rollups of scored datasets"""
+    scored = {name: r.frame('1h') for name, r in rollups.items() if r.has('Risk')}
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            label=" Wells Scored",
+            value=f"{len(scored)} of {len(rollups)}",
+            help="Datasets with predictions; open them on the Data Analysis page to score the rest"
+        )
+    if not scored:
+        return
+    peaks = {name: hourly['Risk_max'].max() for name, hourly in scored.items()}
+    recent = {name: hourly['Risk_max'].iloc[-RECENT_HOURS:].max() for name, hourly in scored.items()}
+    with col2:
+        worst = max(peaks, key=peaks.get)
+        st.metric(
+            label=" Peak Predicted Risk",
+            value=f"{peaks[worst]:.2f}",
+            help=f"Highest predicted hydrate likelihood across all scored wells ({worst})"
+        )
+    with col3:
+        st.metric(
+            label=f" High Risk in Last {RECENT_HOURS} h",
+            value=sum(peak > HIGH_RISK for peak in recent.values()),
+            help=f"Wells whose predicted risk exceeded {HIGH_RISK} in the last {RECENT_HOURS} hours of their data"
+        )
+
+
+def fleet_risk_heatmap(rollups):
+    """Peak predicted risk of every scored well, hour by hour"""
+    st.markdown("""
+    <div style='text-align: center; margin: 40px 0;'>
+        <h4 style='color: #1f4e79; margin-bottom: 30px;'>Fleet Risk by Hour</h4>
+    </div>
+    """, unsafe_allow_html=True)
+    heatmap = fleet_heatmap(rollups, '1h')
+    if heatmap.empty:
+        st.info("Risk appears here once datasets have been scored on the Data Analysis page.")
+        return
+    fig = go.Figure(go.Heatmap(
+        z=heatmap.to_numpy(), x=heatmap.columns, y=heatmap.index,
+        colorscale='YlOrRd', zmin=0, zmax=10, colorbar=dict(title="Peak risk"),
+        hovertemplate="%{y}<br>%{x}<br>Peak risk %{z:.2f}<extra></extra>"
+    ))
+    fig.update_layout(height=max(250, 40 * len(heatmap) + 120), yaxis=dict(autorange='reversed'))
+    st.plotly_chart(fig, use_container_width=True)
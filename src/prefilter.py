@@ -0,0 +1,170 @@
+"""Rule-based screening in front of the random forest
+
+Most readings from a healthy well are nowhere near hydrate conditions, yet
+every one of them used to go through all the trees of the forest. ``screen``
+flags candidate rows with a few vectorized rules on the features that are
+built anyway, and ``screened_predict`` sends only those rows (plus a little
+padding either side) to the forest. Rows screened out are reported as
+``fill_value``.
+
+The thresholds were tuned against the model trained on the bundled data, on
+which the report below shows recall 1.0 with about 35% of rows flagged. A
+retrained model can score rows high that these rules do not flag, so the
+scoring service and the follower check the screen's recall on the training
+set at start-up with ``check_screen`` and score every row if it is below 1.0.
+Check what screening costs in recall before relying on it:
+
+    python src/prefilter.py data/*_*H-*.csv
+"""
+import numpy as np
+
+from alerts import WARNING_THRESHOLD
+from features import FEATURE_COLUMNS
+
+# Rolling Std of the volume as a fraction of setpoint. The labels follow this
+# closely, but the raw volume has gaps and a window with one is reported as 0
+VARIANCE_THRESHOLD = 0.015
+
+# Volume range over the last 15 readings, as a fraction of setpoint. Catches
+# recovery after a flow stoppage, where Rolling Std is blind; recall stays
+# 1.0 up to 0.5
+RANGE_THRESHOLD = 0.25
+
+# Volume this far below setpoint while the valve is opening to compensate
+SHORTFALL_THRESHOLD = 0.02
+
+# Volume fall from its 5-reading peak, as a fraction of setpoint
+DROP_THRESHOLD = 0.05
+
+# Rows either side of a flagged row that are scored as well
+PAD_ROWS = 2
+
+
+def screen(features, feature_columns=FEATURE_COLUMNS, pad_rows=PAD_ROWS):
+    """Boolean mask of rows worth scoring with the forest"""
+    def column(name):
+        return features[:, feature_columns.index(name)]
+
+    # Raw exports only record setpoint when it changes; the window features see it filled
+    setpoint = column('Setpoint_Max_5')
+    with np.errstate(divide='ignore'):
+        scale = np.where(setpoint > 0, 1.0 / setpoint, np.inf)
+
+    with np.errstate(invalid='ignore'):
+        # Sudden variance in the delivered volume
+        flagged = column('Rolling Std') * scale > VARIANCE_THRESHOLD
+        # Volume falling short of setpoint while the valve opens further
+        flagged |= (column('Volume_Shortfall') > SHORTFALL_THRESHOLD) & (column('Valve_Change_Rate_5') > 0)
+        # Sharp drop from the recent peak
+        flagged |= column('Volume_Drop_5') * scale > DROP_THRESHOLD
+        # Flow that stopped or restarted within the longer window
+        flagged |= (column('Volume_Max_15') - column('Volume_Min_15')) * scale > RANGE_THRESHOLD
+    # Without a setpoint there is nothing to screen against, so score those rows
+    flagged |= ~(setpoint > 0)
+
+    if pad_rows and flagged.any():
+        # Widen each flagged run so the rows around it are scored too
+        counts = np.concatenate([[0], np.cumsum(flagged)])
+        positions = np.arange(len(flagged))
+        lo = np.clip(positions - pad_rows, 0, len(flagged))
+        hi = np.clip(positions + pad_rows + 1, 0, len(flagged))
+        flagged = counts[hi] > counts[lo]
+    return flagged
+
+
+def screened_predict(model, scaler, features, feature_columns=FEATURE_COLUMNS, fill_value=0.0):
+    """Predictions for every row, running the forest only on screened-in rows
+
+    Returns the predictions and the screening mask.
+    """
+    flagged = screen(features, feature_columns)
+    predictions = np.full(len(features), fill_value, dtype=np.float64)
+    if flagged.any():
+        predictions[flagged] = model.predict(scaler.transform(features[flagged]))
+    return predictions, flagged
+
+
+def screening_recall(full, screened, flagged, threshold=WARNING_THRESHOLD):
+    """How much screening misses compared with scoring every row"""
+    at_risk = full > threshold
+    caught = at_risk & flagged
+    return {
+        'rows': int(len(full)),
+        'flagged_fraction': float(flagged.mean()) if len(flagged) else 0.0,
+        'at_risk_rows': int(at_risk.sum()),
+        'recall': float(caught.sum() / at_risk.sum()) if at_risk.any() else 1.0,
+        'missed_peak': float(full[at_risk & ~flagged].max()) if (at_risk & ~flagged).any() else None,
+        'max_abs_difference': float(np.abs(full - screened).max()) if len(full) else 0.0,
+    }
+
+
+def check_screen(model, scaler, features, feature_columns=FEATURE_COLUMNS):
+    """Screening recall of a model on a feature matrix, e.g. its training set
+
+    Screen only while the recall is 1.0: the thresholds are fixed, and a
+    retrained model may score rows high that they do not flag.
+    """
+    full = model.predict(scaler.transform(features))
+    screened, flagged = screened_predict(model, scaler, features, feature_columns)
+    return screening_recall(full, screened, flagged)
+
+
+def screen_is_safe(model, scaler, feature_columns=FEATURE_COLUMNS):
+    """Whether screening loses nothing for this model on the training set; says why not"""
+    from hydrate_model import load_training_set
+
+    training = load_training_set()
+    if list(feature_columns) != list(training.feature_columns):
+        print("Screening disabled: the model does not use the current feature set")
+        return False
+    stats = check_screen(model, scaler, training.X, feature_columns)
+    if stats['recall'] < 1.0:
+        print(f"Screening disabled: recall {stats['recall']:.4f} on the training set, "
+              f"missed peak {stats['missed_peak']:.2f}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import time
+
+    import pandas as pd
+
+    from features import build_feature_matrix
+    from hydrate_model import fit_hydrate_model, load_training_set
+
+    parser = argparse.ArgumentParser(description="Compare screened scoring with full scoring")
+    parser.add_argument("paths", nargs="+", help="well CSVs to score")
+    args = parser.parse_args()
+
+    training = load_training_set()
+    model, scaler, _ = fit_hydrate_model(training.X, training.y, n_jobs=-1)
+    # Score single-threaded so both timings measure the same thing
+    model.set_params(n_jobs=None)
+
+    full_seconds = screened_seconds = 0.0
+    fleet = []
+    for path in args.paths:
+        features = build_feature_matrix(pd.read_csv(path))
+
+        start = time.perf_counter()
+        full = model.predict(scaler.transform(features))
+        full_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        screened, flagged = screened_predict(model, scaler, features)
+        screened_seconds += time.perf_counter() - start
+
+        stats = screening_recall(full, screened, flagged)
+        fleet.append((full, screened, flagged))
+        print(f"{os.path.basename(path)}: {stats['rows']:,} rows, {stats['flagged_fraction']:.1%} flagged, "
+              f"recall {stats['recall']:.4f} on {stats['at_risk_rows']:,} rows above {WARNING_THRESHOLD}")
+
+    full, screened, flagged = (np.concatenate(parts) for parts in zip(*fleet))
+    stats = screening_recall(full, screened, flagged)
+    print(f"Fleet: {stats['flagged_fraction']:.1%} of {stats['rows']:,} rows sent to the forest, "
+          f"recall {stats['recall']:.4f}, missed peak {stats['missed_peak']}")
+    print(f"Full scoring {stats['rows'] / full_seconds:,.0f} rows/s, screened {stats['rows'] / screened_seconds:,.0f} rows/s "
+          f"({full_seconds / screened_seconds:.1f}x)")
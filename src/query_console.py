@@ -0,0 +1,151 @@
+"""Ad-hoc SQL over every loaded well, run by DuckDB on the in-memory frames
+
+Each query gets a fresh in-memory DuckDB connection with two views:
+
+    readings  well, time, volume, setpoint, valve, label, risk
+              one row per reading of every uploaded dataset
+    episodes  dataset, start, end, level, peak, points
+              risk episodes found in those datasets' predictions
+
+The datasets are registered with DuckDB as they are, so it scans the
+DataFrames' NumPy columns directly instead of copying them into tables, and
+``readings`` is a UNION ALL view over them with the column names shortened.
+Queries cannot read or write files, and run for at most QUERY_TIMEOUT seconds.
+"""
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+TIME_COLUMN = 'Time'
+RISK_COLUMN = 'Predicted_Hydrate_Likelihood'
+
+# View column -> dataset column
+READING_COLUMNS = {
+    'volume': 'Inj Gas Meter Volume Instantaneous',
+    'setpoint': 'Inj Gas Meter Volume Setpoint',
+    'valve': 'Inj Gas Valve Percent Open',
+    'label': 'Likelihood of Hydrate',
+    'risk': RISK_COLUMN,
+}
+
+QUERY_TIMEOUT = 30
+MEMORY_LIMIT = '1GB'
+
+
+class QueryError(ValueError):
+    """A query that DuckDB rejected, failed on or stopped"""
+
+
+EXAMPLE_QUERIES = {
+    "Hours with valve above 60% and volume 10% under setpoint": """\
+-- Setpoint and valve are only recorded when they change, so carry their last values forward
+WITH filled AS (
+    SELECT well, volume,
+           last_value(setpoint IGNORE NULLS) OVER w AS setpoint,
+           last_value(valve IGNORE NULLS) OVER w AS valve,
+           date_diff('second', time, lead(time) OVER w) / 3600.0 AS hours
+    FROM readings
+    WINDOW w AS (PARTITION BY well ORDER BY time)
+)
+SELECT well, round(sum(hours), 1) AS hours
+FROM filled
+WHERE valve > 60 AND volume < 0.9 * setpoint
+GROUP BY well
+ORDER BY hours DESC""",
+    "Peak and mean predicted risk per well and day": """\
+SELECT well, date_trunc('day', time) AS day,
+       round(max(risk), 2) AS peak_risk, round(avg(risk), 2) AS mean_risk, count(*) AS readings
+FROM readings
+GROUP BY ALL
+ORDER BY well, day""",
+    "Readings and time span per well": """\
+SELECT well, count(*) AS readings, min(time) AS first, max(time) AS last,
+       round(avg(volume), 1) AS mean_volume
+FROM readings
+GROUP BY well
+ORDER BY readings DESC""",
+    "Critical episodes, longest first": """\
+SELECT dataset, start, "end", round(peak, 2) AS peak,
+       date_diff('minute', start, "end") AS minutes
+FROM episodes
+WHERE level = 'CRITICAL'
+ORDER BY minutes DESC""",
+}
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def readings_view(frames):
+    """SQL of the readings view over the tables well_0, well_1, ... registered for frames"""
+    selects = []
+    for position, (name, df) in enumerate(frames.items()):
+        columns = [f"{_literal(name)} AS well"]
+        if TIME_COLUMN in df.columns:
+            columns.append(f"TRY_CAST({_quote(TIME_COLUMN)} AS TIMESTAMP) AS time")
+        else:
+            columns.append("NULL::TIMESTAMP AS time")
+        for alias, column in READING_COLUMNS.items():
+            if column in df.columns:
+                columns.append(f"TRY_CAST({_quote(column)} AS DOUBLE) AS {alias}")
+            else:
+                columns.append(f"NULL::DOUBLE AS {alias}")
+        selects.append(f"SELECT {', '.join(columns)} FROM well_{position}")
+    if not selects:
+        empty = ", ".join(f"NULL::DOUBLE AS {alias}" for alias in READING_COLUMNS)
+        return f"SELECT NULL::VARCHAR AS well, NULL::TIMESTAMP AS time, {empty} WHERE false"
+    return "\nUNION ALL\n".join(selects)
+
+
+def connect(frames, episodes=None):
+    """In-memory connection with the readings and episodes views over the given frames"""
+    connection = duckdb.connect(':memory:')
+    for position, df in enumerate(frames.values()):
+        connection.register(f"well_{position}", df)
+    connection.execute(f"CREATE VIEW readings AS {readings_view(frames)}")
+    if episodes is None:
+        episodes = pd.DataFrame({
+            'dataset': pd.Series(dtype=str), 'start': pd.Series(dtype='datetime64[ns]'),
+            'end': pd.Series(dtype='datetime64[ns]'), 'level': pd.Series(dtype=str),
+            'peak': pd.Series(dtype=float), 'points': pd.Series(dtype=int),
+        })
+    connection.register('episodes', episodes)
+    # Registered frames stay readable; files and extensions do not
+    connection.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+    connection.execute("SET enable_external_access = false")
+    connection.execute("SET lock_configuration = true")
+    return connection
+
+
+def run_query(sql, frames, episodes=None, timeout=QUERY_TIMEOUT):
+    """Run a query over the frames; returns (result frame, seconds)
+
+    Raises QueryError for invalid SQL, and for queries still running after
+    timeout seconds.
+    """
+    connection = connect(frames, episodes)
+    timer = threading.Timer(timeout, connection.interrupt)
+    started = time.perf_counter()
+    timer.start()
+    try:
+        result = connection.execute(sql).df()
+    except duckdb.InterruptException:
+        raise QueryError(f"The query was stopped after {timeout} seconds.")
+    except duckdb.Error as e:
+        raise QueryError(str(e)) from e
+    finally:
+        timer.cancel()
+        connection.close()
+    return result, time.perf_counter() - started
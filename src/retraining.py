@@ -0,0 +1,182 @@
+"""Background retraining in a worker process
+
+``RetrainManager.submit`` starts a retrain in a separate process and returns
+immediately. The worker reports progress through a queue, runs its
+cross-validation folds in parallel, and sends the fitted model back. The
+model is only published to the ``ModelRegistry`` if it passes the metric
+gate, so every session keeps scoring with the previous model until the swap.
+
+``run_incremental_job`` is the cheap alternative to a full refit: it grows
+the current forest with trees fitted on newly labeled rows only, so its cost
+scales with the new data, and can report a full refit's accuracy alongside.
+"""
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import streamlit as st
+from sklearn.model_selection import train_test_split
+
+from drift import DriftProfile
+from features import FEATURE_COLUMNS, prepared_inputs
+from hydrate_model import (MAX_TREES, ModelVersion, cross_validate, evaluate_model, fit_hydrate_model,
+                           load_training_set, passes_gate, training_matrix, update_hydrate_model)
+
+
+def _report(progress, fraction, message):
+    if progress is not None:
+        progress.put((fraction, message))
+
+
+def run_retrain_job(progress=None, cv_folds=5, n_estimators=100, max_rows=None):
+    """Worker entry point: full refit on the training data with cross-validation"""
+    _report(progress, 0.05, "Loading training data and building features")
+    training = load_training_set(max_rows)
+    X, y = training.X, training.y
+
+    _report(progress, 0.25, f"Cross-validating ({cv_folds} folds in parallel)")
+    fold_scores = cross_validate(X, y, folds=cv_folds, n_estimators=n_estimators, n_jobs=cv_folds)
+
+    _report(progress, 0.7, "Fitting final model")
+    model, scaler, metrics = fit_hydrate_model(X, y, n_estimators=n_estimators, n_jobs=-1)
+    metrics['cv_r2'] = float(np.mean(fold_scores))
+    metrics['cv_r2_std'] = float(np.std(fold_scores))
+
+    _report(progress, 1.0, "Training finished")
+    return model, scaler, FEATURE_COLUMNS, metrics, training.profile()
+
+
+def run_incremental_job(progress=None, model=None, scaler=None, frames=(), new_trees=20,
+                        max_trees=MAX_TREES, compare=False, random_state=42, profile=None):
+    """Worker entry point: add trees fitted on newly labeled frames to the current forest
+
+    The new trees have seen the new rows as well, so their inputs are added
+    to the current model's drift profile.
+    """
+    _report(progress, 0.05, "Building features for the new labeled data")
+    # Features are built per well so windows never run across two wells
+    matrices = [training_matrix(frame) for frame in frames]
+    X = np.concatenate([X_part for X_part, _ in matrices])
+    y = np.concatenate([y_part for _, y_part in matrices])
+    inputs = np.concatenate([prepared_inputs(frame).to_numpy(dtype=np.float64, na_value=np.nan) for frame in frames])
+    # Unlabeled rows still fed the rolling features above, but are not fitted on
+    labeled = ~np.isnan(y.astype(np.float64))
+    X, y, inputs = X[labeled], y[labeled], inputs[labeled]
+    if len(y) < 2:
+        raise ValueError("the selected datasets have too few labeled rows")
+    X_train, X_test, y_train, y_test, inputs_train, _ = train_test_split(X, y, inputs, test_size=0.2,
+                                                                         random_state=random_state)
+
+    _report(progress, 0.3, f"Fitting {new_trees} new trees on {len(y_train):,} rows")
+    start = time.perf_counter()
+    updated = update_hydrate_model(model, scaler, X_train, y_train, new_trees, max_trees, random_state)
+    metrics = evaluate_model(updated, scaler, X_test, y_test)
+    metrics['rows'] = int(len(y))
+    metrics['trees'] = int(updated.n_estimators)
+    metrics['seconds'] = time.perf_counter() - start
+    # The gate compares against the current model on the same new rows
+    metrics['baseline_r2'] = evaluate_model(model, scaler, X_test, y_test)['r2']
+
+    if compare:
+        _report(progress, 0.5, "Fitting a full refit for comparison")
+        training = load_training_set()
+        X_old, y_old = training.X, training.y
+        start = time.perf_counter()
+        refit, refit_scaler, _ = fit_hydrate_model(np.concatenate([X_old, X_train]), np.concatenate([y_old, y_train]),
+                                                   random_state=random_state)
+        metrics['refit_seconds'] = time.perf_counter() - start
+        metrics['refit_r2'] = evaluate_model(refit, refit_scaler, X_test, y_test)['r2']
+
+    new_profile = DriftProfile.from_inputs(inputs_train)
+    if profile is not None:
+        new_profile = profile.merged(new_profile)
+
+    _report(progress, 1.0, "Update finished")
+    return updated, scaler, FEATURE_COLUMNS, metrics, new_profile
+
+
+class RetrainManager:
+    """Run one retrain at a time off the page thread and publish what passes the gate"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.jobs = []
+        self._executor = None
+        self._manager = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        # Spawn rather than fork: the server process is multi-threaded
+        if self._executor is None:
+            context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=context)
+            self._manager = context.Manager()
+
+    def latest_job(self):
+        return self.jobs[-1] if self.jobs else None
+
+    def running(self):
+        job = self.latest_job()
+        return job is not None and job['state'] in ("queued", "running")
+
+    def submit(self, job_fn=run_retrain_job, source="retrain", **options):
+        """Start a background retrain; returns the job, or the one already running"""
+        with self._lock:
+            if self.running():
+                return self.latest_job()
+            self._ensure_worker()
+
+            job = {
+                'id': uuid.uuid4().hex[:8],
+                'source': source,
+                'state': "queued",
+                'progress': 0.0,
+                'message': "Waiting for worker",
+                'metrics': None,
+                'submitted_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'finished_at': None,
+            }
+            self.jobs.append(job)
+
+            progress = self._manager.Queue()
+            future = self._executor.submit(job_fn, progress, **options)
+            threading.Thread(target=self._monitor, args=(job, future, progress),
+                             name=f"retrain-{job['id']}", daemon=True).start()
+            return job
+
+    def _monitor(self, job, future, progress):
+        while not future.done():
+            try:
+                job['progress'], job['message'] = progress.get(timeout=0.5)
+                job['state'] = "running"
+            except Exception:
+                pass
+
+        try:
+            model, scaler, feature_columns, metrics, profile = future.result()
+        except Exception as e:
+            job.update(state="failed", message=f"Retraining failed: {e}")
+        else:
+            job['metrics'] = metrics
+            current = self.registry.current()
+            if 'baseline_r2' in metrics:
+                reference = {'r2': metrics['baseline_r2']}
+            else:
+                reference = current.metrics if current else None
+            passed, reason = passes_gate(metrics, reference)
+            if passed:
+                version = self.registry.publish(ModelVersion(model, scaler, feature_columns, metrics,
+                                                             source=job['source'], profile=profile))
+                job.update(state="published", progress=1.0, message=f"Published as model version {version}")
+            else:
+                job.update(state="rejected", progress=1.0, message=f"Kept the current model: {reason}")
+        job['finished_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+@st.cache_resource
+def get_retrain_manager(_registry):
+    """Process-wide retrain manager for the shared model registry"""
+    return RetrainManager(_registry)
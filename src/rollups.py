@@ -0,0 +1,214 @@
+"""Materialized time rollups of a dataset at 15 minutes, 1 hour and 1 day
+
+Each tier keeps one row per time bucket with aggregates that can be merged:
+min, max, sum, count and the last reading (with its time) for the measured
+quantities, and max, sum and count for predicted risk. Means are derived as
+sum / count when a tier is read. Because the aggregates merge, the hourly
+tier is built from the 15-minute one and the daily tier from the hourly
+one, and rows appended to a dataset only touch the buckets they fall in:
+
+    rollups = Rollups.from_frame(df)
+    rollups.append(new_rows)
+    hourly = rollups.frame('1h', start, end)
+
+Charts of long windows, the home page and the fleet heatmap read these
+tiers, so their cost depends on the number of buckets shown rather than the
+number of raw readings behind them.
+"""
+import numpy as np
+import pandas as pd
+
+TIME_COLUMN = 'Time'
+RISK_COLUMN = 'Predicted_Hydrate_Likelihood'
+
+# Quantity -> source column
+MEASUREMENTS = {
+    'Volume': 'Inj Gas Meter Volume Instantaneous',
+    'Setpoint': 'Inj Gas Meter Volume Setpoint',
+    'Valve': 'Inj Gas Valve Percent Open',
+}
+QUANTITIES = {**MEASUREMENTS, 'Risk': RISK_COLUMN}
+
+MEASUREMENT_STATS = ('min', 'max', 'sum', 'count', 'last', 'last_time')
+RISK_STATS = ('max', 'sum', 'count')
+
+# Finest first; each tier is rolled up from the one before it
+TIERS = {
+    '15min': pd.Timedelta(minutes=15),
+    '1h': pd.Timedelta(hours=1),
+    '1D': pd.Timedelta(days=1),
+}
+
+
+def _stats(quantity):
+    return RISK_STATS if quantity == 'Risk' else MEASUREMENT_STATS
+
+
+def _partial(times, values, quantity, freq):
+    """Aggregates of one quantity's readings per bucket"""
+    present = ~np.isnan(values) & ~np.isnat(times)
+    series = pd.Series(values[present], index=times[present])
+    if not series.index.is_monotonic_increasing:
+        series = series.sort_index(kind='stable')
+    grouped = series.groupby(series.index.floor(freq), sort=True)
+    stats = {'max': grouped.max(), 'sum': grouped.sum(), 'count': grouped.count()}
+    if quantity != 'Risk':
+        stats['min'] = grouped.min()
+        stats['last'] = grouped.last()
+        stats['last_time'] = pd.Series(series.index, index=series.index).groupby(series.index.floor(freq)).last()
+    return pd.DataFrame({(quantity, stat): stats[stat] for stat in _stats(quantity)})
+
+
+def _fill_counts(frame):
+    """Buckets a quantity has no readings in count zero readings, not missing ones"""
+    counts = [col for col in frame.columns if col[1] in ('sum', 'count')]
+    frame[counts] = frame[counts].fillna(0)
+    return frame
+
+
+def _merge(frame):
+    """Combine partial aggregates that share a bucket"""
+    if frame.index.is_unique:
+        return frame.sort_index()
+    merged = {}
+    for quantity, stat in frame.columns:
+        column = frame[(quantity, stat)].groupby(level=0, sort=True)
+        if stat in ('min', 'max'):
+            merged[(quantity, stat)] = getattr(column, stat)()
+        elif stat in ('sum', 'count'):
+            merged[(quantity, stat)] = column.sum()
+    for quantity in frame.columns.get_level_values(0).unique():
+        if (quantity, 'last_time') not in frame.columns:
+            continue
+        # The latest reading wins, whichever partial it came from
+        ordered = frame.sort_values((quantity, 'last_time'), kind='stable', na_position='first')
+        for stat in ('last', 'last_time'):
+            merged[(quantity, stat)] = ordered[(quantity, stat)].groupby(level=0, sort=True).last()
+    return pd.DataFrame(merged)[frame.columns]
+
+
+def _rebucket(frame, freq):
+    """Roll a finer tier up into coarser buckets"""
+    return _merge(frame.set_axis(frame.index.floor(freq)))
+
+
+def _combine(existing, new):
+    """Merge new partial aggregates into a tier, touching only the buckets they cover"""
+    if existing is None or existing.empty:
+        return new
+    if new.empty:
+        return existing
+    start = new.index[0]
+    head = existing[existing.index < start]
+    tail = existing[existing.index >= start]
+    return pd.concat([head, _merge(pd.concat([tail, new]))])
+
+
+class Rollups:
+    """Rollup tiers of one dataset
+
+    ``source`` is the frame the tiers describe, so callers can tell when a
+    dataset has been replaced and the tiers need rebuilding.
+    """
+
+    def __init__(self, source=None):
+        self.source = source
+        self.tiers = dict.fromkeys(TIERS)
+
+    @classmethod
+    def from_frame(cls, df):
+        rollups = cls(df)
+        rollups.append(df)
+        return rollups
+
+    def _partials(self, df, quantities):
+        """Finest-tier aggregates of the given quantities in df"""
+        times = pd.to_datetime(df[TIME_COLUMN], format='mixed', errors='coerce').to_numpy()
+        freq = next(iter(TIERS.values()))
+        parts = [_partial(times, df[QUANTITIES[q]].to_numpy(dtype=np.float64), q, freq)
+                 for q in quantities if QUANTITIES[q] in df.columns]
+        if not parts:
+            return None
+        return _fill_counts(pd.concat(parts, axis=1))
+
+    def append(self, df, quantities=tuple(QUANTITIES)):
+        """Merge new readings into every tier"""
+        if TIME_COLUMN not in df.columns or not len(df):
+            return
+        partial = self._partials(df, quantities)
+        if partial is None:
+            return
+        for name, freq in TIERS.items():
+            if name != next(iter(TIERS)):
+                partial = _rebucket(partial, freq)
+            self.tiers[name] = _combine(self.tiers[name], partial)
+
+    def replace(self, df, quantities):
+        """Rebuild some quantities from df, e.g. risk after a dataset is rescored"""
+        for name, tier in self.tiers.items():
+            if tier is not None:
+                self.tiers[name] = tier.drop(columns=list(quantities), level=0, errors='ignore')
+        if TIME_COLUMN not in df.columns or not len(df):
+            return
+        partial = self._partials(df, quantities)
+        if partial is None:
+            return
+        for name, freq in TIERS.items():
+            if name != next(iter(TIERS)):
+                partial = _rebucket(partial, freq)
+            tier = self.tiers[name]
+            self.tiers[name] = partial if tier is None else _fill_counts(tier.join(partial, how='outer'))
+
+    def has(self, quantity):
+        tier = self.tiers[next(iter(TIERS))]
+        return tier is not None and quantity in tier.columns.get_level_values(0)
+
+    @property
+    def span(self):
+        """(first bucket, last bucket) of the finest tier, or (None, None)"""
+        tier = self.tiers[next(iter(TIERS))]
+        if tier is None or tier.empty:
+            return None, None
+        return tier.index[0], tier.index[-1]
+
+    def frame(self, tier, start=None, end=None):
+        """Buckets of a tier in [start, end] with flat columns like 'Volume_mean' and 'Risk_max'"""
+        data = self.tiers[tier]
+        if data is None:
+            return pd.DataFrame()
+        if start is not None or end is not None:
+            lo = 0 if start is None else data.index.searchsorted(pd.Timestamp(start).floor(TIERS[tier]), 'left')
+            hi = len(data) if end is None else data.index.searchsorted(pd.Timestamp(end), 'right')
+            data = data.iloc[lo:hi]
+        columns = {}
+        for quantity in data.columns.get_level_values(0).unique():
+            count = data[(quantity, 'count')]
+            for stat in _stats(quantity):
+                if stat not in ('sum', 'last_time'):
+                    columns[f"{quantity}_{stat}"] = data[(quantity, stat)]
+            columns[f"{quantity}_mean"] = data[(quantity, 'sum')] / count.where(count > 0)
+        return pd.DataFrame(columns, index=data.index.rename(TIME_COLUMN))
+
+    def tier_for(self, start, end, max_points):
+        """Finest tier showing [start, end] in at most max_points buckets"""
+        first, last = self.span
+        start = first if start is None else pd.Timestamp(start)
+        end = last if end is None else pd.Timestamp(end)
+        if start is None:
+            return next(reversed(TIERS))
+        for name, freq in TIERS.items():
+            if (end - start) / freq <= max_points:
+                return name
+        return next(reversed(TIERS))
+
+    @property
+    def nbuckets(self):
+        return sum(len(tier) for tier in self.tiers.values() if tier is not None)
+
+
+def fleet_heatmap(rollups, tier='1h', stat='max'):
+    """Risk per well and bucket: one row per well with risk, one column per bucket"""
+    rows = {name: r.frame(tier)[f"Risk_{stat}"] for name, r in rollups.items() if r.has('Risk')}
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).T.sort_index(axis=1)
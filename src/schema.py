@@ -0,0 +1,200 @@
+"""Validate and coerce uploaded well data before anything else touches it
+
+``validate_frame`` maps the header names used by different historian exports
+onto the four required columns, converts them to native dtypes in bulk, and
+moves rows with values that cannot be read into a quarantine report instead
+of failing the whole upload. Blank setpoint and valve readings are expected
+(the historian only records them when they change) and are kept as missing.
+
+Timestamps are parsed with the first known export format that fits a sample
+of the column, which is vectorized; element-by-element parsing is only used
+for the values no known format can read.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+TIME_COLUMN = 'Time'
+NUMERIC_COLUMNS = [
+    'Inj Gas Meter Volume Instantaneous',
+    'Inj Gas Meter Volume Setpoint',
+    'Inj Gas Valve Percent Open',
+]
+REQUIRED_COLUMNS = [TIME_COLUMN] + NUMERIC_COLUMNS
+
+# Normalized header -> required column
+HEADER_ALIASES = {
+    'time': TIME_COLUMN,
+    'timestamp': TIME_COLUMN,
+    'date time': TIME_COLUMN,
+    'datetime': TIME_COLUMN,
+    'date': TIME_COLUMN,
+    'inj gas meter volume instantaneous': 'Inj Gas Meter Volume Instantaneous',
+    'inj gas meter volume': 'Inj Gas Meter Volume Instantaneous',
+    'inj gas volume instantaneous': 'Inj Gas Meter Volume Instantaneous',
+    'injection gas volume': 'Inj Gas Meter Volume Instantaneous',
+    'gas volume instantaneous': 'Inj Gas Meter Volume Instantaneous',
+    'volume instantaneous': 'Inj Gas Meter Volume Instantaneous',
+    'gas volume': 'Inj Gas Meter Volume Instantaneous',
+    'inj gas meter volume setpoint': 'Inj Gas Meter Volume Setpoint',
+    'inj gas volume setpoint': 'Inj Gas Meter Volume Setpoint',
+    'injection gas setpoint': 'Inj Gas Meter Volume Setpoint',
+    'gas volume setpoint': 'Inj Gas Meter Volume Setpoint',
+    'volume setpoint': 'Inj Gas Meter Volume Setpoint',
+    'setpoint': 'Inj Gas Meter Volume Setpoint',
+    'inj gas valve percent open': 'Inj Gas Valve Percent Open',
+    'inj gas valve open': 'Inj Gas Valve Percent Open',
+    'injection valve percent open': 'Inj Gas Valve Percent Open',
+    'valve percent open': 'Inj Gas Valve Percent Open',
+    'valve open': 'Inj Gas Valve Percent Open',
+    'valve position': 'Inj Gas Valve Percent Open',
+}
+
+# Timestamp formats seen in historian exports, tried in order
+TIME_FORMATS = (
+    '%m/%d/%Y %I:%M:%S %p',
+    '%m/%d/%Y %I:%M %p',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+)
+FORMAT_SAMPLE_ROWS = 200
+
+# Examples of bad values kept per column in the report summary
+EXAMPLES_PER_COLUMN = 5
+
+
+class SchemaError(ValueError):
+    """An upload is missing required columns"""
+
+
+def normalize_header(name):
+    """Lower-case a header and reduce punctuation and units to single spaces"""
+    name = str(name).lower().replace('%', ' percent ')
+    name = re.sub(r'\(.*?\)|\[.*?\]', ' ', name)
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', name).split())
+
+
+def map_headers(columns):
+    """Renames that bring known header aliases onto the required column names"""
+    renames = {}
+    taken = {col for col in columns if col in REQUIRED_COLUMNS}
+    for col in columns:
+        if col in REQUIRED_COLUMNS:
+            continue
+        target = HEADER_ALIASES.get(normalize_header(col))
+        if target is not None and target not in taken:
+            renames[col] = target
+            taken.add(target)
+    return renames
+
+
+def _blank(values):
+    """Missing or whitespace-only entries, which are gaps rather than errors"""
+    blank = values.isna().to_numpy().copy()
+    if values.dtype == object or pd.api.types.is_string_dtype(values):
+        blank |= values.astype(str).str.strip().isin(['', 'nan', 'NaN', 'None', 'NULL', 'null']).to_numpy()
+    return blank
+
+
+def coerce_numeric(values):
+    """Float column plus a mask of entries that were present but unreadable"""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype(np.float64), np.zeros(len(values), dtype=bool)
+    # Thousands separators are common in exported volumes
+    cleaned = values.astype(str).str.replace(',', '', regex=False).str.strip()
+    coerced = pd.to_numeric(cleaned, errors='coerce')
+    bad = coerced.isna().to_numpy() & ~_blank(values)
+    return coerced.astype(np.float64), bad
+
+
+def detect_time_format(values):
+    """Known format that parses the most of a sample of the column, or None"""
+    sample = values[~_blank(values)].astype(str).head(FORMAT_SAMPLE_ROWS)
+    best, best_parsed = None, 0
+    for fmt in TIME_FORMATS:
+        parsed = int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+        if parsed > best_parsed:
+            best, best_parsed = fmt, parsed
+        if parsed == len(sample):
+            break
+    return best
+
+
+def coerce_time(values):
+    """Datetime column plus a mask of entries that were present but unreadable"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, np.zeros(len(values), dtype=bool)
+    fmt = detect_time_format(values)
+    if fmt is not None:
+        parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+    else:
+        parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    # Only what the known format could not read is parsed element by element
+    retry = parsed.isna().to_numpy() & ~_blank(values)
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry].astype(str), format='mixed', errors='coerce')
+    bad = parsed.isna().to_numpy() & ~_blank(values)
+    return parsed, bad
+
+
+class ValidationResult:
+    """Clean frame, quarantined rows and what was changed on the way"""
+
+    def __init__(self, frame, quarantine, renamed):
+        self.frame = frame
+        self.quarantine = quarantine
+        self.renamed = renamed
+
+    @property
+    def rows_quarantined(self):
+        return self.quarantine['row'].nunique() if len(self.quarantine) else 0
+
+    def summary(self):
+        """One line per column: how many values were bad and a few examples"""
+        if not len(self.quarantine):
+            return pd.DataFrame(columns=['column', 'bad_values', 'examples'])
+        grouped = self.quarantine.groupby('column', sort=False)['value']
+        return pd.DataFrame({
+            'bad_values': grouped.size(),
+            'examples': grouped.agg(lambda v: ', '.join(map(repr, v.unique()[:EXAMPLES_PER_COLUMN]))),
+        }).reset_index()
+
+
+def validate_frame(df):
+    """Check and coerce one dataset; raises SchemaError if required columns are missing"""
+    renamed = map_headers(df.columns)
+    if renamed:
+        df = df.rename(columns=renamed)
+
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise SchemaError(f"Missing required columns: {missing}. Found: {list(df.columns)}")
+
+    coerced = {}
+    bad_masks = {}
+    coerced[TIME_COLUMN], bad_masks[TIME_COLUMN] = coerce_time(df[TIME_COLUMN])
+    for col in NUMERIC_COLUMNS:
+        coerced[col], bad_masks[col] = coerce_numeric(df[col])
+
+    # File line numbers: the header is line 1
+    reports = []
+    for col, bad in bad_masks.items():
+        if bad.any():
+            positions = np.flatnonzero(bad)
+            reports.append(pd.DataFrame({
+                'row': positions + 2,
+                'column': col,
+                'value': df[col].iloc[positions].astype(str).to_numpy(),
+                'reason': "unreadable timestamp" if col == TIME_COLUMN else "not a number",
+            }))
+    quarantine = (pd.concat(reports).sort_values('row', kind='stable', ignore_index=True) if reports
+                  else pd.DataFrame(columns=['row', 'column', 'value', 'reason']))
+
+    clean = df.assign(**coerced)
+    bad_rows = np.logical_or.reduce(list(bad_masks.values()))
+    if bad_rows.any():
+        clean = clean[~bad_rows].reset_index(drop=True)
+    return ValidationResult(clean, quarantine, renamed)
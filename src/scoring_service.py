@@ -0,0 +1,250 @@
+"""Local HTTP scoring service for the hydrate model
+
+Exposes the trained model to other tools without the UI:
+
+    python src/scoring_service.py --port 8600
+
+    POST /score    JSON ({"rows": [...]} or a list of records) or CSV with a header row
+    GET  /metrics  per-request latency percentiles and batching stats
+    GET  /health   liveness check
+
+Concurrent requests are coalesced into micro-batches so the forest is called
+once per batch instead of once per request. Features are still built per
+request, because rolling features must not run across two callers' rows.
+With --screen, only rows flagged by the volume-drop pre-filter are batched
+for the forest and the rest are returned as 0, unless the pre-filter misses
+rows the current model scores high on its training set.
+"""
+import io
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from pages.data_analysis import prepare_features, train_hydrate_model
+from prefilter import screen, screen_is_safe
+from schema import REQUIRED_COLUMNS, map_headers
+
+
+class _PendingRequest:
+    def __init__(self, features):
+        self.features = features
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Coalesce concurrent scoring requests into a single model call"""
+
+    def __init__(self, model, scaler, max_batch_rows=4096, max_wait=0.005):
+        self.model = model
+        self.scaler = scaler
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self.batch_sizes = deque(maxlen=1000)
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def score(self, features):
+        """Score a feature matrix, blocking until its batch has been predicted"""
+        request = _PendingRequest(features)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        rows = len(batch[0].features)
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            rows += len(request.features)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                X = np.vstack([request.features for request in batch])
+                predictions = self.model.predict(self.scaler.transform(X))
+                offset = 0
+                for request in batch:
+                    request.result = predictions[offset:offset + len(request.features)]
+                    offset += len(request.features)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self.batch_sizes.append(len(batch))
+            for request in batch:
+                request.done.set()
+
+
+class ScoringService:
+    """Parse rows, build features and score them through the micro-batcher"""
+
+    def __init__(self, model, scaler, feature_columns, max_batch_rows=4096, max_wait=0.005, screen=False):
+        self.feature_columns = feature_columns
+        self.batcher = MicroBatcher(model, scaler, max_batch_rows, max_wait)
+        self.screen = screen
+        self.latencies = deque(maxlen=10000)
+        self.requests = 0
+        self.errors = 0
+        self.rows_scored = 0
+        self.rows_screened_out = 0
+        self._lock = threading.Lock()
+
+    def score_frame(self, df):
+        # Predictions line up with the request rows, so only headers are mapped here
+        df = df.rename(columns=map_headers(df.columns))
+        missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {missing}")
+        features = prepare_features(df, self.feature_columns, cache=False)
+        if not self.screen:
+            return self.batcher.score(features)
+
+        flagged = screen(features, self.feature_columns)
+        predictions = np.zeros(len(features))
+        if flagged.any():
+            predictions[flagged] = self.batcher.score(features[flagged])
+        with self._lock:
+            self.rows_scored += int(flagged.sum())
+            self.rows_screened_out += int(len(flagged) - flagged.sum())
+        return predictions
+
+    def record(self, seconds, ok=True):
+        with self._lock:
+            self.requests += 1
+            if ok:
+                self.latencies.append(seconds)
+            else:
+                self.errors += 1
+
+    def metrics(self):
+        with self._lock:
+            latencies = np.fromiter(self.latencies, dtype=float)
+            requests, errors = self.requests, self.errors
+        batch_sizes = np.fromiter(self.batcher.batch_sizes, dtype=float)
+
+        result = {'requests': requests, 'errors': errors}
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            result['latency_ms'] = {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3)}
+        if len(batch_sizes):
+            result['mean_requests_per_batch'] = round(float(batch_sizes.mean()), 2)
+        if self.screen:
+            result['rows_scored'] = self.rows_scored
+            result['rows_screened_out'] = self.rows_screened_out
+        return result
+
+
+def parse_rows(body, content_type):
+    """Turn a JSON or CSV request body into a DataFrame"""
+    if 'csv' in content_type:
+        return pd.read_csv(io.BytesIO(body))
+    payload = json.loads(body or b"null")
+    if isinstance(payload, dict):
+        payload = payload.get('rows')
+    if not isinstance(payload, list):
+        raise ValueError("Expected a list of rows or an object with a 'rows' list")
+    return pd.DataFrame.from_records(payload)
+
+
+def make_handler(service):
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            elif self.path == '/metrics':
+                self._send_json(200, service.metrics())
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/score':
+                self._send_json(404, {'error': 'not found'})
+                return
+
+            start = time.perf_counter()
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                df = parse_rows(self.rfile.read(length), self.headers.get('Content-Type', ''))
+                predictions = service.score_frame(df)
+            except ValueError as e:
+                service.record(time.perf_counter() - start, ok=False)
+                self._send_json(400, {'error': str(e)})
+                return
+            except Exception as e:
+                service.record(time.perf_counter() - start, ok=False)
+                self._send_json(500, {'error': str(e)})
+                return
+
+            elapsed = time.perf_counter() - start
+            service.record(elapsed)
+            self._send_json(200, {
+                'predictions': predictions.tolist(),
+                'latency_ms': round(elapsed * 1000, 3),
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScoringHandler
+
+
+def create_server(host="127.0.0.1", port=8600, max_batch_rows=4096, max_wait=0.005, screen=False):
+    """Load the model once and build the HTTP server around it"""
+    model, scaler, feature_columns = train_hydrate_model()
+    if model is None:
+        raise RuntimeError("Could not train the hydrate model")
+
+    if screen:
+        screen = screen_is_safe(model, scaler, feature_columns)
+
+    service = ScoringService(model, scaler, feature_columns, max_batch_rows, max_wait, screen)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.service = service
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve hydrate risk scores over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--max-batch-rows", type=int, default=4096)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--screen", action="store_true", help="only run the forest on rows flagged by the pre-filter")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.max_batch_rows, args.max_wait_ms / 1000, args.screen)
+    print(f"Scoring service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,367 @@
+"""Tail-follow streaming for historian CSVs that are appended to continuously
+
+The historian appends a few rows to the well's CSV every couple of minutes.
+Instead of re-reading and re-scoring the whole file, a ``StreamFollower``
+remembers the byte offset it has consumed, parses only the newly appended
+bytes, and scores new rows in micro-batches. The last few rows of every batch
+are kept as context so rolling-window features come out exactly as they would
+for the whole file.
+
+Run against a local simulator:
+
+    python src/streaming.py simulate data/Example.csv /tmp/well.csv
+    python src/streaming.py follow /tmp/well.csv
+"""
+import csv
+import io
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from features import HISTORY_ROWS
+from drift import DriftProfile
+from rollups import Rollups
+
+# The app only follows files under this directory; unset, following is off
+FOLLOW_DIR_ENV = "HYDRATE_FOLLOW_DIR"
+
+# Rows of history needed by the widest rolling feature
+CONTEXT_ROWS = max(HISTORY_ROWS, 4)
+
+# Same thresholds as the banners on the analysis page
+WARNING_THRESHOLD = 5.0
+CRITICAL_THRESHOLD = 7.0
+
+# Scored rows handed to the alert engine after each batch, so episodes that
+# started in an earlier batch are still seen whole
+ALERT_LOOKBACK_ROWS = 2000
+
+
+def follow_root():
+    """Real path of the directory the app may follow files in, or None"""
+    root = os.environ.get(FOLLOW_DIR_ENV)
+    return os.path.realpath(root) if root else None
+
+
+def resolve_follow_path(path, root):
+    """Real path of a file inside root, or None if it is outside root or not a file
+
+    Relative paths are taken from root. Symlinks and '..' are resolved
+    first, so neither can point the follower anywhere else.
+    """
+    if not path or root is None:
+        return None
+    real = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([real, root]) != root or not os.path.isfile(real):
+        return None
+    return real
+
+
+class CsvTailer:
+    """Parse only the bytes appended to a CSV file since the previous poll"""
+
+    def __init__(self, path, from_end=False):
+        self.path = path
+        self.from_end = from_end
+        self.offset = 0
+        self.header = None
+        self._partial = b""
+        self._inode = None
+
+    def _reset(self):
+        self.offset = 0
+        self.header = None
+        self._partial = b""
+
+    def poll(self, max_bytes=None):
+        """Return the complete rows appended since the last call as a DataFrame"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        # Start over if the historian rotated or truncated the file
+        if self._inode is not None and (stat.st_ino != self._inode or stat.st_size < self.offset):
+            self._reset()
+        self._inode = stat.st_ino
+
+        if stat.st_size == self.offset:
+            return None
+
+        with open(self.path, 'rb') as fh:
+            if self.header is None:
+                # Quoted column names may contain commas
+                self.header = next(csv.reader([fh.readline().decode('utf-8').strip()]), [])
+                self.offset = fh.tell()
+                if self.from_end:
+                    # Only follow rows written after we attached
+                    self.offset = stat.st_size
+                    return None
+            fh.seek(self.offset)
+            data = fh.read(max_bytes) if max_bytes else fh.read()
+
+        self.offset += len(data)
+        data = self._partial + data
+
+        # Keep a trailing half-written line for the next poll
+        cut = data.rfind(b"\n")
+        if cut == -1:
+            self._partial = data
+            return None
+        complete, self._partial = data[:cut + 1], data[cut + 1:]
+        if not complete.strip():
+            return None
+
+        return pd.read_csv(io.BytesIO(complete), header=None, names=self.header)
+
+
+class StreamFollower:
+    """Follow a growing CSV, score new rows in micro-batches and raise alerts"""
+
+    def __init__(self, path, score_fn, well_name=None, on_alert=None, alert_engine=None, owner=None,
+                 batch_rows=256, max_latency=2.0, poll_interval=0.5, from_end=False):
+        self.tailer = CsvTailer(path, from_end=from_end)
+        self.score_fn = score_fn
+        self.well_name = well_name or os.path.splitext(os.path.basename(path))[0]
+        self.on_alert = on_alert
+        self.alert_engine = alert_engine
+        self.owner = owner
+        self.batch_rows = batch_rows
+        self.max_latency = max_latency
+        self.poll_interval = poll_interval
+
+        self._context = None
+        self._recent = None
+        self._pending = []
+        self._pending_since = None
+        self._chunks = []
+        self._frame = None
+        self.rollups = Rollups()
+        self._profile = DriftProfile()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.rows_scored = 0
+        self.rows_failed = 0
+        self.batches_scored = 0
+        self.latencies = deque(maxlen=1000)
+        self.last_error = None
+
+    @property
+    def frame(self):
+        """All rows followed so far, with a Predicted_Hydrate_Likelihood column"""
+        with self._lock:
+            if self._frame is None and self._chunks:
+                self._frame = pd.concat(self._chunks, ignore_index=True)
+                self._chunks = [self._frame]
+            return self._frame
+
+    @property
+    def profile(self):
+        """Drift profile of the rows followed so far, as of the last batch"""
+        with self._lock:
+            return self._profile
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def step(self):
+        """Poll the file once and flush the pending batch if it is due"""
+        new_rows = self.tailer.poll()
+        if new_rows is not None and len(new_rows):
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            self._pending.append(new_rows)
+
+        if not self._pending:
+            return None
+
+        pending_rows = sum(len(chunk) for chunk in self._pending)
+        waited = time.monotonic() - self._pending_since
+        if pending_rows >= self.batch_rows or waited >= self.max_latency:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Score every pending row as one batch
+
+        If scoring fails the rows are still kept, with NaN scores, and the
+        error is left in last_error.
+        """
+        if not self._pending:
+            return None
+
+        batch = pd.concat(self._pending, ignore_index=True)
+        arrived = self._pending_since
+        self._pending = []
+        self._pending_since = None
+
+        # Prepend the tail of the previous batch so rolling features see full windows
+        if self._context is not None:
+            window = pd.concat([self._context, batch], ignore_index=True)
+        else:
+            window = batch
+        n_context = len(window) - len(batch)
+
+        try:
+            scores = self.score_fn(window)
+            error = None if scores is not None else "scoring returned no scores"
+        except Exception as e:
+            scores, error = None, str(e)
+        if scores is None:
+            self.rows_failed += len(batch)
+            self.last_error = error
+            scores = np.full(len(batch), np.nan)
+        else:
+            scores = np.asarray(scores)[n_context:]
+
+        batch = batch.copy()
+        batch['Predicted_Hydrate_Likelihood'] = scores
+        self._context = window.tail(CONTEXT_ROWS).reset_index(drop=True)
+
+        # Pages read the profile while batches arrive, so count the batch on a
+        # copy and publish it with the rows; a published profile never changes
+        profile = self._profile.copy()
+        # The context rows carry setpoint and valve forward into the batch
+        profile.update(window, context_rows=n_context)
+        with self._lock:
+            self._chunks.append(batch)
+            self._frame = None
+            self._profile = profile
+        self.rollups.append(batch)
+
+        if error is None:
+            self.rows_scored += len(batch)
+            self.batches_scored += 1
+            self.latencies.append(time.monotonic() - arrived)
+            self._emit_alerts(batch)
+        return batch
+
+    def _emit_alerts(self, batch):
+        if self.alert_engine is not None and 'Time' in batch.columns:
+            if self._recent is not None:
+                recent = pd.concat([self._recent, batch[['Time', 'Predicted_Hydrate_Likelihood']]], ignore_index=True)
+            else:
+                recent = batch[['Time', 'Predicted_Hydrate_Likelihood']]
+            self._recent = recent.tail(ALERT_LOOKBACK_ROWS)
+            self.alert_engine.submit(self.well_name, self._recent['Time'], self._recent['Predicted_Hydrate_Likelihood'],
+                                     owner=self.owner)
+
+        if self.on_alert is None:
+            return
+        scores = batch['Predicted_Hydrate_Likelihood'].to_numpy()
+        if not len(scores) or scores.max() <= WARNING_THRESHOLD:
+            return
+        peak = int(scores.argmax())
+        level = "CRITICAL" if scores[peak] > CRITICAL_THRESHOLD else "WARNING"
+        timestamp = batch['Time'].iloc[peak] if 'Time' in batch.columns else None
+        self.on_alert(self.well_name, timestamp, float(scores[peak]), level)
+
+    def buffers(self):
+        """The rows this follower holds, for memory accounting"""
+        with self._lock:
+            chunks = list(self._chunks)
+        return [chunks, self._pending, self._context, self._recent, self.rollups, self.profile]
+
+    def latency_stats(self):
+        """Percentiles (seconds) of first-arrival to scored latency per batch"""
+        if not self.latencies:
+            return {}
+        values = np.fromiter(self.latencies, dtype=float)
+        return {
+            'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'max': float(values.max()),
+        }
+
+    def run(self):
+        """Follow the file until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                self.step()
+            except Exception as e:
+                self.last_error = str(e)
+            self._stop.wait(self.poll_interval)
+        self.flush()
+
+    def start(self):
+        """Follow the file on a daemon thread"""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name=f"follow-{self.well_name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+def simulate_historian(source_path, target_path, rows_per_tick=5, interval=2.0, stop_event=None):
+    """Replay a CSV into target_path a few rows at a time, like the historian does"""
+    with open(source_path, 'r') as src:
+        header = src.readline()
+        rows = src.readlines()
+
+    with open(target_path, 'w') as dst:
+        dst.write(header)
+        dst.flush()
+        for start in range(0, len(rows), rows_per_tick):
+            if stop_event is not None and stop_event.is_set():
+                break
+            dst.writelines(rows[start:start + rows_per_tick])
+            dst.flush()
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Follow a growing historian CSV")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sim = sub.add_parser("simulate", help="append rows of a CSV to a file over time")
+    sim.add_argument("source")
+    sim.add_argument("target")
+    sim.add_argument("--rows", type=int, default=5)
+    sim.add_argument("--interval", type=float, default=2.0)
+
+    follow = sub.add_parser("follow", help="score rows as they are appended")
+    follow.add_argument("path")
+    follow.add_argument("--batch-rows", type=int, default=256)
+    follow.add_argument("--max-latency", type=float, default=2.0)
+    follow.add_argument("--screen", action="store_true", help="only run the forest on rows flagged by the pre-filter")
+
+    args = parser.parse_args()
+
+    if args.command == "simulate":
+        simulate_historian(args.source, args.target, args.rows, args.interval)
+    else:
+        from pages.data_analysis import train_hydrate_model, predict_hydrate_likelihood
+
+        from prefilter import screen_is_safe
+
+        model, scaler, feature_columns = train_hydrate_model()
+        screen = args.screen and screen_is_safe(model, scaler, feature_columns)
+
+        def score(df):
+            return predict_hydrate_likelihood(df, model, scaler, feature_columns, cache=False, screen=screen)
+
+        def alert(well, timestamp, score, level):
+            print(f"[{level}] {well} {timestamp}: risk {score:.2f}")
+
+        follower = StreamFollower(args.path, score, on_alert=alert,
+                                  batch_rows=args.batch_rows, max_latency=args.max_latency)
+        try:
+            follower.run()
+        except KeyboardInterrupt:
+            follower.flush()
+        print(f"Scored {follower.rows_scored} rows in {follower.batches_scored} batches, "
+              f"latency {follower.latency_stats()}")
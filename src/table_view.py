@@ -0,0 +1,63 @@
+"""Server-side filtering, sorting and paging for the data table
+
+The table only ever sends one page of rows to the browser. Filters and the
+sort are resolved here into an array of row positions, which the page caches
+per query, so moving between pages just slices that array and materialises
+the rows on screen.
+"""
+import numpy as np
+import pandas as pd
+
+RISK_COLUMN = 'Predicted_Hydrate_Likelihood'
+PAGE_SIZES = (50, 100, 500, 1000)
+
+
+def filter_positions(df, times=None, start=None, end=None, min_risk=None):
+    """Positions of the rows inside [start, end] at or above min_risk
+
+    Rows without a time are kept while [start, end] covers every time in
+    the data, so the default full range shows the whole dataset.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if times is not None:
+        times = np.asarray(times)
+        known = ~np.isnat(times)
+        if known.any():
+            # The slider works in microseconds, so compare the range at that precision
+            first = times[known].min().astype('datetime64[us]')
+            last = times[known].max().astype('datetime64[us]')
+            if start is not None and np.datetime64(start) <= first:
+                start = None
+            if end is not None and np.datetime64(end) >= last:
+                end = None
+        if start is not None:
+            mask &= times >= np.datetime64(start)
+        if end is not None:
+            mask &= times <= np.datetime64(end)
+    if min_risk is not None and RISK_COLUMN in df.columns:
+        mask &= df[RISK_COLUMN].to_numpy() >= min_risk
+    return np.flatnonzero(mask)
+
+
+def sort_positions(df, positions, sort_by=None, descending=False, times=None):
+    """Reorder positions by a column; missing values go last either way"""
+    if sort_by is None:
+        return positions[::-1] if descending else positions
+    if sort_by == 'Time' and times is not None:
+        # Historian timestamps are strings, so sort on the parsed times
+        values = pd.Series(np.asarray(times)[positions])
+    else:
+        values = df[sort_by].iloc[positions].reset_index(drop=True)
+    order = values.sort_values(ascending=not descending, kind='stable', na_position='last').index.to_numpy()
+    return positions[order]
+
+
+def page_count(n_rows, page_size):
+    return max(1, -(-n_rows // page_size))
+
+
+def page_rows(df, positions, page, page_size, columns=None):
+    """The rows of one page, keeping their original index"""
+    start = (page - 1) * page_size
+    rows = df.iloc[positions[start:start + page_size]]
+    return rows[columns] if columns else rows
@@ -0,0 +1,70 @@
+"""Sorted time index for slicing a dataset to a time window
+
+The Time column is parsed and sorted once per dataset. A window is then two
+binary searches, and because historian exports are already in time order the
+window is a plain positional slice of the frame, so nothing is copied and the
+work done downstream scales with the window rather than the whole history.
+"""
+import numpy as np
+import pandas as pd
+
+# Relative windows end at the dataset's last reading, not at the wall clock
+WINDOW_PRESETS = {
+    "All data": None,
+    "Last 24 hours": pd.Timedelta(hours=24),
+    "Last 7 days": pd.Timedelta(days=7),
+    "Custom range": None,
+}
+
+
+class TimeIndex:
+    """Parsed, sorted timestamps of one dataset"""
+
+    def __init__(self, times):
+        times = pd.to_datetime(pd.Series(times), format='mixed', errors='coerce').to_numpy()
+        valid = ~np.isnat(times)
+        if valid.all() and (times[1:] >= times[:-1]).all():
+            self.order = None
+            self.times = times
+        else:
+            # NumPy sorts unparseable times (NaT) last, so they are never inside a bounded window
+            self.order = np.argsort(times, kind='stable')
+            self.times = times[self.order]
+        self.n_valid = int(valid.sum())
+
+    @property
+    def first(self):
+        return pd.Timestamp(self.times[0]) if self.n_valid else None
+
+    @property
+    def last(self):
+        return pd.Timestamp(self.times[self.n_valid - 1]) if self.n_valid else None
+
+    def bounds(self, start=None, end=None):
+        """Sorted positions [lo, hi) of the readings inside [start, end]"""
+        valid = self.times[:self.n_valid]
+        lo = 0 if start is None else int(np.searchsorted(valid, np.datetime64(start), side='left'))
+        hi = self.n_valid if end is None else int(np.searchsorted(valid, np.datetime64(end), side='right'))
+        return lo, max(lo, hi)
+
+    def preset(self, name):
+        """(start, end) for a named relative window, or (None, None) for everything"""
+        length = WINDOW_PRESETS.get(name)
+        if length is None or not self.n_valid:
+            return None, None
+        return self.last - length, self.last
+
+    def window(self, df, start=None, end=None):
+        """Rows of df inside the window and their times, in time order
+
+        Without bounds every row is returned, those without a time last.
+        """
+        if start is None and end is None:
+            if self.order is None:
+                return df, self.times
+            return df.iloc[self.order], self.times
+        lo, hi = self.bounds(start, end)
+        if self.order is None:
+            # In time order already: a positional slice, no rows copied
+            return df.iloc[lo:hi], self.times[lo:hi]
+        return df.iloc[self.order[lo:hi]], self.times[lo:hi]
@@ -0,0 +1,233 @@
+"""Labeled training set builder
+
+Assembles labeled rows from many per-well files into one contiguous float32
+design matrix without holding more than one well's readings in memory:
+
+1. A first pass reads only the label column of every source and counts rows
+   per (well, risk band) stratum.
+2. Row quotas are spread evenly over the strata, so wells with short
+   histories and rare high-risk bands are not swamped by long, quiet ones.
+3. A second pass reads one well at a time, builds its features (so windows
+   never run across two wells) and writes the sampled rows straight into
+   the preallocated matrix.
+
+Labeled per-well files go in ``data/labeled/``. Without them the combined
+``data/final.csv`` is used, split back into wells using the row counts of the
+raw per-well exports it was assembled from.
+"""
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from drift import DriftProfile
+from features import FEATURE_COLUMNS, WINDOW_INPUTS, build_feature_matrix, prepared_inputs
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+LABEL_COLUMN = 'Likelihood of Hydrate'
+
+# Upper edges of the Low / Medium / High bands on the help page; above is Critical
+RISK_BAND_EDGES = (2.0, 5.0, 7.0)
+RISK_BANDS = ("Low", "Medium", "High", "Critical")
+
+READ_COLUMNS = ['Time'] + list(WINDOW_INPUTS) + [LABEL_COLUMN]
+READ_DTYPES = {col: np.float32 for col in list(WINDOW_INPUTS) + [LABEL_COLUMN]}
+
+
+def well_id(name):
+    """Well identifier from a dataset or file name, e.g. Bold_744H-10_31-11_07 -> Bold_744H"""
+    return os.path.splitext(os.path.basename(name))[0].split('-')[0]
+
+
+def _first_volume(path):
+    row = pd.read_csv(path, usecols=['Inj Gas Meter Volume Instantaneous'], nrows=1)
+    return float(row.iloc[0, 0]) if len(row) else np.nan
+
+
+def _line_count(path):
+    with open(path, 'rb') as fh:
+        return max(sum(1 for _ in fh) - 1, 0)
+
+
+def _segment_digests(path, counts):
+    """Hash of each consecutive run of `counts` data lines in a CSV"""
+    digests = []
+    with open(path, 'rb') as fh:
+        fh.readline()
+        for count in counts:
+            digest = hashlib.sha1()
+            for _ in range(count):
+                digest.update(fh.readline())
+            digests.append(digest.hexdigest())
+    return digests
+
+
+def default_training_sources(data_dir=DATA_DIR):
+    """Training sources as (well, path, first_row, n_rows) tuples"""
+    labeled = sorted(glob.glob(os.path.join(data_dir, 'labeled', '*.csv')))
+    if labeled:
+        return [(well_id(path), path, 0, None) for path in labeled]
+
+    combined = os.path.join(data_dir, 'final.csv')
+    return split_combined_file(combined, sorted(
+        path for path in glob.glob(os.path.join(data_dir, '*.csv')) if os.path.abspath(path) != os.path.abspath(combined)
+    ))
+
+
+def split_combined_file(combined_path, raw_paths):
+    """Split a labeled file built by concatenating raw exports back into one source per export
+
+    A segment with the same rows as an earlier one is an export included
+    twice under another name (data/Example.csv is a copy of Bold_744H's
+    export), and is left out so its rows are not trained on twice.
+    """
+    counts = [_line_count(path) for path in raw_paths]
+    total = _line_count(combined_path)
+    if not raw_paths or sum(counts) != total:
+        return [(well_id(combined_path), combined_path, 0, None)]
+
+    labeled = pd.read_csv(combined_path, usecols=['Inj Gas Meter Volume Instantaneous'], dtype=np.float32)
+    sources = []
+    start = 0
+    for path, count in zip(raw_paths, counts):
+        # Check each segment starts with the same reading as the export it came from
+        if count and not np.isclose(labeled.iloc[start, 0], _first_volume(path), rtol=1e-4):
+            return [(well_id(combined_path), combined_path, 0, None)]
+        sources.append((well_id(path), combined_path, start, count))
+        start += count
+
+    seen = set()
+    unique = []
+    for source, digest in zip(sources, _segment_digests(combined_path, counts)):
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(source)
+    return unique
+
+
+def _read_labels(sources):
+    """Label column of every source, reading each file once"""
+    labels = []
+    cache = {}
+    for _, path, start, count in sources:
+        if path not in cache:
+            cache = {path: pd.read_csv(path, usecols=[LABEL_COLUMN], dtype=np.float32)[LABEL_COLUMN].to_numpy()}
+        column = cache[path]
+        labels.append(column[start:] if count is None else column[start:start + count])
+    return labels
+
+
+def _iter_frames(sources):
+    """Each source's labeled readings, holding one well in memory at a time"""
+    reader, reader_path, position = None, None, 0
+    for source in sources:
+        _, path, start, count = source
+        if count is None:
+            yield source, pd.read_csv(path, usecols=READ_COLUMNS, dtype=READ_DTYPES)
+            continue
+        if path != reader_path or start < position:
+            reader = pd.read_csv(path, usecols=READ_COLUMNS, dtype=READ_DTYPES, iterator=True)
+            reader_path, position = path, 0
+        if start > position:
+            reader.get_chunk(start - position)
+        yield source, reader.get_chunk(count)
+        position = start + count
+
+
+def risk_band(labels):
+    """Index into RISK_BANDS for each label"""
+    return np.searchsorted(RISK_BAND_EDGES, labels, side='right')
+
+
+def allocate_quotas(stratum_counts, max_rows):
+    """Spread max_rows evenly over strata, passing on what small strata cannot use"""
+    quotas = {}
+    remaining = max_rows
+    pending = sorted(stratum_counts.items(), key=lambda item: item[1])
+    for position, (stratum, count) in enumerate(pending):
+        share = remaining // (len(pending) - position)
+        quotas[stratum] = min(count, share)
+        remaining -= quotas[stratum]
+    return quotas
+
+
+class TrainingSet:
+    """Design matrix, labels, well and prepared readings of every sampled row"""
+
+    def __init__(self, X, y, wells, well_names, inputs):
+        self.X = X
+        self.y = y
+        self.wells = wells
+        self.well_names = well_names
+        self.inputs = inputs
+        self.feature_columns = FEATURE_COLUMNS
+
+    @property
+    def nbytes(self):
+        return self.X.nbytes + self.y.nbytes + self.wells.nbytes + self.inputs.nbytes
+
+    def for_well(self, well):
+        """Rows of a single well"""
+        mask = self.wells == self.well_names.index(well)
+        return self.X[mask], self.y[mask]
+
+    def profile(self, well=None):
+        """Drift profile of the readings of every sampled row, or of one well's"""
+        inputs = self.inputs if well is None else self.inputs[self.wells == self.well_names.index(well)]
+        return DriftProfile.from_inputs(inputs)
+
+    def summary(self):
+        """Rows per well and risk band"""
+        bands = np.asarray(RISK_BANDS)[risk_band(self.y)]
+        wells = np.asarray(self.well_names)[self.wells]
+        return pd.crosstab(pd.Series(wells, name='Well'), pd.Series(bands, name='Risk Band'))
+
+
+def build_training_set(sources=None, max_rows=None, random_state=42, store=None):
+    """Sample labeled rows stratified by well and risk band into a float32 matrix"""
+    sources = sources if sources is not None else default_training_sources()
+    rng = np.random.default_rng(random_state)
+    well_names = sorted({well for well, _, _, _ in sources})
+
+    # Pass 1: labels only, to size every stratum
+    label_columns = _read_labels(sources)
+    band_columns = [risk_band(labels) for labels in label_columns]
+    stratum_counts = {}
+    for index, bands in enumerate(band_columns):
+        for band, count in zip(*np.unique(bands, return_counts=True)):
+            stratum_counts[(index, int(band))] = int(count)
+
+    total_rows = sum(stratum_counts.values())
+    quotas = allocate_quotas(stratum_counts, max_rows) if max_rows and max_rows < total_rows else stratum_counts
+    n_rows = sum(quotas.values())
+
+    X = np.empty((n_rows, len(FEATURE_COLUMNS)), dtype=np.float32)
+    y = np.empty(n_rows, dtype=np.float32)
+    wells = np.empty(n_rows, dtype=np.int16)
+    inputs = np.empty((n_rows, len(WINDOW_INPUTS)), dtype=np.float32)
+
+    # Pass 2: one well at a time, features first, then only the sampled rows
+    offset = 0
+    for index, (source, frame) in enumerate(_iter_frames(sources)):
+        bands = band_columns[index]
+        picked = []
+        for band in np.unique(bands):
+            rows = np.flatnonzero(bands == band)
+            quota = quotas.get((index, int(band)), 0)
+            picked.append(rows if quota >= len(rows) else rng.choice(rows, quota, replace=False))
+        picked = np.sort(np.concatenate(picked)) if picked else np.empty(0, dtype=np.int64)
+        if not len(picked):
+            continue
+
+        frame = frame.reset_index(drop=True)
+        features = store.features(frame) if store is not None else build_feature_matrix(frame)
+        end = offset + len(picked)
+        X[offset:end] = features[picked]
+        y[offset:end] = label_columns[index][picked]
+        wells[offset:end] = well_names.index(source[0])
+        inputs[offset:end] = prepared_inputs(frame).to_numpy(dtype=np.float32, na_value=np.nan)[picked]
+        offset = end
+
+    return TrainingSet(X[:offset], y[:offset], wells[:offset], well_names, inputs[:offset])
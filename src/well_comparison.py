@@ -0,0 +1,112 @@
+"""Align wells sampled on different schedules onto one timeline
+
+Historians sample wells at different rates: some every 2 minutes, others
+every 15 or so. ``align_wells`` puts any set of wells on a common regular
+grid with one as-of join per well, taking each well's latest reading at or
+before every grid point. A reading only carries forward for a couple of
+its own sampling intervals, so gaps in a well stay gaps instead of being
+bridged with stale values.
+
+Wells can be aligned on calendar time, to see what happened across the
+field at once, or on time since each well's first reading, to compare wells
+recorded in different weeks.
+"""
+import numpy as np
+import pandas as pd
+
+VOLUME_COLUMN = 'Inj Gas Meter Volume Instantaneous'
+VALVE_COLUMN = 'Inj Gas Valve Percent Open'
+RISK_COLUMN = 'Predicted_Hydrate_Likelihood'
+
+# Quantity shown -> source column
+QUANTITIES = {'Volume': VOLUME_COLUMN, 'Valve': VALVE_COLUMN, 'Risk': RISK_COLUMN}
+
+CALENDAR = 'Calendar time'
+ELAPSED = 'Time since first reading'
+ALIGN_MODES = (CALENDAR, ELAPSED)
+
+# Finer grids are coarsened to stay under this many points
+MAX_GRID_POINTS = 20_000
+
+# A reading is carried forward for at most this many of its own sampling intervals
+CARRY_INTERVALS = 2
+
+
+def sampling_interval(times):
+    """Typical spacing of a sorted time series: the median positive step"""
+    steps = np.diff(times.to_numpy())
+    steps = steps[steps > np.timedelta64(0)]
+    return pd.Timedelta(np.median(steps)) if len(steps) else pd.Timedelta(minutes=1)
+
+
+def format_interval(interval):
+    """Short label for a sampling interval, like '2 min' or '1.5 h'"""
+    minutes = interval / pd.Timedelta(minutes=1)
+    if minutes < 1:
+        return f"{interval / pd.Timedelta(seconds=1):g} s"
+    if minutes < 120:
+        return f"{minutes:g} min"
+    return f"{minutes / 60:g} h"
+
+
+def well_series(df, mode=CALENDAR):
+    """A well's readings sorted on the alignment key, with sparse columns filled forward"""
+    series = pd.DataFrame({'Time': pd.to_datetime(df['Time'], format='mixed', errors='coerce')})
+    for quantity, column in QUANTITIES.items():
+        if column in df.columns:
+            series[quantity] = df[column].to_numpy()
+    series = series.dropna(subset=['Time'])
+    if not series['Time'].is_monotonic_increasing:
+        series = series.sort_values('Time', kind='stable')
+    # The historian only records the valve position when it changes
+    if 'Valve' in series.columns:
+        series['Valve'] = series['Valve'].ffill()
+
+    series['key'] = series['Time'] - series['Time'].iloc[0] if mode == ELAPSED else series['Time']
+    return series.reset_index(drop=True)
+
+
+def common_grid(series, max_points=MAX_GRID_POINTS):
+    """Regular grid over every well's span, at the finest well's sampling interval"""
+    start = min(s['key'].iloc[0] for s in series.values())
+    end = max(s['key'].iloc[-1] for s in series.values())
+    step = min(sampling_interval(s['Time']) for s in series.values())
+    if (end - start) / step > max_points:
+        step = ((end - start) / max_points).ceil('min')
+    if isinstance(start, pd.Timedelta):
+        return pd.timedelta_range(start, end, freq=step, name='key'), step
+    return pd.date_range(start, end, freq=step, name='key'), step
+
+
+def align_wells(frames, mode=CALENDAR, max_points=MAX_GRID_POINTS):
+    """Wells on a common grid
+
+    Returns a frame indexed by the grid with one column per (quantity, well)
+    and the grid step.
+    """
+    series = {name: well_series(df, mode) for name, df in frames.items()}
+    series = {name: s for name, s in series.items() if len(s)}
+    if not series:
+        return pd.DataFrame(), None
+
+    grid, step = common_grid(series, max_points)
+    left = pd.DataFrame({'key': grid})
+    aligned = {}
+    for name, well in series.items():
+        tolerance = max(CARRY_INTERVALS * sampling_interval(well['Time']), step)
+        joined = pd.merge_asof(left, well.drop(columns='Time'), on='key',
+                               direction='backward', tolerance=tolerance)
+        for quantity in QUANTITIES:
+            if quantity in joined.columns:
+                aligned[(quantity, name)] = joined[quantity].to_numpy()
+
+    result = pd.DataFrame(aligned, index=grid)
+    result.columns = pd.MultiIndex.from_tuples(result.columns, names=['quantity', 'well'])
+    return result, step
+
+
+def coverage(aligned):
+    """Share of grid points where each well has a volume reading"""
+    if aligned.empty or 'Volume' not in aligned.columns.get_level_values('quantity'):
+        return pd.Series(dtype=float)
+    return aligned['Volume'].notna().mean()
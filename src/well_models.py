@@ -0,0 +1,140 @@
+"""Per-well models trained on demand and kept in a memory-capped LRU cache
+
+Wells run at very different operating points, so a forest fitted on one
+well's own labeled history can beat the global model on that well.
+``WellModelCache.get`` trains a well's model the first time it is asked for
+and keeps the most recently used ones resident up to a memory budget,
+evicting the least recently used first. Callers fall back to the global
+model whenever ``get`` returns None: the well has too little labeled
+history, or its model did not clear the metric gate.
+
+Models and the reasons wells have none hold for one global model version.
+When a different version is asked for, as after a retrain, the cache starts
+over and every well is tried again.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from hydrate_model import ModelVersion, fit_hydrate_model, passes_gate
+from memory_accounting import register_shared
+
+# Wells with fewer labeled rows than this use the global model
+MIN_WELL_ROWS = 500
+WELL_TREES = 50
+
+# Approximate size of one tree node: the node record plus its value
+NODE_BYTES = 64
+DEFAULT_MEMORY_MB = 256
+
+
+def model_nbytes(model):
+    """Approximate resident size of a fitted forest"""
+    return sum(tree.tree_.node_count for tree in model.estimators_) * NODE_BYTES
+
+
+class WellModelCache:
+    """Lazily trained per-well models, least recently used evicted first"""
+
+    def __init__(self, load_training, max_bytes=DEFAULT_MEMORY_MB * 1024 * 1024,
+                 min_rows=MIN_WELL_ROWS, n_estimators=WELL_TREES):
+        self.load_training = load_training
+        self.max_bytes = max_bytes
+        self.min_rows = min_rows
+        self.n_estimators = n_estimators
+        self._models = OrderedDict()
+        self._unavailable = {}
+        self._training = {}
+        self._lock = threading.Lock()
+        self.global_version = None
+        self.trained = 0
+        self.evicted = 0
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(nbytes for _, nbytes in self._models.values())
+
+    def resident(self):
+        """Wells whose models are in memory, most recently used last"""
+        with self._lock:
+            return list(self._models)
+
+    def unavailable(self, well):
+        """Why a well has no model of its own, or None"""
+        return self._unavailable.get(well)
+
+    def get(self, well, global_version=None):
+        """The well's model, training it on first use; None means use the global model"""
+        with self._lock:
+            if global_version != self.global_version:
+                self._models.clear()
+                self._unavailable.clear()
+                self.global_version = global_version
+            if well in self._models:
+                self._models.move_to_end(well)
+                return self._models[well][0]
+            if well in self._unavailable:
+                return None
+            # One training per well at a time; other callers wait for it
+            training_lock = self._training.setdefault(well, threading.Lock())
+
+        with training_lock:
+            with self._lock:
+                if well in self._models:
+                    self._models.move_to_end(well)
+                    return self._models[well][0]
+                if well in self._unavailable:
+                    return None
+            version = self._train(well)
+
+        with self._lock:
+            self._training.pop(well, None)
+            if version is None:
+                return None
+            if global_version != self.global_version:
+                # Trained for a version replaced meanwhile; used this once, not kept
+                return version
+            self._models[well] = (version, model_nbytes(version.model))
+            self._evict()
+        return version
+
+    def _train(self, well):
+        training = self.load_training()
+        if training is None:
+            # Loading failed; not remembered, so the next call tries again
+            return None
+        if well not in training.well_names:
+            self._unavailable[well] = "no labeled history"
+            return None
+
+        X, y = training.for_well(well)
+        if len(y) < self.min_rows:
+            self._unavailable[well] = f"only {len(y)} labeled rows"
+            return None
+
+        model, scaler, metrics = fit_hydrate_model(X, y, n_estimators=self.n_estimators)
+        passed, reason = passes_gate(metrics)
+        if not passed:
+            self._unavailable[well] = reason
+            return None
+        self.trained += 1
+        return ModelVersion(model, scaler, training.feature_columns, metrics, source=f"well:{well}",
+                            profile=training.profile(well))
+
+    def _evict(self):
+        # Always keep the model just added, even if it alone is over budget
+        total = sum(nbytes for _, nbytes in self._models.values())
+        while total > self.max_bytes and len(self._models) > 1:
+            _, (_, nbytes) = self._models.popitem(last=False)
+            total -= nbytes
+            self.evicted += 1
+
+
+@st.cache_resource
+def get_well_model_cache(_load_training):
+    """Process-wide per-well model cache"""
+    memory_mb = float(os.environ.get("HYDRATE_WELL_MODEL_MEMORY_MB", DEFAULT_MEMORY_MB))
+    return register_shared("per-well models", WellModelCache(_load_training, max_bytes=int(memory_mb * 1024 * 1024)))
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from table_view import filter_positions  # noqa: E402
+from time_index import TimeIndex  # noqa: E402
+
+
+def frame_with_blank_time():
+    return pd.DataFrame({
+        'Time': ['10/31/2024 1:00:00 AM', None, '10/31/2024 2:00:00 AM', '10/31/2024 1:30:00 PM'],
+        'Predicted_Hydrate_Likelihood': [1.0, 2.0, 3.0, 4.0],
+    })
+
+
+def test_unbounded_window_keeps_rows_without_a_time():
+    df = frame_with_blank_time()
+    index = TimeIndex(df['Time'])
+    rows, times = index.window(df, *index.preset("All data"))
+    assert len(rows) == 4
+    assert sorted(rows.index) == [0, 1, 2, 3]
+    # Rows without a time come last
+    assert rows.index[-1] == 1
+
+
+def test_bounded_window_leaves_out_rows_without_a_time():
+    df = frame_with_blank_time()
+    index = TimeIndex(df['Time'])
+    rows, _ = index.window(df, index.first, index.last)
+    assert sorted(rows.index) == [0, 2, 3]
+
+
+def test_full_range_table_filter_keeps_rows_without_a_time():
+    df = frame_with_blank_time()
+    index = TimeIndex(df['Time'])
+    rows, times = index.window(df)
+    start, end = index.first.to_pydatetime(), index.last.to_pydatetime()
+    assert len(filter_positions(rows, times, start, end)) == 4
+    assert len(filter_positions(rows, times, start, index.first.to_pydatetime())) == 1